@@ -5,11 +5,14 @@ from pyteal import (
     ABIReturnSubroutine,
     Assert,
     Expr,
+    ExtractUint64,
     Global,
     If,
     Int,
     Not,
+    ScratchVar,
     Seq,
+    TealType,
     WideRatio,
     abi,
 )
@@ -19,7 +22,6 @@ from contracts_unified.core.state_handler.local_handler import LocalStateHandler
 from contracts_unified.library.c3types import (
     AccountAddress,
     Amount,
-    AssetId,
     InstrumentId,
     InstrumentListElement,
     InterestRate,
@@ -69,6 +71,33 @@ def calculate_accrued_lend(
     return WideRatio([user_principal.get(), pool_lend_index.get()], [user_index.get()])
 
 
+@ABIReturnSubroutine
+def capitalize_principal(
+    user_principal: SignedAmount,
+    user_index: InterestRate,
+    pool_borrow_index: InterestRate,
+    pool_lend_index: InterestRate,
+    *,
+    output: SignedAmount,
+) -> Expr:
+    """Capitalize the user's accrued interest into the user's principal at the given pool indexes"""
+    return output.set(
+        If(user_index.get() == Int(0))
+        .Then(
+            Int(0)
+        )
+        .ElseIf(signed_ltz(user_principal.get()))
+        .Then(
+            # The user has a borrow position
+            calculate_accrued_borrow(user_principal, user_index, pool_borrow_index)
+        )
+        .Else(
+            # The user has a lend position
+            calculate_accrued_lend(user_principal, user_index, pool_lend_index)
+        )
+    )
+
+
 @ABIReturnSubroutine
 def perform_pool_move(
     account: AccountAddress,
@@ -109,13 +138,7 @@ def perform_pool_move(
     new_pool_lend_index = InterestRate()
     old_pool_lend_index = InterestRate()
 
-    # Instrument attributes that are not affected by this operation
-    asset_id = AssetId()
-    initial_haircut = Ratio()
-    initial_margin = Ratio()
-    maintenance_haircut = Ratio()
-    maintenance_margin = Ratio()
-
+    # Instrument's interest curve
     optimal_utilization_ratio = Ratio()
     optimal_utilization_rate = InterestRate()
     min_rate = InterestRate()
@@ -146,13 +169,11 @@ def perform_pool_move(
     remainder = SignedAmount()
 
     instrument_state = InstrumentListElement()
-    new_instrument_state = InstrumentListElement()
 
     return Seq(
         # Loads current instrument state
         instrument_state.set(cast(abi.ReturnedValue, GlobalStateHandler.get_instrument(instrument_id))),
 
-        instrument_state.asset_id.store_into(asset_id),
         # Loads pool data
         instrument_state.last_update_time.store_into(old_pool_last_update_time),
         instrument_state.borrowed.store_into(old_pool_borrowed),
@@ -167,12 +188,6 @@ def perform_pool_move(
         instrument_state.opt_rate.store_into(opt_rate),
         instrument_state.max_rate.store_into(max_rate),
 
-        # Loads haircuts and margins
-        instrument_state.initial_haircut.store_into(initial_haircut),
-        instrument_state.initial_margin.store_into(initial_margin),
-        instrument_state.maintenance_haircut.store_into(maintenance_haircut),
-        instrument_state.maintenance_margin.store_into(maintenance_margin),
-
         # Calculates the new timestamp
         # NOTE: Updates to this can be controlled via the algosdk function setBlockOffsetTimestamp
         new_pool_last_update_time.set(GlobalStateHandler.get_relative_timestamp()),
@@ -186,50 +201,56 @@ def perform_pool_move(
         # AI_t = ((BI_t / BI_{t-1})-1) * B_{t-1} = ((1+R_{t_1})^dT - 1) * B_{t-1}
 
         # 1.1.1
-        # Calculates the pool's utilization
-        # U_{t-1} = B_{t-1} / L_{t-1} = B_{t-1} * 1 / L_{t-1}
-        old_utilization_rate.set(
-            If(old_pool_liquidity.get() == Int(0))
-            .Then(Int(0))
-            .Else(WideRatio([old_pool_borrowed.get(), Int(RATE_ONE)], [old_pool_liquidity.get()]))
-        ),
+        # Calculates time since previous update
+        delta_time.set(new_pool_last_update_time.get() - old_pool_last_update_time.get()),
 
-        # 1.1.2
-        # Calculates interest rate per second for the period since the last update
-        # R_{t-1} = R_min + U_{t-1} / U_opt * R_slope1 if U_{t-1} < U_opt
-        # R_{t-1} = R_opt + (U_{t-1}-U_opt) / (1 - U_opt) * R_slope2 if U_{t-1} >= U_opt
-        old_interest_rate.set(
-            If(old_utilization_rate.get() < optimal_utilization_rate.get())
-            .Then(
-                min_rate.get()
-                + WideRatio(
-                    [old_utilization_rate.get(), opt_rate.get() - min_rate.get()],
-                    [optimal_utilization_rate.get()]
+        # A pool already accrued at this timestamp, as by an earlier pool move in the same call,
+        # has no interest to accrue, so the interest rate calculation is skipped
+        If(delta_time.get() == Int(0))
+        .Then(pool_accrued_interest.set(Int(0)))
+        .Else(Seq(
+            # 1.1.2
+            # Calculates the pool's utilization
+            # U_{t-1} = B_{t-1} / L_{t-1} = B_{t-1} * 1 / L_{t-1}
+            old_utilization_rate.set(
+                If(old_pool_liquidity.get() == Int(0))
+                .Then(Int(0))
+                .Else(WideRatio([old_pool_borrowed.get(), Int(RATE_ONE)], [old_pool_liquidity.get()]))
+            ),
+
+            # 1.1.3
+            # Calculates interest rate per second for the period since the last update
+            # R_{t-1} = R_min + U_{t-1} / U_opt * R_slope1 if U_{t-1} < U_opt
+            # R_{t-1} = R_opt + (U_{t-1}-U_opt) / (1 - U_opt) * R_slope2 if U_{t-1} >= U_opt
+            old_interest_rate.set(
+                If(old_utilization_rate.get() < optimal_utilization_rate.get())
+                .Then(
+                    min_rate.get()
+                    + WideRatio(
+                        [old_utilization_rate.get(), opt_rate.get() - min_rate.get()],
+                        [optimal_utilization_rate.get()]
+                    )
                 )
-            )
-            .Else(
-                opt_rate.get()
-                + WideRatio(
-                    [old_utilization_rate.get() - optimal_utilization_rate.get(), max_rate.get() - opt_rate.get()],
-                    [Int(RATE_ONE) - optimal_utilization_rate.get()]
+                .Else(
+                    opt_rate.get()
+                    + WideRatio(
+                        [old_utilization_rate.get() - optimal_utilization_rate.get(), max_rate.get() - opt_rate.get()],
+                        [Int(RATE_ONE) - optimal_utilization_rate.get()]
+                    )
                 )
-            )
-        ),
-
-        # 1.1.3
-        # Calculates time since previous update
-        delta_time.set(new_pool_last_update_time.get() - old_pool_last_update_time.get()),
+            ),
 
-        # 1.1.4
-        # AI_t = ((BI_t / BI_{t-1})-1) * B_{t-1} = ((1+R_{t_1})^dT - 1) * B_{t-1}
-        compounding_per_second_rate.set(Int(RATE_ONE) + old_interest_rate.get()),
-        compounding_per_period_rate.set(teal_expt(compounding_per_second_rate, delta_time)),
-        pool_accrued_interest.set(
-            WideRatio(
-                [compounding_per_period_rate.get() - Int(RATE_ONE), old_pool_borrowed.get()],
-                [Int(RATE_ONE)],
-            )
-        ),
+            # 1.1.4
+            # AI_t = ((BI_t / BI_{t-1})-1) * B_{t-1} = ((1+R_{t_1})^dT - 1) * B_{t-1}
+            compounding_per_second_rate.set(Int(RATE_ONE) + old_interest_rate.get()),
+            compounding_per_period_rate.set(teal_expt(compounding_per_second_rate, delta_time)),
+            pool_accrued_interest.set(
+                WideRatio(
+                    [compounding_per_period_rate.get() - Int(RATE_ONE), old_pool_borrowed.get()],
+                    [Int(RATE_ONE)],
+                )
+            ),
+        )),
 
         # 1.2
         # Capitalize pool accrued interest into liquidity and borrowed amounts
@@ -269,19 +290,7 @@ def perform_pool_move(
 
             # Capitalize user's accrued interest into user's principal
             new_user_principal.set(
-                If(old_user_index.get() == Int(0))
-                .Then(
-                    Int(0)
-                )
-                .ElseIf(signed_ltz(old_user_principal.get()))
-                .Then(
-                    # The user has a borrow position
-                    calculate_accrued_borrow(old_user_principal, old_user_index, new_pool_borrow_index)
-                )
-                .Else(
-                    # The user has a lend position
-                    calculate_accrued_lend(old_user_principal, old_user_index, new_pool_lend_index)
-                )
+                capitalize_principal(old_user_principal, old_user_index, new_pool_borrow_index, new_pool_lend_index)
             ),
 
             ###############################################################################################################
@@ -371,24 +380,62 @@ def perform_pool_move(
             cast(Expr, LocalStateHandler.set_position(account, instrument_id, user_position)),
         ),
 
-        # Update liquidity pool
-        new_instrument_state.set(
-            asset_id,
-            initial_haircut,
-            initial_margin,
-            maintenance_haircut,
-            maintenance_margin,
-            new_pool_last_update_time,
-            new_pool_borrow_index,
-            new_pool_lend_index,
-            optimal_utilization_ratio,
-            min_rate,
-            opt_rate,
-            max_rate,
-            new_pool_borrowed,
-            new_pool_liquidity,
+        # Update liquidity pool, the risk factors and interest curve of the instrument are kept
+        GlobalStateHandler.set_instrument_pool(
+            instrument_id,
+            new_pool_last_update_time.get(),
+            new_pool_borrow_index.get(),
+            new_pool_lend_index.get(),
+            new_pool_borrowed.get(),
+            new_pool_liquidity.get(),
+        ),
+    )
+
+
+@ABIReturnSubroutine
+def capitalize_position(
+    account: AccountAddress,
+    instrument_id: InstrumentId,
+) -> Expr:
+    """
+    Capitalizes the user's accrued interest into the user's principal and updates the user's index,
+    as perform_pool_move does for a zero transfer without accruing the pool again.
+    The pool must already be accrued at the current timestamp, as by a pool move earlier in the call.
+    """
+
+    pool_indexes = ScratchVar(TealType.bytes)
+    pool_borrow_index = InterestRate()
+    pool_lend_index = InterestRate()
+
+    user_position = UserInstrumentData()
+    old_user_principal = SignedAmount()
+    new_user_principal = SignedAmount()
+    old_user_index = InterestRate()
+    new_user_index = InterestRate()
+
+    return Seq(
+        # Load pool indexes
+        pool_indexes.store(GlobalStateHandler.get_instrument_indexes(instrument_id)),
+        pool_borrow_index.set(ExtractUint64(pool_indexes.load(), Int(0))),
+        pool_lend_index.set(ExtractUint64(pool_indexes.load(), Int(8))),
+
+        # Get user data
+        user_position.set(cast(abi.ReturnedValue, LocalStateHandler.get_position(account, instrument_id))),
+        user_position.principal.store_into(old_user_principal),
+        user_position.index.store_into(old_user_index),
+
+        # Capitalize user's accrued interest into user's principal
+        new_user_principal.set(
+            capitalize_principal(old_user_principal, old_user_index, pool_borrow_index, pool_lend_index)
+        ),
+
+        # Update user's index
+        new_user_index.set(
+            If(signed_ltz(new_user_principal.get()))
+            .Then(pool_borrow_index.get())
+            .Else(pool_lend_index.get())
         ),
 
-        # Update instrument
-        cast(Expr, GlobalStateHandler.set_instrument(instrument_id, new_instrument_state)),
+        # Update user, the cash is kept
+        LocalStateHandler.set_position_pool(account, instrument_id, new_user_principal.get(), new_user_index.get()),
     )
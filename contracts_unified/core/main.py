@@ -17,6 +17,7 @@ from contracts_unified.core.methods import (
     account_move,
     add_order,
     clean_orders,
+    clean_orders_by_id,
     create,
     deposit,
     fund_mbr,
@@ -27,6 +28,7 @@ from contracts_unified.core.methods import (
     update_instrument,
     update_parameter,
     withdraw,
+    withdraw_batch,
     wormhole_deposit,
 )
 
@@ -92,6 +94,12 @@ CORE_ROUTER.add_method_handler(
     MethodConfig(no_op=CallConfig.CALL),
     "Withdraw funds from user account",
 )
+CORE_ROUTER.add_method_handler(
+    withdraw_batch,
+    "withdraw_batch",
+    MethodConfig(no_op=CallConfig.CALL),
+    "Withdraw several instruments from user account",
+)
 CORE_ROUTER.add_method_handler(
     portal_transfer,
     "portal_transfer",
@@ -116,6 +124,12 @@ CORE_ROUTER.add_method_handler(
     MethodConfig(no_op=CallConfig.CALL),
     "Clean expired orders from the order book",
 )
+CORE_ROUTER.add_method_handler(
+    clean_orders_by_id,
+    "clean_orders_by_id",
+    MethodConfig(no_op=CallConfig.CALL),
+    "Clean expired orders from the order book by order ID",
+)
 CORE_ROUTER.add_method_handler(
     fund_mbr,
     "fund_mbr",
@@ -2,7 +2,7 @@
 Flatten import of Core methods.
 """
 from .account_move import account_move
-from .clean_orders import clean_orders
+from .clean_orders import clean_orders, clean_orders_by_id
 from .create import create
 from .deposit import deposit
 from .fund_mbr import fund_mbr
@@ -12,7 +12,7 @@ from .portal_transfer import portal_transfer
 from .settle import add_order, settle
 from .update_instrument import update_instrument
 from .update_parameter import update_parameter
-from .withdraw import submit_withdraw_onchain, withdraw
+from .withdraw import submit_withdraw_onchain, withdraw, withdraw_batch
 from .wormhole_deposit import wormhole_deposit
 
 __all__ = [
@@ -20,12 +20,14 @@ __all__ = [
     "update_parameter",
     "create",
     "clean_orders",
+    "clean_orders_by_id",
     "fund_mbr",
     "deposit",
     "add_order",
     "settle",
     "pool_move",
     "withdraw",
+    "withdraw_batch",
     "submit_withdraw_onchain",
     "portal_transfer",
     "account_move",
@@ -44,3 +44,30 @@ def clean_orders(
             ),
         ),
     )
+
+
+@ABIReturnSubroutine
+def clean_orders_by_id(
+    order_ids: abi.DynamicArray[OrderId],
+) -> Expr:
+    """
+    Clean any expired orders from the order book, using the expiration stored with each order
+
+    Arguments:
+
+    order_ids: The IDs of the orders to analyze.
+    """
+
+    i = abi.Uint64()
+    length = abi.Uint64()
+    order_id = abi.make(OrderId)
+
+    return Seq(
+        # Loop through all orders
+        length.set(order_ids.length()),
+        For(i.set(Int(0)), i.get() < length.get(), i.set(i.get() + Int(1))).Do(
+            # Delete order if expired
+            order_id.set(order_ids[i.get()]),
+            cast(Expr, OrderStateHandler.delete_expired_order(order_id)),
+        ),
+    )
@@ -2,7 +2,18 @@
 
 from typing import cast
 
-from pyteal import ABIReturnSubroutine, Assert, Expr, For, If, Int, Not, Seq, abi
+from pyteal import (
+    ABIReturnSubroutine,
+    Assert,
+    Expr,
+    For,
+    GetByte,
+    If,
+    Int,
+    Not,
+    Seq,
+    abi,
+)
 
 from contracts_unified.core.internal.health_check import health_check
 from contracts_unified.core.internal.liquidation_calculator import (
@@ -11,7 +22,10 @@ from contracts_unified.core.internal.liquidation_calculator import (
     scale_basket,
 )
 from contracts_unified.core.internal.move import signed_account_move_baskets
-from contracts_unified.core.internal.perform_pool_move import perform_pool_move
+from contracts_unified.core.internal.perform_pool_move import (
+    capitalize_position,
+    perform_pool_move,
+)
 from contracts_unified.core.internal.setup import setup
 from contracts_unified.core.internal.validate_sender import sender_is_sig_validator
 from contracts_unified.core.state_handler.global_handler import GlobalStateHandler
@@ -28,8 +42,10 @@ from contracts_unified.library.c3types import (
     UserInstrumentData,
 )
 from contracts_unified.library.c3types_user import (
+    BatchLiquidationData,
     DelegationChain,
     LiquidationData,
+    LiquidationEntry,
     OperationId,
     OperationMetaData,
 )
@@ -53,11 +69,8 @@ def perform_netting(
 
     repay_amount = Amount()
 
-    abi_zero_int = abi.Uint64()
-
     return Seq(
-        abi_zero_int.set(Int(0)),
-        # For each instrument, do netting and update the instrument index
+        # For each instrument with an open pool position, do netting and update the instrument index
         count.set(LocalStateHandler.get_user_instrument_count(liquidatee)),
         For(i.set(Int(0)), i.get() < count.get(), i.set(i.get() + Int(1))).Do(
             # Load data
@@ -77,40 +90,39 @@ def perform_netting(
                     repay_amount.set(Int(0))
                 ),
 
-                # Perform pool move
+                # Perform pool move, this accrues the pool
                 cast(Expr, perform_pool_move(liquidatee, i, repay_amount)),
-                cast(Expr, perform_pool_move(liquidator, i, abi_zero_int)),
+
+                # The pool is now up to date, the liquidator position is only capitalized at its indexes
+                cast(Expr, capitalize_position(liquidator, i)),
             )
         ),
     )
 
 
 @ABIReturnSubroutine
-def liquidate(
+def perform_liquidation(
+    liquidatee_account: AccountAddress,
     liquidator_account: AccountAddress,
-    user_op: OperationMetaData,
-    _delegation_chain: DelegationChain,
-    _server_data: abi.DynamicBytes,
-    opup_budget: Amount,
+    cash_basket: SignedInstrumentBasket,
+    pool_basket: SignedInstrumentBasket,
 ) -> Expr:
-    """Performs liquidation of a user's position"""
+    """
+    Validates and performs the liquidation of a single liquidatee by the liquidator
+
+    NOTE: The liquidator health is not checked here, callers must validate it once all liquidations are done
+    """
 
     # Constants
     abi_false = abi.Bool()
     abi_true = abi.Bool()
     abi_zero = Ratio()
 
-    # Liquidation data
-    data = LiquidationData()
-
-    liquidatee_account = AccountAddress()
     liquidatee_maint_health = ExcessMargin()
 
     cash = abi.make(SignedInstrumentBasket)
     pool = abi.make(SignedInstrumentBasket)
 
-    liquidator_health = ExcessMargin()
-
     factors = LiquidationFactors()
     cash_factor = Ratio()
     pool_factor = Ratio()
@@ -123,26 +135,14 @@ def liquidate(
     alpha_denominator = ExcessMargin()
 
     return Seq(
-        setup(opup_budget.get()),
-
         # Set constants
         abi_false.set(Int(0)),
         abi_true.set(Int(1)),
         abi_zero.set(Int(0)),
 
-        # Validate sender is a user proxy
-        cast(Expr, sender_is_sig_validator()),
-
-        # Extract liquidation data
-        user_op.operation.use(lambda op_data:
-            Seq(
-                data.decode(op_data.get()),
-                data.operation.use(lambda op: Assert(op.get() == OperationId.Liquidate)),
-                data.liquidatee.store_into(liquidatee_account),
-                data.cash.store_into(cash),
-                data.pool.store_into(pool),
-            )
-        ),
+        # Load baskets
+        cash.set(cash_basket),
+        pool.set(pool_basket),
 
         # Validate liquidatee is not liquidator
         Assert(liquidatee_account.get() != liquidator_account.get()),
@@ -194,8 +194,76 @@ def liquidate(
 
         # Perform liquidation swaps, all relevant glboal indexes are updated after netting
         cast(Expr, signed_account_move_baskets(liquidatee_account, liquidator_account, cash, pool, abi_false, abi_true)),
+    )
+
+
+@ABIReturnSubroutine
+def liquidate(
+    liquidator_account: AccountAddress,
+    user_op: OperationMetaData,
+    _delegation_chain: DelegationChain,
+    _server_data: abi.DynamicBytes,
+    opup_budget: Amount,
+) -> Expr:
+    """Performs liquidation of a user's position
+
+    The operation is either a single liquidation or a batch liquidation of several users by the same
+    liquidator, checks and scaling are done per liquidatee and the liquidator health is checked once.
+    """
+
+    # Constants
+    abi_false = abi.Bool()
+
+    # Liquidation data
+    data = LiquidationData()
+    batch_data = BatchLiquidationData()
+    entries = abi.make(abi.DynamicArray[LiquidationEntry])
+    entry = LiquidationEntry()
+
+    liquidatee_account = AccountAddress()
+
+    cash = abi.make(SignedInstrumentBasket)
+    pool = abi.make(SignedInstrumentBasket)
+
+    i = abi.Uint64()
+
+    liquidator_health = ExcessMargin()
+
+    return Seq(
+        setup(opup_budget.get()),
+
+        # Set constants
+        abi_false.set(Int(0)),
+
+        # Validate sender is a user proxy
+        cast(Expr, sender_is_sig_validator()),
+
+        # Extract liquidation data and perform the liquidations
+        user_op.operation.use(lambda op_data:
+            If(GetByte(op_data.get(), Int(0)) == OperationId.Liquidate)
+            .Then(
+                data.decode(op_data.get()),
+                data.liquidatee.store_into(liquidatee_account),
+                data.cash.store_into(cash),
+                data.pool.store_into(pool),
+                cast(Expr, perform_liquidation(liquidatee_account, liquidator_account, cash, pool)),
+            )
+            .Else(
+                batch_data.decode(op_data.get()),
+                batch_data.operation.use(lambda op: Assert(op.get() == OperationId.BatchLiquidate)),
+                batch_data.entries.store_into(entries),
+                Assert(entries.length() > Int(0)),
+                For(i.set(Int(0)), i.get() < entries.length(), i.set(i.get() + Int(1))).Do(
+                    entry.set(entries[i.get()]),
+                    entry.liquidatee.store_into(liquidatee_account),
+                    entry.cash.store_into(cash),
+                    entry.pool.store_into(pool),
+                    cast(Expr, perform_liquidation(liquidatee_account, liquidator_account, cash, pool)),
+                ),
+            )
+        ),
 
-        # Verify liquidator is still healthy
+        # Verify liquidator is still healthy once all liquidations are done
         # NOTE: Liquidator must always be in the green after liquidation
         # NOTE: Liquidatee will always be healthier by design
         liquidator_health.set(health_check(liquidator_account, abi_false)),
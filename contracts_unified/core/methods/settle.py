@@ -11,22 +11,22 @@ from pyteal import (
     BytesMul,
     Expr,
     Global,
+    Gtxn,
     If,
+    ImportScratchValue,
     Int,
     Itob,
     MethodSignature,
     Not,
     OnComplete,
     Or,
+    ScratchVar,
     Seq,
+    TealType,
     abi,
 )
 
-from contracts_unified.core.c3call import (
-    ARG_INDEX_ACCOUNT,
-    ARG_INDEX_OP,
-    ARG_INDEX_SELECTOR,
-)
+from contracts_unified.core.c3call import ARG_INDEX_SELECTOR
 from contracts_unified.core.internal.health_check import health_check
 from contracts_unified.core.internal.move import collect_fees, signed_add_to_cash
 from contracts_unified.core.internal.perform_pool_move import perform_pool_move
@@ -56,6 +56,12 @@ ADD_ORDER_SIG = MethodSignature("add_order(address,((address,byte[32],uint64),by
 ADD_ORDER_ARG_COUNT = Int(5)
 MAX_FEES_DIVISOR = Int(40)
 
+# Scratch slots where add_order leaves the order and its ID, settle reads them from the add_order transaction
+ADDED_ORDER_SLOT = 250
+ADDED_ORDER_ID_SLOT = 251
+ADDED_ORDER = ScratchVar(TealType.bytes, ADDED_ORDER_SLOT)
+ADDED_ORDER_ID = ScratchVar(TealType.bytes, ADDED_ORDER_ID_SLOT)
+
 @ABIReturnSubroutine
 def add_order(
     # NOTE: Any update on this function must update ADD_ORDER_SIG and ADD_ORDER_ARG_COUNT above
@@ -77,6 +83,7 @@ def add_order(
     """
 
     order = OrderData()
+    order_id = abi.make(OrderId)
 
     return Seq(
         setup(opup_budget.get()),
@@ -92,9 +99,79 @@ def add_order(
                 order.account.use(lambda acc: Assert(acc.get() == account.get()))
             )
         ),
+        order_id.set(OrderStateHandler.get_order_id(order)),
+
+        # Leave the order for the settle call of this group
+        ADDED_ORDER.store(order.encode()),
+        ADDED_ORDER_ID.store(order_id.get()),
 
         # Add order to the order book
-        cast(Expr, OrderStateHandler.add_order(order))
+        cast(Expr, OrderStateHandler.add_order(order, order_id))
+    )
+
+
+def get_added_order(
+    txn_index: Expr,
+    order: OrderData,
+    order_id: OrderId,
+) -> Expr:
+    """
+    Validates the transaction at txn_index is an add_order call to this contract and gets the order
+    and order ID it left in its scratch space
+    """
+
+    add_order_txn = Gtxn[txn_index]
+
+    return Seq(
+        # Validate the transaction
+        Assert(add_order_txn.application_id() == Global.current_application_id()),
+        Assert(add_order_txn.on_completion() == OnComplete.NoOp),
+        Assert(add_order_txn.application_args.length() == ADD_ORDER_ARG_COUNT),
+        Assert(add_order_txn.application_args[ARG_INDEX_SELECTOR] == ADD_ORDER_SIG),
+
+        # Get the order, it was decoded and hashed by add_order
+        order.decode(ImportScratchValue(txn_index, ADDED_ORDER_SLOT)),
+        order_id.decode(ImportScratchValue(txn_index, ADDED_ORDER_ID_SLOT)),
+    )
+
+
+@ABIReturnSubroutine
+def update_order_remaining(
+    order_id: OrderId,
+    to_send: Amount,
+    to_borrow: Amount,
+    to_repay: Amount,
+) -> Expr:
+    """Validates the order is in the order book with enough remaining amounts and deducts them, closing filled orders"""
+
+    order_onchain = OnChainOrderData()
+
+    sell_remaining = Amount()
+    borrow_remaining = Amount()
+    repay_remaining = Amount()
+
+    return Seq(
+        order_onchain.set(cast(abi.ReturnedValue, OrderStateHandler.get_order_onchain(order_id))),
+
+        # Validate that we are not sending, borrowing or repaying more than allowed
+        sell_remaining.set(order_onchain.sell_remaining),
+        Assert(sell_remaining.get() >= to_send.get()),
+        borrow_remaining.set(order_onchain.borrow_remaining),
+        Assert(borrow_remaining.get() >= to_borrow.get()),
+        repay_remaining.set(order_onchain.repay_remaining),
+        Assert(repay_remaining.get() >= to_repay.get()),
+
+        # Update the order book, closing the order once there is nothing left to sell
+        If(sell_remaining.get() == to_send.get())
+        .Then(OrderStateHandler.close_order_onchain(order_id))
+        .Else(
+            OrderStateHandler.set_order_remaining(
+                order_id,
+                sell_remaining.get() - to_send.get(),
+                borrow_remaining.get() - to_borrow.get(),
+                repay_remaining.get() - to_repay.get(),
+            )
+        ),
     )
 
 
@@ -121,8 +198,6 @@ def settle(
     """
 
     abi_false = abi.Bool()
-    add_order_op = OperationMetaData()
-    add_order_data = abi.make(abi.DynamicBytes)
 
     buy_order = OrderData()
     sell_order = OrderData()
@@ -132,36 +207,12 @@ def settle(
     buy_order_id = abi.make(OrderId)
     sell_order_id = abi.make(OrderId)
 
-    buy_order_onchain = OnChainOrderData()
-    sell_order_onchain = OnChainOrderData()
-
     # Amounts for each order's buy/sell side
     buyer_sell_amount = Amount()
     buyer_buy_amount = Amount()
     seller_sell_amount = Amount()
     seller_buy_amount = Amount()
 
-    # Remaining amounts for each order's buy/sell side
-    buyer_sell_remaining = Amount()
-    buyer_borrow_remaining = Amount()
-    buyer_repay_remaining = Amount()
-
-    seller_sell_remaining = Amount()
-    seller_borrow_remaining = Amount()
-    seller_repay_remaining = Amount()
-
-    # New remaining amounts for each order's buy/sell side
-    buyer_new_sell_remaining = Amount()
-    buyer_new_borrow_remaining = Amount()
-    buyer_new_repay_remaining = Amount()
-
-    seller_new_sell_remaining = Amount()
-    seller_new_borrow_remaining = Amount()
-    seller_new_repay_remaining = Amount()
-
-    buyer_new_order_onchain = OnChainOrderData()
-    seller_new_order_onchain = OnChainOrderData()
-
     buyer_buy_instrument = InstrumentId()
     buyer_sell_instrument = InstrumentId()
     seller_buy_instrument = InstrumentId()
@@ -212,27 +263,12 @@ def settle(
         ),
 
         # Add the order to the order book
-        cast(Expr, OrderStateHandler.add_order(buy_order)),
-
-        # Validate the sell order
-        Assert(add_order_txn.get().application_id() == Global.current_application_id()),
-        Assert(add_order_txn.get().on_completion() == OnComplete.NoOp),
-        Assert(add_order_txn.get().application_args.length() == ADD_ORDER_ARG_COUNT),
-        Assert(add_order_txn.get().application_args[ARG_INDEX_SELECTOR] == ADD_ORDER_SIG),
-
-        # Get the sell order
-        sell_account.decode(add_order_txn.get().application_args[ARG_INDEX_ACCOUNT]),
-        add_order_op.decode(add_order_txn.get().application_args[ARG_INDEX_OP]),
-        add_order_op.operation.store_into(add_order_data),
-        sell_order.decode(add_order_data.get()),
-
-        # Get order IDs
         buy_order_id.set(OrderStateHandler.get_order_id(buy_order)),
-        sell_order_id.set(OrderStateHandler.get_order_id(sell_order)),
+        cast(Expr, OrderStateHandler.add_order(buy_order, buy_order_id)),
 
-        # Get on chain order data
-        buy_order_onchain.set(cast(abi.ReturnedValue, OrderStateHandler.get_order_onchain(buy_order_id))),
-        sell_order_onchain.set(cast(abi.ReturnedValue, OrderStateHandler.get_order_onchain(sell_order_id))),
+        # Validate and get the sell order
+        get_added_order(add_order_txn.index(), sell_order, sell_order_id),
+        sell_order.account.store_into(sell_account),
 
         # Validate the asset pair matches
         buy_order.sell_instrument.store_into(buyer_sell_instrument),
@@ -282,29 +318,13 @@ def settle(
             )
         ),
 
-        # Validate that we are not sending more than allowed
-        buyer_sell_remaining.set(buy_order_onchain.sell_remaining),
-        Assert(buyer_sell_remaining.get() >= buyer_to_send.get()),
-        seller_sell_remaining.set(sell_order_onchain.sell_remaining),
-        Assert(seller_sell_remaining.get() >= seller_to_send.get()),
-
-        # Validate that we are not borrowing more thn allowed
-        buyer_borrow_remaining.set(buy_order_onchain.borrow_remaining),
+        # Validate that we are not sending, borrowing or repaying more than allowed and update the order book
         buyer_to_borrow.set(server_args.buyer_to_borrow),
-        Assert(buyer_borrow_remaining.get() >= buyer_to_borrow.get()),
-
-        seller_borrow_remaining.set(sell_order_onchain.borrow_remaining),
         seller_to_borrow.set(server_args.seller_to_borrow),
-        Assert(seller_borrow_remaining.get() >= seller_to_borrow.get()),
-
-        # Validate that we are not repaying more than allowed
-        buyer_repay_remaining.set(buy_order_onchain.repay_remaining),
         buyer_to_repay.set(server_args.buyer_to_repay),
-        Assert(buyer_repay_remaining.get() >= buyer_to_repay.get()),
-
-        seller_repay_remaining.set(sell_order_onchain.repay_remaining),
         seller_to_repay.set(server_args.seller_to_repay),
-        Assert(seller_repay_remaining.get() >= seller_to_repay.get()),
+        cast(Expr, update_order_remaining(buy_order_id, buyer_to_send, buyer_to_borrow, buyer_to_repay)),
+        cast(Expr, update_order_remaining(sell_order_id, seller_to_send, seller_to_borrow, seller_to_repay)),
 
         # Validate that the fees are lower than the maximum possible
         buyer_fees.set(server_args.buyer_fees),
@@ -318,28 +338,12 @@ def settle(
         Assert(seller_to_borrow.get() <= seller_to_send.get()),
         Assert(seller_to_repay.get() <= buyer_to_send.get() - seller_fees.get()),
 
-        # Generate the updated order book for the buy order
-        buyer_new_sell_remaining.set(buyer_sell_remaining.get() - buyer_to_send.get()),
-        buyer_new_borrow_remaining.set(buyer_borrow_remaining.get() - buyer_to_borrow.get()),
-        buyer_new_repay_remaining.set(buyer_repay_remaining.get() - buyer_to_repay.get()),
-        buyer_new_order_onchain.set(buyer_new_sell_remaining, buyer_new_borrow_remaining, buyer_new_repay_remaining),
-
-        # Generate the updated order book for the sell order
-        seller_new_sell_remaining.set(seller_sell_remaining.get() - seller_to_send.get()),
-        seller_new_borrow_remaining.set(seller_borrow_remaining.get() - seller_to_borrow.get()),
-        seller_new_repay_remaining.set(seller_repay_remaining.get() - seller_to_repay.get()),
-        seller_new_order_onchain.set(seller_new_sell_remaining, seller_new_borrow_remaining, seller_new_repay_remaining),
-
         # Calculate the swap amounts
         buyer_buy_delta.set(seller_to_send.get()),
         seller_buy_delta.set(buyer_to_send.get() - seller_fees.get()),
         buyer_sell_delta.set(signed_neg(buyer_to_send.get() + buyer_fees.get())),
         seller_sell_delta.set(signed_neg(seller_to_send.get())),
 
-        # Update the on chain order data
-        OrderStateHandler.set_order_onchain(buy_order_id, buyer_new_order_onchain),
-        OrderStateHandler.set_order_onchain(sell_order_id, seller_new_order_onchain),
-
         # Get old health for both users if needed
         buyer_negative_margin.set(server_args.buyer_negative_margin),
         seller_negative_margin.set(server_args.seller_negative_margin),
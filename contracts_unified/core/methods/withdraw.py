@@ -6,13 +6,17 @@ from typing import cast
 from pyteal import (
     ABIReturnSubroutine,
     Assert,
+    Bytes,
+    Concat,
     Expr,
+    For,
     Global,
     If,
     InnerTxnBuilder,
     Int,
     Not,
     Seq,
+    Suffix,
     TxnField,
     TxnType,
     abi,
@@ -35,16 +39,24 @@ from contracts_unified.library.c3types import (
     UserInstrumentData,
     WormholeAddress,
 )
-from contracts_unified.library.c3types_server import WithdrawExtraData
+from contracts_unified.library.c3types_server import (
+    WithdrawExtraData,
+    WithdrawExtraDataList,
+)
 from contracts_unified.library.c3types_user import (
+    BatchWithdrawData,
     DelegationChain,
     OperationId,
     OperationMetaData,
     WithdrawData,
+    WithdrawEntry,
 )
 from contracts_unified.library.constants import ALGORAND_CHAIN_ID
 from contracts_unified.library.signed_math import signed_ltz, signed_neg
 
+# ABI length prefix of a list with a single item
+SINGLE_ITEM_LENGTH = Bytes("base16", "0x0001")
+
 
 @ABIReturnSubroutine
 def submit_withdraw_onchain(
@@ -91,66 +103,105 @@ def submit_withdraw_onchain(
     )
 
 
-@ABIReturnSubroutine
-def submit_withdraw_offchain(
-    withdraw_buffer: abi.Address,
+# NOTE: Not a subroutine for performance reasons
+def debit_withdraw(
+    account: AccountAddress,
     instrument_id: InstrumentId,
-    amount: abi.Uint64,
+    amount: Amount,
+    max_borrow: Amount,
+    max_fees: Amount,
+    server_params: WithdrawExtraData,
 ) -> Expr:
-    """Submits a withdraw via wormhole"""
-    asset_id = AssetId()
-    element = InstrumentListElement()
+    """Borrows what is missing and removes a withdrawal and its fees from the user, the health is not checked"""
+
+    amount_to_deduct = SignedAmount()
+    amount_to_borrow = SignedAmount()
+
+    # User balance, to calculate the cash/pool split of the withdrawal
+    position = UserInstrumentData()
+    balance = Amount()
+
+    # Fees to be collected
+    withdraw_fee = Amount()
+
     return Seq(
-        # Send funds to the Wormhole withdraw buffer.
-        # The 'completeTransfer' Wormhole app call will do the final transfer
-        # from the buffer to the token bridge.
-        element.set(cast(abi.ReturnedValue, GlobalStateHandler.get_instrument(instrument_id))),
-        asset_id.set(element.asset_id),
-        If(asset_id.get() == Int(0))
+        # Calculate cash and pool withdrawal amounts
+        position.set(cast(abi.ReturnedValue, LocalStateHandler.get_position(account, instrument_id))),
+        balance.set(position.cash),
+        server_params.locked_cash.use(lambda locked_cash:
+            balance.set(balance.get() - locked_cash.get()),
+        ),
+
+        # Get the fees
+        withdraw_fee.set(server_params.withdraw_fee),
+
+        # Do not exceed maximum fee limit specified in request.
+        Assert(withdraw_fee.get() <= max_fees.get()),
+
+        # Validate the user is not borrowing more than they have allowed
+        Assert(amount.get() <= max_borrow.get() + balance.get()),
+
+        # Calculate withdrawal amounts
+        If(amount.get() > balance.get())
         .Then(
-            InnerTxnBuilder.Execute(
-                {
-                    TxnField.type_enum: TxnType.Payment,
-                    TxnField.sender: Global.current_application_address(),
-                    TxnField.fee: Int(0),
-                    TxnField.amount: amount.get(),
-                    TxnField.receiver: withdraw_buffer.get(),
-                }
-            )
+            amount_to_borrow.set(signed_neg(amount.get() - balance.get())),
         )
         .Else(
-            InnerTxnBuilder.Execute(
-                {
-                    TxnField.type_enum: TxnType.AssetTransfer,
-                    TxnField.sender: Global.current_application_address(),
-                    TxnField.fee: Int(0),
-                    TxnField.xfer_asset: asset_id.get(),
-                    TxnField.asset_amount: amount.get(),
-                    TxnField.asset_receiver: withdraw_buffer.get(),
-                }
-            )
+            amount_to_borrow.set(Int(0)),
         ),
+        # This is the delta value to apply to the user cash
+        amount_to_deduct.set(signed_neg(amount.get())),
+
+        # Borrow if needed
+        If(amount_to_borrow.get() != Int(0))
+        .Then(cast(Expr, perform_pool_move(account, instrument_id, amount_to_borrow))),
+
+        # Remove assets
+        cast(Expr, signed_add_to_cash(account, instrument_id, amount_to_deduct)),
+
+        # Pay fees
+        cast(Expr, collect_fees(instrument_id, withdraw_fee)),
     )
 
-@ABIReturnSubroutine
-def withdraw(
-    account: AccountAddress,
-    user_op: OperationMetaData,
-    delegation_chain: DelegationChain,
+
+# NOTE: Not a subroutine for performance reasons
+def pay_withdraw(
+    instrument_id: InstrumentId,
+    amount: Amount,
+    receiver: WormholeAddress,
     server_params: WithdrawExtraData,
-    opup_budget: Amount,
+    wormhole_withdraw_buffer: abi.Address,
 ) -> Expr:
-    """Withdraws funds from a user and sends them to a given Wormhole or Algorand address, depending on target chain
+    """Sends a withdrawal net of its fees to its receiver, on Algorand or through Wormhole"""
 
-    Args:
+    amount_to_withdraw = SignedAmount()
+    target = AccountAddress()
 
-        account (AccountAddress): The user account address.
-        user_op (OperationMetaData): The user operation metadata. This contains signed withdraw data: instrument, amount, receiver, and maximum amount to borrow.
-        delegation_chain (DelegationChain): The delegation chain. For withdraw operations this must be empty.
-        server_params (abi.Uint64): The server parameters. For withdraw, this parameter just contains server' own balance.
-        opup_budget (Amount): Additional computation budget for the operation.
+    return Seq(
+        # This is the amount the user will actually get, implicitly fails if fees are bigger than the amount
+        server_params.withdraw_fee.use(lambda withdraw_fee:
+            amount_to_withdraw.set(amount.get() - withdraw_fee.get()),
+        ),
 
-    """
+        # If we are withdrawing to offchain, the funds go to the Wormhole withdraw buffer.
+        # The 'completeTransfer' Wormhole app call will do the final transfer
+        # from the buffer to the token bridge.
+        receiver.chain_id.use(lambda chain_id:
+            If(chain_id.get() == Int(ALGORAND_CHAIN_ID))
+            .Then(receiver.address.store_into(target))
+            .Else(target.set(wormhole_withdraw_buffer))
+        ),
+        cast(Expr, submit_withdraw_onchain(target, instrument_id, amount_to_withdraw)),
+    )
+
+
+@ABIReturnSubroutine
+def perform_withdrawals(
+    account: AccountAddress,
+    entries: abi.DynamicArray[WithdrawEntry],
+    server_params: WithdrawExtraDataList,
+) -> Expr:
+    """Withdraws a list of signed withdrawals of a user, every withdrawal is debited first, then the user health is checked once and the payments are sent"""
 
     # Holds the withdraw buffer address
     wormhole_withdraw_buffer = abi.Address()
@@ -158,35 +209,98 @@ def withdraw(
     # Constants
     abi_false = abi.Bool()
 
-    # Holds extracted withdraw data from the user_op
-    withdraw_data = WithdrawData()
+    entry = WithdrawEntry()
+    params = WithdrawExtraData()
 
-    # Holds extracted withdraw data from the user_op
     instrument_id = InstrumentId()
     amount = Amount()
     receiver = WormholeAddress()
     max_borrow = Amount()
-    amount_to_deduct = SignedAmount()
-    amount_to_withdraw = SignedAmount()
-    amount_to_borrow = SignedAmount()
     max_fees = Amount()
 
-    # User balance, to calculate the cash/pool split of the withdrawal
-    position = UserInstrumentData()
-    balance = Amount()
+    i = abi.Uint64()
+    length = abi.Uint64()
 
-    # Fees to be collected
-    withdraw_fee = Amount()
+    # Lowest instrument ID the next withdrawal may have
+    next_instrument_id = InstrumentId()
 
     # Used to validate the user's health
     user_health = abi.Uint64()
 
     return Seq(
-        setup(opup_budget.get()),
-
         # Load constants
         abi_false.set(Int(0)),
 
+        # The server sends the data of each withdrawal
+        length.set(entries.length()),
+        Assert(length.get() > Int(0)),
+        Assert(server_params.length() == length.get()),
+
+        # Borrow, remove assets and pay fees for every withdrawal
+        # NOTE: Instruments must be strictly increasing, as the locked cash of a withdrawal
+        #       is subtracted from the balance once per withdrawal of its instrument
+        next_instrument_id.set(Int(0)),
+        For(i.set(Int(0)), i.get() < length.get(), i.set(i.get() + Int(1))).Do(
+            entry.set(entries[i.get()]),
+            params.set(server_params[i.get()]),
+            entry.instrument.store_into(instrument_id),
+            Assert(instrument_id.get() >= next_instrument_id.get()),
+            next_instrument_id.set(instrument_id.get() + Int(1)),
+            entry.amount.store_into(amount),
+            entry.max_borrow.store_into(max_borrow),
+            entry.max_fees.store_into(max_fees),
+            debit_withdraw(account, instrument_id, amount, max_borrow, max_fees, params),
+        ),
+
+        # Validate user is still healthy
+        # NOTE: Withdraw always makes the user less healthy, so we don't need to check
+        #       the user's health before the withdrawal
+        user_health.set(health_check(account, abi_false)),
+        Assert(Not(signed_ltz(user_health.get()))),
+
+        # Now that assets/liabilities are up to date, send out the payment transactions.
+        wormhole_withdraw_buffer.set(GlobalStateHandler.get_withdraw_buffer()),
+        For(i.set(Int(0)), i.get() < length.get(), i.set(i.get() + Int(1))).Do(
+            entry.set(entries[i.get()]),
+            params.set(server_params[i.get()]),
+            entry.instrument.store_into(instrument_id),
+            entry.amount.store_into(amount),
+            entry.receiver.store_into(receiver),
+            pay_withdraw(instrument_id, amount, receiver, params, wormhole_withdraw_buffer),
+        ),
+    )
+
+
+@ABIReturnSubroutine
+def withdraw(
+    account: AccountAddress,
+    user_op: OperationMetaData,
+    delegation_chain: DelegationChain,
+    server_params: WithdrawExtraData,
+    opup_budget: Amount,
+) -> Expr:
+    """Withdraws funds from a user and sends them to a given Wormhole or Algorand address, depending on target chain
+
+    Args:
+
+        account (AccountAddress): The user account address.
+        user_op (OperationMetaData): The user operation metadata. This contains signed withdraw data: instrument, amount, receiver, and maximum amount to borrow.
+        delegation_chain (DelegationChain): The delegation chain. For withdraw operations this must be empty.
+        server_params (abi.Uint64): The server parameters. For withdraw, this parameter just contains server' own balance.
+        opup_budget (Amount): Additional computation budget for the operation.
+
+    """
+
+    # Holds extracted withdraw data from the user_op
+    withdraw_data = WithdrawData()
+
+    # The withdraw as a batch of a single withdrawal
+    entries = abi.make(abi.DynamicArray[WithdrawEntry])
+    params = abi.make(WithdrawExtraDataList)
+
+    return Seq(
+        setup(opup_budget.get()),
+
         # Validate sender is a user proxy
         cast(Expr, sender_is_sig_validator()),
 
@@ -194,73 +308,65 @@ def withdraw(
         Assert(delegation_chain.length() == Int(0)),
 
         # Decode and extract withdraw operation
+        # NOTE: The withdraw data after the operation is the encoding of a WithdrawEntry
         user_op.operation.use(lambda op_data:
             Seq(
                 withdraw_data.decode(op_data.get()),
                 withdraw_data.operation.use(lambda op: Assert(op.get() == OperationId.Withdraw)),
-                withdraw_data.instrument.store_into(instrument_id),
-                withdraw_data.amount.store_into(amount),
-                withdraw_data.receiver.store_into(receiver),
-                withdraw_data.max_borrow.store_into(max_borrow),
-                withdraw_data.max_fees.store_into(max_fees),
+                entries.decode(Concat(SINGLE_ITEM_LENGTH, Suffix(op_data.get(), Int(1)))),
             )
         ),
+        params.decode(Concat(SINGLE_ITEM_LENGTH, server_params.encode())),
 
-        # Calculate cash and pool withdrawal amounts
-        position.set(cast(abi.ReturnedValue, LocalStateHandler.get_position(account, instrument_id))),
-        balance.set(position.cash),
-        server_params.locked_cash.use(lambda locked_cash:
-            balance.set(balance.get() - locked_cash.get()),
-        ),
+        # Borrow, remove assets, pay fees, check the user health and send the payment
+        cast(Expr, perform_withdrawals(account, entries, params)),
+    )
 
-        # Get the fees
-        withdraw_fee.set(server_params.withdraw_fee),
 
-        # Do not exceed maximum fee limit specified in request.
-        Assert(withdraw_fee.get() <= max_fees.get()),
+@ABIReturnSubroutine
+def withdraw_batch(
+    account: AccountAddress,
+    user_op: OperationMetaData,
+    delegation_chain: DelegationChain,
+    server_params: WithdrawExtraDataList,
+    opup_budget: Amount,
+) -> Expr:
+    """Withdraws several instruments from a user with a single health check
 
-        # Validate the user is not borrowing more than they have allowed
-        Assert(amount.get() <= max_borrow.get() + balance.get()),
+    Every withdrawal is debited first, then the user health is checked once and the payments are sent.
 
-        # Calculate withdrawal amounts
-        If(amount.get() > balance.get())
-        .Then(
-            amount_to_borrow.set(signed_neg(amount.get() - balance.get())),
-        )
-        .Else(
-            amount_to_borrow.set(Int(0)),
-        ),
-        # This is the delta value to apply to the user cash
-        amount_to_deduct.set(signed_neg(amount.get())),
-        # This is the amount the user will actually get, implicitly fails if fees are bigger than the amount
-        amount_to_withdraw.set(amount.get() - withdraw_fee.get()),
+    Args:
 
-        # Borrow if needed
-        If(amount_to_borrow.get() != Int(0))
-        .Then(cast(Expr, perform_pool_move(account, instrument_id, amount_to_borrow))),
+        account (AccountAddress): The user account address.
+        user_op (OperationMetaData): The user operation metadata. This contains the signed batch withdraw data: instrument, amount, receiver, maximum amount to borrow and maximum fees of each withdrawal.
+        delegation_chain (DelegationChain): The delegation chain. For withdraw operations this must be empty.
+        server_params (WithdrawExtraDataList): The server parameters of each withdrawal, in the same order.
+        opup_budget (Amount): Additional computation budget for the operation.
 
-        # Remove assets
-        cast(Expr, signed_add_to_cash(account, instrument_id, amount_to_deduct)),
+    """
 
-        # Pay fees
-        cast(Expr, collect_fees(instrument_id, withdraw_fee)),
+    # Holds extracted withdraw data from the user_op
+    withdraw_data = BatchWithdrawData()
+    entries = abi.make(abi.DynamicArray[WithdrawEntry])
 
-        # Validate user is still healthy
-        # NOTE: Withdraw always makes the user less healthy, so we don't need to check
-        #       the user's health before the withdrawal
-        user_health.set(health_check(account, abi_false)),
-        Assert(Not(signed_ltz(user_health.get()))),
+    return Seq(
+        setup(opup_budget.get()),
 
-        # Now that assets/liabilities are up to date, send out payment transaction.
-        # If we are withdrawing to offchain, we need to check wormhole transactions
-        wormhole_withdraw_buffer.set(GlobalStateHandler.get_withdraw_buffer()),
-        receiver.chain_id.use(lambda chain_id:
-            receiver.address.use(lambda address:
-                If(
-                    chain_id.get() == Int(ALGORAND_CHAIN_ID),
-                    cast(Expr, submit_withdraw_onchain(address, instrument_id, amount_to_withdraw)),
-                    cast(Expr, submit_withdraw_offchain(wormhole_withdraw_buffer, instrument_id, amount_to_withdraw)),
-                )
+        # Validate sender is a user proxy
+        cast(Expr, sender_is_sig_validator()),
+
+        # No delegation is allowed for withdraw
+        Assert(delegation_chain.length() == Int(0)),
+
+        # Decode and extract withdraw operation
+        user_op.operation.use(lambda op_data:
+            Seq(
+                withdraw_data.decode(op_data.get()),
+                withdraw_data.operation.use(lambda op: Assert(op.get() == OperationId.BatchWithdraw)),
+                withdraw_data.entries.store_into(entries),
             )
         ),
+
+        # Borrow, remove assets, pay fees, check the user health and send the payments
+        cast(Expr, perform_withdrawals(account, entries, server_params)),
     )
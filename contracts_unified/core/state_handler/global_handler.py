@@ -8,13 +8,16 @@ from pyteal import (
     Assert,
     Btoi,
     Bytes,
+    Concat,
     Expr,
     Global,
     Int,
+    Itob,
     Len,
     MinBalance,
     Pop,
     Seq,
+    Suffix,
     abi,
 )
 
@@ -38,10 +41,21 @@ KEY_OPERATOR_ADDRESS = Bytes("o")
 KEY_FEE_TARGET = Bytes("f")
 
 
+def _instrument_field_offset(field: str) -> int:
+    """Offset of a field in an encoded InstrumentListElement"""
+
+    spec = abi.make(InstrumentListElement).type_spec()
+    names = list(InstrumentListElement.__annotations__)
+    return sum(field_spec.byte_length_static() for field_spec in spec.value_type_specs()[:names.index(field)])
+
+
 class GlobalStateHandler:
     """Global state handler"""
 
     instrument_size = abi.make(InstrumentListElement).type_spec().byte_length_static()
+    instrument_update_time_offset = _instrument_field_offset("last_update_time")
+    instrument_borrow_index_offset = _instrument_field_offset("borrow_index")
+    instrument_borrowed_offset = _instrument_field_offset("borrowed")
     max_instrument_count = 80
 
     # NOTE: Most of these methods are not subroutines for performance reasons
@@ -220,3 +234,40 @@ class GlobalStateHandler:
         return Seq(
             App.box_replace(Bytes("i"), instrument_id.get() * Int(GlobalStateHandler.instrument_size), new_entry.encode()),
         )
+
+    @staticmethod
+    def get_instrument_indexes(instrument_id: InstrumentId) -> Expr:
+        """Get the pool borrow and lend indexes of a given instrument ID, encoded one after the other"""
+
+        return App.box_extract(
+            Bytes("i"),
+            instrument_id.get() * Int(GlobalStateHandler.instrument_size) + Int(GlobalStateHandler.instrument_borrow_index_offset),
+            Int(2 * abi.Uint64TypeSpec().byte_length_static()),
+        )
+
+    @staticmethod
+    def set_instrument_pool(
+        instrument_id: InstrumentId,
+        last_update_time: Expr,
+        borrow_index: Expr,
+        lend_index: Expr,
+        borrowed: Expr,
+        liquidity: Expr,
+    ) -> Expr:
+        """Set the pool state of a given instrument ID, keeping its risk factors and interest curve"""
+
+        offset = instrument_id.get() * Int(GlobalStateHandler.instrument_size)
+
+        return Seq(
+            App.box_replace(
+                Bytes("i"),
+                offset + Int(GlobalStateHandler.instrument_update_time_offset),
+                # The relative timestamp is a uint32, followed by the two indexes
+                Concat(Suffix(Itob(last_update_time), Int(4)), Itob(borrow_index), Itob(lend_index)),
+            ),
+            App.box_replace(
+                Bytes("i"),
+                offset + Int(GlobalStateHandler.instrument_borrowed_offset),
+                Concat(Itob(borrowed), Itob(liquidity)),
+            ),
+        )
@@ -2,11 +2,24 @@
 
 from typing import cast
 
-from pyteal import ABIReturnSubroutine, App, Expr, If, Int, Len, Pop, Seq, abi
+from pyteal import (
+    ABIReturnSubroutine,
+    App,
+    Concat,
+    Expr,
+    If,
+    Int,
+    Itob,
+    Len,
+    Pop,
+    Seq,
+    abi,
+)
 
 from contracts_unified.core.state_handler.global_handler import GlobalStateHandler
 from contracts_unified.library.c3types import (
     AccountAddress,
+    Amount,
     InstrumentId,
     UserInstrumentData,
 )
@@ -16,6 +29,8 @@ class LocalStateHandler:
     """Handles per-user state for the Core contract"""
 
     position_size = abi.make(UserInstrumentData).type_spec().byte_length_static()
+    # The principal and index follow the cash in a position
+    principal_offset = abi.make(Amount).type_spec().byte_length_static()
 
     # NOTE: Not a subroutine for performance reasons
     @staticmethod
@@ -62,6 +77,16 @@ class LocalStateHandler:
         """Sets the cash and pool data for the given instrument ID"""
         return App.box_replace(account.get(), instrument_id.get() * Int(LocalStateHandler.position_size), data.encode())
 
+    # NOTE: Not a subroutine for performance reasons
+    @staticmethod
+    def set_position_pool(account: AccountAddress, instrument_id: InstrumentId, principal: Expr, index: Expr) -> Expr:
+        """Sets the pool principal and index for the given instrument ID, keeping its cash"""
+        return App.box_replace(
+            account.get(),
+            instrument_id.get() * Int(LocalStateHandler.position_size) + Int(LocalStateHandler.principal_offset),
+            Concat(Itob(principal), Itob(index)),
+        )
+
     @staticmethod
     @ABIReturnSubroutine
     def get_user_instrument_count(account: AccountAddress, *, output: abi.Uint64) -> Expr:
@@ -4,24 +4,43 @@ from typing import cast
 
 from pyteal import (
     ABIReturnSubroutine,
+    And,
     App,
     Assert,
+    Btoi,
     Bytes,
     Concat,
     Expr,
+    Global,
     If,
+    Int,
+    Itob,
+    Len,
     Pop,
     Return,
+    ScratchVar,
     Seq,
     Sha512_256,
+    TealType,
     abi,
 )
 
 from contracts_unified.core.state_handler.global_handler import GlobalStateHandler
-from contracts_unified.library.c3types import OnChainOrderData, OrderId
+from contracts_unified.library.c3types import (
+    Amount,
+    OnChainOrderData,
+    OrderId,
+    Timestamp,
+)
 from contracts_unified.library.c3types_user import OrderData
 
 ORDER_PREFIX = Bytes("order")
+# Size of the expiration at the start of every order box
+ORDER_EXPIRATION_SIZE = Int(8)
+# Size of the order boxes of open orders
+ORDER_DATA_SIZE = Int(abi.make(OnChainOrderData).type_spec().byte_length_static())
+# Size of the order boxes written before the expiration was stored, add_order prepends the expiration
+LEGACY_ORDER_SIZE = Int(24)
 
 
 class OrderStateHandler:
@@ -41,28 +60,36 @@ class OrderStateHandler:
     @ABIReturnSubroutine
     def add_order(
         order: OrderData,
+        order_id: OrderId,
     ) -> Expr:
-        """Adds an order to the order book"""
+        """Adds an order to the order book, order_id must be the ID of the order"""
 
-        order_id = abi.make(OrderId)
         on_chain_data = OnChainOrderData()
+        expiration_time = Timestamp()
+        sell_amount = Amount()
+        borrow_amount = Amount()
+        repay_amount = Amount()
 
         return Seq(
-            # Create order ID
-            order_id.set(OrderStateHandler.get_order_id(order)),
+            order.expiration_time.store_into(expiration_time),
 
-            # Check order does not exist
+            # Check order does not exist, a box of the previous layout gets the expiration of the order
             (length := App.box_length(order_id.get())),
-            If(length.hasValue(), Return()),
+            If(length.hasValue()).Then(
+                If(length.value() == LEGACY_ORDER_SIZE).Then(
+                    (legacy := App.box_get(order_id.get())),
+                    Pop(App.box_delete(order_id.get())),
+                    App.box_put(order_id.get(), Concat(expiration_time.encode(), legacy.value())),
+                    cast(Expr, GlobalStateHandler.ensure_mbr_fund()),
+                ),
+                Return(),
+            ),
 
             # Create on-chain data
-            order.sell_amount.use(lambda sell_amount:
-                order.max_borrow_amount.use(lambda borrow_amount:
-                    order.max_repay_amount.use(lambda repay_amount:
-                        on_chain_data.set(sell_amount, borrow_amount, repay_amount)
-                    )
-                )
-            ),
+            order.sell_amount.store_into(sell_amount),
+            order.max_borrow_amount.store_into(borrow_amount),
+            order.max_repay_amount.store_into(repay_amount),
+            on_chain_data.set(expiration_time, sell_amount, borrow_amount, repay_amount),
 
             # Update box
             App.box_put(order_id.get(), on_chain_data.encode()),
@@ -82,6 +109,8 @@ class OrderStateHandler:
         return Seq(
             (result := App.box_get(order_id.get())),
             Assert(result.hasValue()),
+            # Fully filled orders only keep their expiration, add_order moves the boxes of the previous layout
+            Assert(Len(result.value()) == ORDER_DATA_SIZE),
             output.decode(result.value()),
         )
 
@@ -95,6 +124,57 @@ class OrderStateHandler:
         """Sets an order in the order book"""
         return App.box_put(order_id.get(), data.encode())
 
+    @staticmethod
+    # NOTE: Not a subroutine for performance reasons
+    def set_order_remaining(
+        order_id: OrderId,
+        sell_remaining: Expr,
+        borrow_remaining: Expr,
+        repay_remaining: Expr,
+    ) -> Expr:
+        """Sets the remaining amounts of an order in the order book, keeping its terms"""
+        return App.box_replace(
+            order_id.get(),
+            ORDER_EXPIRATION_SIZE,
+            Concat(Itob(sell_remaining), Itob(borrow_remaining), Itob(repay_remaining)),
+        )
+
+    @staticmethod
+    # NOTE: Not a subroutine for performance reasons
+    def close_order_onchain(
+        order_id: OrderId,
+    ) -> Expr:
+        """
+        Replaces a fully filled order with a box holding only its expiration, this frees most of its MBR
+        while add_order still sees the order exists, so it can not be added again before it expires
+        """
+
+        expiration = ScratchVar(TealType.bytes)
+
+        return Seq(
+            expiration.store(App.box_extract(order_id.get(), Int(0), ORDER_EXPIRATION_SIZE)),
+            Pop(App.box_delete(order_id.get())),
+            App.box_put(order_id.get(), expiration.load()),
+        )
+
+    @staticmethod
+    @ABIReturnSubroutine
+    def delete_expired_order(
+        order_id: OrderId,
+    ) -> Expr:
+        """
+        Deletes an order from the order book if it expired, open or fully filled, missing orders are ignored
+        and so are the boxes of the previous layout, which do not hold the expiration
+        """
+
+        return Seq(
+            (length := App.box_length(order_id.get())),
+            If(And(length.hasValue(), length.value() != LEGACY_ORDER_SIZE)).Then(
+                If(Global.latest_timestamp() > Btoi(App.box_extract(order_id.get(), Int(0), ORDER_EXPIRATION_SIZE)))
+                .Then(Pop(App.box_delete(order_id.get())))
+            ),
+        )
+
     @staticmethod
     # NOTE: Not a subroutine for performance reasons
     def delete_order_onchain(
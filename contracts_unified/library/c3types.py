@@ -109,6 +109,9 @@ class UserInstrumentData(abi.NamedTuple):
 class OnChainOrderData(abi.NamedTuple):
     """Holds on-chain order information"""
 
+    # NOTE: The expiration is first, fully filled orders keep only it
+    expiration_time: abi.Field[Timestamp]
+
     sell_remaining: abi.Field[Amount]
     borrow_remaining: abi.Field[Amount]
     repay_remaining: abi.Field[Amount]
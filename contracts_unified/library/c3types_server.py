@@ -1,6 +1,8 @@
 """Types used by the server to interact with the C3 core contract"""
 
 
+from typing import TypeAlias
+
 from pyteal import abi
 
 from .c3types import Amount, AssetId, Boolean, InstrumentId, InterestRate, Ratio
@@ -44,3 +46,7 @@ class WithdrawExtraData(abi.NamedTuple):
 
     locked_cash: abi.Field[Amount]
     withdraw_fee: abi.Field[Amount]
+
+
+# Server data for withdraw_batch, one entry per withdrawal
+WithdrawExtraDataList: TypeAlias = abi.DynamicArray[WithdrawExtraData]
@@ -27,6 +27,8 @@ class OperationId:
     Liquidate = Int(4)
     AccountMove = Int(5)
     Settle = Int(6)
+    BatchLiquidate = Int(7)
+    BatchWithdraw = Int(8)
 
 
 # --- Signing methods ---
@@ -88,6 +90,25 @@ class WithdrawData(abi.NamedTuple):
     max_fees: abi.Field[Amount]
 
 
+class WithdrawEntry(abi.NamedTuple):
+    """Holds a single withdrawal inside a batch withdraw"""
+    # (uint8,uint64,(uint16,address),uint64,uint64)
+
+    instrument: abi.Field[InstrumentId]
+    amount: abi.Field[Amount]
+    receiver: abi.Field[WormholeAddress]
+    max_borrow: abi.Field[Amount]
+    max_fees: abi.Field[Amount]
+
+
+class BatchWithdrawData(abi.NamedTuple):
+    """Ticket data for withdrawing several instruments at once, in strictly increasing instrument order"""
+    # (byte,(uint8,uint64,(uint16,address),uint64,uint64)[])
+
+    operation: abi.Field[AbiOperationId]
+    entries: abi.Field[abi.DynamicArray[WithdrawEntry]]
+
+
 # --- Operation data for pool move ---
 class PoolMoveData(abi.NamedTuple):
     """Ticket data for pool move"""
@@ -123,6 +144,24 @@ class LiquidationData(abi.NamedTuple):
     pool: abi.Field[SignedInstrumentBasket]
 
 
+class LiquidationEntry(abi.NamedTuple):
+    """Holds a single liquidatee and its baskets inside a batch liquidation"""
+    # (address,(uint8,uint64)[],(uint8,uint64)[])
+
+    # NOTE: The baskets follow the same conventions as in LiquidationData
+    liquidatee: abi.Field[AccountAddress]
+    cash: abi.Field[SignedInstrumentBasket]
+    pool: abi.Field[SignedInstrumentBasket]
+
+
+class BatchLiquidationData(abi.NamedTuple):
+    """Holds on-chain information to liquidate several accounts at once"""
+    # (byte,(address,(uint8,uint64)[],(uint8,uint64)[])[])
+
+    operation: abi.Field[AbiOperationId]
+    entries: abi.Field[abi.DynamicArray[LiquidationEntry]]
+
+
 # --- Account Move Data ---
 class AccountMoveData(abi.NamedTuple):
     """Data for moving assets and liabilities between accounts"""
@@ -0,0 +1,95 @@
+"""
+Computes the assembled size of TEAL programs, to check they fit in an application.
+"""
+
+# Maximum size of an approval or clear program, with all the extra pages
+MAX_PROGRAM_SIZE = 8192
+
+# Size of the immediates of the opcodes with fixed size immediates
+_IMMEDIATE_SIZES = {
+    **dict.fromkeys(
+        [
+            "intc", "bytec", "arg", "txn", "global", "load", "store", "gtxns", "gloads", "gaid",
+            "bury", "popn", "dupn", "dig", "cover", "uncover", "replace2", "base64_decode", "json_ref",
+            "asset_holding_get", "asset_params_get", "app_params_get", "acct_params_get",
+            "frame_dig", "frame_bury", "txnas", "gtxnsas", "itxn_field", "itxn", "itxnas",
+            "vrf_verify", "block", "ecdsa_verify", "ecdsa_pk_decompress", "ecdsa_pk_recover",
+        ],
+        1,
+    ),
+    **dict.fromkeys(
+        [
+            "gtxn", "txna", "gtxnsa", "gload", "substring", "extract", "proto", "gtxnas",
+            "itxna", "gitxn", "gitxnas", "b", "bz", "bnz", "callsub",
+        ],
+        2,
+    ),
+    **dict.fromkeys(["gtxna", "gitxna"], 3),
+}
+
+
+def _varuint_size(value: int) -> int:
+    """Gets the size of an unsigned integer encoded as a varuint"""
+
+    size = 1
+    while value >= 0x80:
+        value >>= 7
+        size += 1
+    return size
+
+
+def _bytes_size(literal: str) -> int:
+    """Gets the size of the value of a byte string literal, as emitted by PyTeal"""
+
+    if literal.startswith("0x"):
+        return (len(literal) - 2) // 2
+    if literal.startswith('"') and literal.endswith('"'):
+        return len(literal[1:-1].encode().decode("unicode_escape").encode("latin-1"))
+    raise ValueError(f"Unsupported byte string literal: {literal}")
+
+
+def _immediates_size(opcode: str, args: list) -> int:
+    """Gets the size of the immediates of an assembled instruction"""
+
+    if opcode in ("switch", "match"):
+        size = 1 + 2 * len(args)
+    elif opcode == "pushint":
+        size = _varuint_size(int(args[0]))
+    elif opcode == "pushbytes":
+        size = _varuint_size(_bytes_size(args[0])) + _bytes_size(args[0])
+    elif opcode in ("intcblock", "pushints"):
+        size = _varuint_size(len(args)) + sum(_varuint_size(int(arg)) for arg in args)
+    elif opcode in ("bytecblock", "pushbytess"):
+        size = _varuint_size(len(args)) + sum(_varuint_size(_bytes_size(arg)) + _bytes_size(arg) for arg in args)
+    elif opcode in _IMMEDIATE_SIZES:
+        size = _IMMEDIATE_SIZES[opcode]
+    elif args:
+        # Pseudo-opcodes like int or byte are not emitted when PyTeal assembles the constants
+        raise ValueError(f"Unsupported instruction: {opcode} {' '.join(args)}")
+    else:
+        size = 0
+    return size
+
+
+def program_size(teal: str) -> int:
+    """
+    Gets the size of a TEAL program once assembled, as compiled by PyTeal with assemble_constants
+
+    NOTE: Byte string literals must not contain spaces or "//", which PyTeal only emits in comments
+    """
+
+    size = 0
+    for line in teal.splitlines():
+        tokens = line.split("//", 1)[0].split()
+
+        # Skip empty lines and labels
+        if not tokens or tokens[0].endswith(":"):
+            continue
+
+        if tokens[0] == "#pragma":
+            # The program starts with its version
+            size += _varuint_size(int(tokens[2]))
+        else:
+            size += 1 + _immediates_size(tokens[0], tokens[1:])
+
+    return size
@@ -0,0 +1,84 @@
+"""
+Flatten import of the off-chain tooling, Python mirrors of the Core contract logic.
+"""
+from .avm import AvmError
+from .fill import OrderSide, SettleAmounts, max_fill, simulate_settle, validate_fill
+from .health import health_check, instrument_health
+from .keeper import (
+    AlgodCleanupClient,
+    CleanupClient,
+    LocalCleanupClient,
+    OrderKeeper,
+    TransactionLimits,
+    pack_calls,
+)
+from .liquidation import (
+    LiquidationResult,
+    LiquidationSnapshot,
+    optimize_liquidation,
+    optimize_liquidations,
+    simulate_liquidation,
+)
+from .matching import FundingPolicy, MatchingEngine, NoFunding, SettleCall
+from .orders import Order, OrderIdHasher, encode_orders, get_order_id, order_ids
+from .settle_data import FillRequest, FillResult, SettleDataCalculator
+from .state import (
+    Instrument,
+    LiquidationFactors,
+    OnChainOrder,
+    Position,
+    decode_instruments,
+    decode_order_box,
+    decode_positions,
+)
+from .withdraw import (
+    WithdrawCalculator,
+    WithdrawLimits,
+    max_withdrawals,
+    simulate_withdraw,
+)
+
+__all__ = [
+    "AvmError",
+    "OrderSide",
+    "SettleAmounts",
+    "max_fill",
+    "simulate_settle",
+    "validate_fill",
+    "health_check",
+    "instrument_health",
+    "AlgodCleanupClient",
+    "CleanupClient",
+    "LocalCleanupClient",
+    "OrderKeeper",
+    "TransactionLimits",
+    "pack_calls",
+    "LiquidationResult",
+    "LiquidationSnapshot",
+    "optimize_liquidation",
+    "optimize_liquidations",
+    "simulate_liquidation",
+    "FundingPolicy",
+    "MatchingEngine",
+    "NoFunding",
+    "SettleCall",
+    "Order",
+    "OrderIdHasher",
+    "encode_orders",
+    "get_order_id",
+    "order_ids",
+    "FillRequest",
+    "FillResult",
+    "SettleDataCalculator",
+    "Instrument",
+    "LiquidationFactors",
+    "OnChainOrder",
+    "Position",
+    "decode_instruments",
+    "decode_order_box",
+    "decode_positions",
+    "WithdrawCalculator",
+    "WithdrawLimits",
+    "max_withdrawals",
+    "simulate_withdraw",
+]
@@ -0,0 +1,148 @@
+"""
+Bit-exact Python mirrors of the AVM integer operations used by the Core contract.
+
+All values are handled as raw uint64 bit patterns, exactly like the contract does, signed
+values being two's complement encoded. Any condition under which the contract would fail
+(a TEAL panic or a failed Assert) raises AvmError.
+"""
+
+from typing import Iterable
+
+from contracts_unified.library.constants import RATE_ONE
+
+UINT64_MAX = 2**64 - 1
+UINT128_LIMIT = 2**128
+SIGN_BIT = 2**63
+
+
+class AvmError(Exception):
+    """Raised where the contract would reject the transaction"""
+
+
+def check(condition: bool, message: str) -> None:
+    """Mirrors an Assert in the contract"""
+    if not condition:
+        raise AvmError(message)
+
+
+def u64(value: int) -> int:
+    """Encodes a Python integer, signed or unsigned, as an uint64 bit pattern"""
+    check(-SIGN_BIT <= value <= UINT64_MAX, "value does not fit in 64 bits")
+    return value & UINT64_MAX
+
+
+def to_signed(value: int) -> int:
+    """Decodes an uint64 bit pattern as a two's complement signed integer"""
+    return value - 2**64 if value & SIGN_BIT else value
+
+
+def uint_check(value: int, bits: int = 64) -> int:
+    """Mirrors the overflow checks of +, *, and the abi.Uint set with smaller sizes"""
+    check(0 <= value < 2**bits, f"uint{bits} overflow")
+    return value
+
+
+def add(lhs: int, rhs: int) -> int:
+    """Mirrors the + opcode"""
+    return uint_check(lhs + rhs)
+
+
+def sub(lhs: int, rhs: int) -> int:
+    """Mirrors the - opcode"""
+    check(lhs >= rhs, "- would result negative")
+    return lhs - rhs
+
+
+def mul(lhs: int, rhs: int) -> int:
+    """Mirrors the * opcode"""
+    return uint_check(lhs * rhs)
+
+
+def div(lhs: int, rhs: int) -> int:
+    """Mirrors the / opcode"""
+    check(rhs != 0, "/ 0")
+    return lhs // rhs
+
+
+def _product(factors: Iterable[int], name: str) -> int:
+    """Multiplies the factors in 128 bits, every intermediate product must fit like with mulw"""
+    result = 1
+    for factor in factors:
+        result *= factor
+        check(result < UINT128_LIMIT, f"WideRatio {name} overflow")
+    return result
+
+
+def wide_ratio(numerators: Iterable[int], denominators: Iterable[int]) -> int:
+    """
+    Mirrors pyteal's WideRatio, both products are computed in 128 bits and the
+    truncated quotient must fit in 64 bits
+    """
+    numerator = _product(numerators, "numerator")
+    denominator = _product(denominators, "denominator")
+    check(denominator != 0, "WideRatio division by zero")
+    return uint_check(numerator // denominator)
+
+
+def unsigned_min(lhs: int, rhs: int) -> int:
+    """Returns the minimum of two values"""
+    return lhs if lhs < rhs else rhs
+
+
+def signed_ltz(value: int) -> bool:
+    """Signed less than zero"""
+    return bool(value & SIGN_BIT)
+
+
+def signed_neg(value: int) -> int:
+    """Signed negation"""
+    return value if value == 0 else ((~value) & UINT64_MAX) + 1
+
+
+def signed_abs(value: int) -> int:
+    """Absolute value of a signed number"""
+    return signed_neg(value) if signed_ltz(value) else value
+
+
+def signed_add(lhs: int, rhs: int) -> int:
+    """Signed addition, fails on overflow"""
+    result = (lhs + rhs) & UINT64_MAX
+    check(
+        signed_ltz(lhs) != signed_ltz(rhs) or signed_ltz(lhs) == signed_ltz(result),
+        "signed_add overflow",
+    )
+    return result
+
+
+def signed_sub(lhs: int, rhs: int) -> int:
+    """Signed subtraction"""
+    return signed_add(lhs, signed_neg(rhs))
+
+
+def signed_gte(lhs: int, rhs: int) -> bool:
+    """Signed greater than or equal to"""
+    if signed_ltz(lhs):
+        return signed_ltz(rhs) and lhs >= rhs
+    return signed_ltz(rhs) or lhs >= rhs
+
+
+def signed_min(lhs: int, rhs: int) -> int:
+    """Returns the minimum of two signed values"""
+    return rhs if signed_gte(lhs, rhs) else lhs
+
+
+def signed_max(lhs: int, rhs: int) -> int:
+    """Returns the maximum of two signed values"""
+    return lhs if signed_gte(lhs, rhs) else rhs
+
+
+def teal_expt(base: int, raised_to: int) -> int:
+    """Calculates base ** n"""
+    power = base
+    output = RATE_ONE
+    while raised_to > 0:
+        if raised_to & 1:
+            output = wide_ratio([output, power], [RATE_ONE])
+        power = wide_ratio([power, power], [RATE_ONE])
+        raised_to >>= 1
+    return output
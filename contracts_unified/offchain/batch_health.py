@@ -0,0 +1,179 @@
+"""
+Vectorized health of a whole book of accounts, bit-exact with the Core contract health_check.
+
+The book is a struct of arrays with one row per account and one column per instrument. Instruments
+are processed in the contract order, all the accounts holding a position on an instrument at once,
+using two's complement uint64 arithmetic like the contract so overflows fail the same way.
+"""
+
+from typing import NamedTuple, Sequence, Tuple
+
+import numpy as np
+
+from contracts_unified.library.constants import PRICECASTER_RESCALE_FACTOR, RATIO_ONE
+from contracts_unified.offchain.state import POSITION_SIZE, Instrument
+from contracts_unified.offchain.wide import wide_ratio
+
+_SIGN_SHIFT = np.uint64(63)
+_ONE = np.uint64(1)
+_ZERO = np.uint64(0)
+# Relative margin of the floating point bound of the health terms
+_MAGNITUDE_MARGIN = 1.01
+
+
+class BookHealth(NamedTuple):
+    """Initial and maintenance health of every account, the failed masks mark where the contract would fail"""
+
+    initial: np.ndarray
+    maintenance: np.ndarray
+    initial_failed: np.ndarray
+    maintenance_failed: np.ndarray
+
+
+def decode_book(boxes: Sequence[bytes], instrument_count: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Decodes account boxes into (cash, principal, slot) arrays of shape (accounts, instruments),
+    principals are returned as uint64 bit patterns. Boxes shorter than the instrument list are zero
+    extended and longer ones are capped, like LocalStateHandler.get_user_instrument_count does.
+    """
+
+    size = instrument_count * POSITION_SIZE
+    raw = b"".join(box[:size].ljust(size, b"\0") for box in boxes)
+    words = np.frombuffer(raw, dtype=">u8").astype(np.uint64).reshape(len(boxes), instrument_count, 3)
+    return words[:, :, 0], words[:, :, 1], words[:, :, 2]
+
+
+def _neg(value: np.ndarray) -> np.ndarray:
+    """Mirrors signed_neg"""
+    return ~value + _ONE
+
+
+def _ltz(value: np.ndarray) -> np.ndarray:
+    """Mirrors signed_ltz"""
+    return (value >> _SIGN_SHIFT).astype(bool)
+
+
+def _signed_add(lhs: np.ndarray, rhs: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Mirrors signed_add, returns the result and the mask of overflows"""
+    result = lhs + rhs
+    return result, (_ltz(lhs) == _ltz(rhs)) & (_ltz(result) != _ltz(lhs))
+
+
+def batch_health(
+    cash: np.ndarray,
+    principal: np.ndarray,
+    slot: np.ndarray,
+    instruments: Sequence[Instrument],
+    prices: Sequence[int],
+) -> BookHealth:
+    """
+    Computes the initial and maintenance health of every account.
+
+    cash, principal, slot: arrays of shape (accounts, instruments) mirroring UserInstrumentData,
+                            principals may be signed or uint64 bit patterns
+    instruments: the instruments, as decoded from the "i" box
+    prices: the normalized pricecaster price of each instrument
+    """
+
+    cash = np.asarray(cash, dtype=np.uint64)
+    principal = np.asarray(principal).astype(np.int64, copy=False).view(np.uint64)
+    slot = np.asarray(slot, dtype=np.uint64)
+    accounts = cash.shape[0]
+
+    outputs = [np.zeros(accounts, dtype=np.uint64), np.zeros(accounts, dtype=np.uint64)]
+    failures = [np.zeros(accounts, dtype=bool), np.zeros(accounts, dtype=bool)]
+
+    for instrument_id in range(min(cash.shape[1], len(instruments))):
+        instrument = instruments[instrument_id]
+        price = np.uint64(prices[instrument_id])
+
+        # Skip empty positions
+        rows = np.flatnonzero((cash[:, instrument_id] | principal[:, instrument_id]) != 0)
+        if rows.size == 0:
+            continue
+        user_cash = cash[rows, instrument_id]
+        user_principal = principal[rows, instrument_id]
+        user_index = slot[rows, instrument_id]
+
+        # Get loan balance, see calculate_accrued_lend and calculate_accrued_borrow
+        borrow = _ltz(user_principal)
+        has_lend = (user_principal != _ZERO) & ~borrow
+        borrowed = np.where(borrow, _neg(user_principal), user_principal)
+        pool_index = np.where(borrow, np.uint64(instrument.borrow_index), np.uint64(instrument.lend_index))
+        accrued, loan_failed = wide_ratio([borrowed, pool_index], user_index)
+        loan_failed &= user_principal != _ZERO
+        accrued_borrow = _neg(accrued + (accrued == borrowed).astype(np.uint64))
+        loaned_balance = np.where(borrow, accrued_borrow, np.where(has_lend, accrued, _ZERO))
+
+        # Calculate balance sum
+        balance_sum, sum_failed = _signed_add(user_cash, loaned_balance)
+        negative = _ltz(balance_sum)
+        magnitude = np.where(negative, _neg(balance_sum), balance_sum)
+
+        modes = (
+            (instrument.initial_haircut, instrument.initial_margin),
+            (instrument.maintenance_haircut, instrument.maintenance_margin),
+        )
+        for mode, (haircut, margin) in enumerate(modes):
+            output = outputs[mode][rows]
+            failed = loan_failed | sum_failed
+
+            # NOTE: RATIO_ONE - haircut fails on chain when it is evaluated with a haircut above one
+            haircut_failed = haircut > RATIO_ONE
+            one_minus_haircut = np.uint64(max(RATIO_ONE - haircut, 0))
+
+            # Add first term, health += price * sum * ratio
+            ratio = np.where(negative, np.uint64(RATIO_ONE + margin), one_minus_haircut)
+            term, term_failed = wide_ratio([price, magnitude, ratio], np.uint64(PRICECASTER_RESCALE_FACTOR * RATIO_ONE))
+            output, overflow = _signed_add(output, np.where(negative, _neg(term), term))
+            failed |= term_failed | overflow | (~negative & haircut_failed)
+
+            # Lend positions should be further multiplied by (1 - optimal_utilization)
+            term, term_failed = wide_ratio(
+                [price, loaned_balance, one_minus_haircut, np.uint64(instrument.optimal_utilization)],
+                np.uint64(PRICECASTER_RESCALE_FACTOR * RATIO_ONE * RATIO_ONE),
+            )
+            lend_output, overflow = _signed_add(output, _neg(term))
+            output = np.where(has_lend, lend_output, output)
+            failed |= has_lend & (term_failed | overflow | haircut_failed)
+
+            outputs[mode][rows] = output
+            failures[mode][rows] |= failed
+
+    return BookHealth(
+        outputs[0].view(np.int64),
+        outputs[1].view(np.int64),
+        failures[0],
+        failures[1],
+    )
+
+
+def health_magnitude(
+    cash: np.ndarray,
+    principal: np.ndarray,
+    slot: np.ndarray,
+    instruments: Sequence[Instrument],
+    prices: Sequence[int],
+) -> np.ndarray:
+    """
+    Bounds the sum of the absolute health terms of every account, initial or maintenance, in floating point.
+    Below SAFE_MAGNITUDE summing the terms can not differ from the contract accumulation.
+
+    Each term is at most price * (|balance| * (1 + margin) + loaned * optimal_utilization), the loaned
+    balance is at most the principal times the largest pool index over the user index.
+    """
+
+    columns = min(np.shape(cash)[1], len(instruments))
+    instruments = instruments[:columns]
+    cash = np.asarray(cash, dtype=np.uint64)[:, :columns].astype(np.float64)
+    principal = np.asarray(principal).astype(np.int64, copy=False)[:, :columns].astype(np.float64)
+    slot = np.asarray(slot, dtype=np.uint64)[:, :columns].astype(np.float64)
+
+    price = np.array(prices[:columns], dtype=np.float64) / PRICECASTER_RESCALE_FACTOR
+    margin = np.array([1 + max(instrument.initial_margin, instrument.maintenance_margin) / RATIO_ONE for instrument in instruments])
+    utilization = np.array([instrument.optimal_utilization / RATIO_ONE for instrument in instruments])
+    pool_index = np.array([max(instrument.borrow_index, instrument.lend_index) for instrument in instruments], dtype=np.float64)
+
+    loaned = np.abs(principal) * pool_index / np.maximum(slot, 1) + 1
+    terms = price * ((cash + loaned) * margin + loaned * utilization)
+    return terms.sum(axis=1) * _MAGNITUDE_MARGIN
@@ -0,0 +1,574 @@
+"""
+Mirror of the Core contract settle and a solver for the largest fill of an order pair.
+
+The buyer is the order passed to settle, the seller the order added by the preceding add_order.
+The buyer sends buyer_to_send of its sell instrument and receives seller_to_send of its buy instrument.
+"""
+
+from math import gcd
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from contracts_unified.library.constants import MAX_FEES_DIVISOR
+from contracts_unified.offchain.avm import (
+    AvmError,
+    check,
+    signed_add,
+    signed_ltz,
+    to_signed,
+    u64,
+)
+from contracts_unified.offchain.health import (
+    SAFE_MAGNITUDE,
+    health_check,
+    instrument_health,
+)
+from contracts_unified.offchain.pool import (
+    accrue_instrument,
+    capitalize_principal,
+    transfer_position,
+)
+from contracts_unified.offchain.search import largest_passing_between
+from contracts_unified.offchain.state import (
+    Instrument,
+    Position,
+    get_position,
+    set_position,
+)
+
+# Settle uses the initial health
+_USE_MAINT = False
+
+# Fills scanned one by one when looking for a fair one, before falling back to the exact price
+_FAIR_SCAN = 1024
+# Fair fills tried below the solution before giving up
+_FAIR_ATTEMPTS = 16
+# Fills checked above the solution for rounding effects
+_ROUNDING_WINDOW = 8
+
+
+class OrderSide(NamedTuple):
+    """An order of the pair with its account, the remaining amounts are the ones from the order box"""
+
+    positions: Sequence[Position]
+    sell_instrument: int
+    sell_amount: int
+    buy_instrument: int
+    buy_amount: int
+    sell_remaining: int
+    borrow_remaining: int
+    repay_remaining: int
+    # Fees charged by the server as a ratio of buyer_to_send, capped by the contract maximum
+    fee_numerator: int = 0
+    fee_denominator: int = 1
+
+
+class SettleAmounts(NamedTuple):
+    """Mirrors SettleExtraData"""
+
+    buyer_fees: int
+    buyer_to_send: int
+    buyer_to_borrow: int
+    buyer_to_repay: int
+    buyer_negative_margin: bool
+    seller_fees: int
+    seller_to_send: int
+    seller_to_borrow: int
+    seller_to_repay: int
+    seller_negative_margin: bool
+
+    def encode(self) -> bytes:
+        """ABI encodes the settle extra data"""
+
+        def side(fees: int, to_send: int, to_borrow: int, to_repay: int, negative_margin: bool) -> bytes:
+            amounts = b"".join(value.to_bytes(8, "big") for value in (fees, to_send, to_borrow, to_repay))
+            return amounts + (b"\x80" if negative_margin else b"\x00")
+
+        return (
+            side(self.buyer_fees, self.buyer_to_send, self.buyer_to_borrow, self.buyer_to_repay, self.buyer_negative_margin)
+            + side(self.seller_fees, self.seller_to_send, self.seller_to_borrow, self.seller_to_repay, self.seller_negative_margin)
+        )
+
+
+class SettleOutcome(NamedTuple):
+    """State after a settle as performed by the contract"""
+
+    buyer_positions: List[Position]
+    seller_positions: List[Position]
+    instruments: List[Instrument]
+    buyer_health: int
+    seller_health: int
+
+
+def _pool_move(
+    instruments: List[Instrument],
+    positions: Sequence[Position],
+    instrument_id: int,
+    amount: int,
+    timestamp: int,
+) -> List[Position]:
+    instrument = accrue_instrument(instruments[instrument_id], timestamp)
+    instruments[instrument_id], position = transfer_position(instrument, get_position(positions, instrument_id), amount)
+    return set_position(positions, instrument_id, position)
+
+
+def _add_to_cash(positions: Sequence[Position], instrument_id: int, amount: int) -> List[Position]:
+    position = get_position(positions, instrument_id)
+    cash = signed_add(u64(amount), position.cash)
+    check(not signed_ltz(cash), "negative user cash")
+    return set_position(positions, instrument_id, position._replace(cash=cash))
+
+
+def _passes(health: int, old_health: Optional[int]) -> bool:
+    return health >= 0 or (old_health is not None and health >= old_health)
+
+
+def validate_fill(buyer: OrderSide, seller: OrderSide, amounts: SettleAmounts) -> None:
+    """
+    Mirrors the checks settle makes on the orders and the fill, raising AvmError where the contract would fail.
+    The expiration is not checked and the positions are not used.
+    """
+
+    # Validate the asset pair matches
+    check(buyer.sell_instrument == seller.buy_instrument, "instrument mismatch")
+    check(buyer.buy_instrument == seller.sell_instrument, "instrument mismatch")
+
+    # Validate the orders match
+    check(buyer.sell_amount * seller.sell_amount >= buyer.buy_amount * seller.buy_amount, "orders do not match")
+
+    # Validate that the swap is fair for both the seller and the buyer
+    check(amounts.buyer_to_send * seller.sell_amount >= amounts.seller_to_send * seller.buy_amount, "unfair for the seller")
+    check(amounts.seller_to_send * buyer.sell_amount >= amounts.buyer_to_send * buyer.buy_amount, "unfair for the buyer")
+
+    # Validate that we are not sending, borrowing or repaying more than allowed
+    check(buyer.sell_remaining >= amounts.buyer_to_send and seller.sell_remaining >= amounts.seller_to_send, "sell remaining")
+    check(buyer.borrow_remaining >= amounts.buyer_to_borrow and seller.borrow_remaining >= amounts.seller_to_borrow, "borrow remaining")
+    check(buyer.repay_remaining >= amounts.buyer_to_repay and seller.repay_remaining >= amounts.seller_to_repay, "repay remaining")
+
+    # Validate that the fees are lower than the maximum possible
+    check(amounts.buyer_fees <= amounts.buyer_to_send // MAX_FEES_DIVISOR, "buyer fees")
+    check(amounts.seller_fees <= amounts.buyer_to_send // MAX_FEES_DIVISOR, "seller fees")
+
+    # We shouldn't borrow / repay more than the assets traded, including fees.
+    check(amounts.buyer_to_borrow <= u64(amounts.buyer_to_send + amounts.buyer_fees), "buyer borrow")
+    check(amounts.buyer_to_repay <= amounts.seller_to_send, "buyer repay")
+    check(amounts.seller_to_borrow <= amounts.seller_to_send, "seller borrow")
+    check(amounts.seller_to_repay <= amounts.buyer_to_send - amounts.seller_fees, "seller repay")
+
+
+def settle_positions(
+    buyer: OrderSide,
+    seller: OrderSide,
+    amounts: SettleAmounts,
+    instruments: Sequence[Instrument],
+    timestamp: int,
+) -> Tuple[List[Position], List[Position], List[Instrument]]:
+    """
+    Mirrors the updates settle makes to the positions and the pools, raising AvmError where the contract would fail.
+    Returns the buyer positions, the seller positions and the instruments. The fill is not validated and the health is not checked.
+    """
+
+    instruments = list(instruments)
+    buyer_positions = list(buyer.positions)
+    seller_positions = list(seller.positions)
+
+    # Handle borrow updates
+    if amounts.buyer_to_borrow > 0:
+        buyer_positions = _pool_move(instruments, buyer_positions, buyer.sell_instrument, -amounts.buyer_to_borrow, timestamp)
+    if amounts.seller_to_borrow > 0:
+        seller_positions = _pool_move(instruments, seller_positions, seller.sell_instrument, -amounts.seller_to_borrow, timestamp)
+
+    # Perform swap updates
+    buyer_positions = _add_to_cash(buyer_positions, buyer.buy_instrument, amounts.seller_to_send)
+    seller_positions = _add_to_cash(seller_positions, seller.buy_instrument, amounts.buyer_to_send - amounts.seller_fees)
+    buyer_positions = _add_to_cash(buyer_positions, buyer.sell_instrument, -(amounts.buyer_to_send + amounts.buyer_fees))
+    seller_positions = _add_to_cash(seller_positions, seller.sell_instrument, -amounts.seller_to_send)
+
+    # Handle repay updates
+    if amounts.buyer_to_repay > 0:
+        buyer_positions = _pool_move(instruments, buyer_positions, buyer.buy_instrument, amounts.buyer_to_repay, timestamp)
+    if amounts.seller_to_repay > 0:
+        seller_positions = _pool_move(instruments, seller_positions, seller.buy_instrument, amounts.seller_to_repay, timestamp)
+
+    return buyer_positions, seller_positions, instruments
+
+
+def simulate_settle(
+    buyer: OrderSide,
+    seller: OrderSide,
+    amounts: SettleAmounts,
+    instruments: Sequence[Instrument],
+    prices: Sequence[int],
+    timestamp: int,
+) -> SettleOutcome:
+    """
+    Mirrors settle once both orders are in the order book, raising AvmError where the contract would fail.
+    NOTE: The fees are not added to the fee target account, which must not be one of the two accounts.
+    """
+
+    validate_fill(buyer, seller, amounts)
+    # Get old health for both users if needed
+    buyer_old = health_check(buyer.positions, instruments, prices, _USE_MAINT) if amounts.buyer_negative_margin else None
+    seller_old = health_check(seller.positions, instruments, prices, _USE_MAINT) if amounts.seller_negative_margin else None
+
+    buyer_positions, seller_positions, instruments = settle_positions(buyer, seller, amounts, instruments, timestamp)
+
+    # Validate the users are still healthy
+    buyer_health = health_check(buyer_positions, instruments, prices, _USE_MAINT)
+    check(_passes(buyer_health, buyer_old), "buyer unhealthy")
+    seller_health = health_check(seller_positions, instruments, prices, _USE_MAINT)
+    check(_passes(seller_health, seller_old), "seller unhealthy")
+
+    return SettleOutcome(buyer_positions, seller_positions, instruments, buyer_health, seller_health)
+
+
+class _Snapshot(NamedTuple):
+    """An account before the settle, as seen by _FillEvaluator"""
+
+    # Health of the instruments not traded
+    other: int
+    # Health before the settle when it is negative, the settle then only requires it not to decrease
+    old: Optional[int]
+    # Outstanding debt on the bought instrument once its pool is accrued, the most that is worth repaying
+    debt: int
+
+
+class _Pool(NamedTuple):
+    """A traded instrument, as seen by _FillEvaluator"""
+
+    instrument: Instrument
+    # The instrument accrued to the settle time, None when the accrual fails
+    accrued: Optional[Instrument]
+    price: int
+
+
+def _accrue(instrument: Instrument, timestamp: int) -> Optional[Instrument]:
+    """The instrument accrued to the settle time, None when the accrual fails"""
+
+    try:
+        return accrue_instrument(instrument, timestamp)
+    except AvmError:
+        return None
+
+
+def _debt(side: OrderSide, accrued: Optional[Instrument]) -> int:
+    """Outstanding debt on the bought instrument once its pool is accrued, the most that is worth repaying"""
+
+    position = get_position(side.positions, side.buy_instrument)
+    if position.principal >= 0 or accrued is None:
+        return 0
+    return -to_signed(capitalize_principal(position, accrued.borrow_index, accrued.lend_index))
+
+
+class _FillEvaluator:
+    """
+    Evaluates a fill of buyer_to_send, only recomputing the health terms of the two instruments
+    traded, the other terms of each account are summed once.
+    """
+
+    def __init__(
+        self,
+        buyer: OrderSide,
+        seller: OrderSide,
+        pools: Dict[int, _Pool],
+        snapshots: Tuple[_Snapshot, _Snapshot],
+        magnitude: float,
+        at_seller_price: bool,
+    ) -> None:
+        self.buyer, self.seller = buyer, seller
+        # The traded pools, accruing again at the settle time does not change the accrued ones
+        self.pools = pools
+        self.buyer_snapshot, self.seller_snapshot = snapshots
+        # Sum of the absolute health terms of both accounts, or a bound of it
+        # NOTE: The contract accumulates the terms, summing them only differs if the accumulation overflows
+        self.magnitude = magnitude
+        self.at_seller_price = at_seller_price
+
+    @classmethod
+    def create(
+        cls,
+        buyer: OrderSide,
+        seller: OrderSide,
+        instruments: Sequence[Instrument],
+        prices: Sequence[int],
+        timestamp: int,
+        at_seller_price: bool,
+    ) -> "_FillEvaluator":
+        """Creates the evaluator of an order pair, summing the health terms of both accounts"""
+
+        traded = (buyer.sell_instrument, buyer.buy_instrument)
+        pools = {
+            instrument_id: _Pool(instruments[instrument_id], _accrue(instruments[instrument_id], timestamp), prices[instrument_id])
+            for instrument_id in traded
+        }
+
+        magnitude = 0
+        snapshots = []
+        for side in (buyer, seller):
+            other = 0
+            old = 0
+            for instrument_id in range(min(len(side.positions), len(instruments))):
+                position = side.positions[instrument_id]
+                if not position.cash and not position.principal:
+                    continue
+                term = instrument_health(position, instruments[instrument_id], prices[instrument_id], _USE_MAINT)
+                magnitude += abs(term)
+                old += term
+                if instrument_id not in traded:
+                    other += term
+            snapshots.append(_Snapshot(other, old if old < 0 else None, _debt(side, pools[side.buy_instrument].accrued)))
+
+        return cls(buyer, seller, pools, (snapshots[0], snapshots[1]), magnitude, at_seller_price)
+
+    @property
+    def traded(self) -> Tuple[int, int]:
+        """The instruments sold and bought by the buyer"""
+        return self.buyer.sell_instrument, self.buyer.buy_instrument
+
+    def seller_to_send(self, buyer_to_send: int) -> int:
+        """Amount received by the buyer at the execution price"""
+
+        if self.at_seller_price:
+            return buyer_to_send * self.seller.sell_amount // self.seller.buy_amount
+        return -(-buyer_to_send * self.buyer.buy_amount // self.buyer.sell_amount)
+
+    def fees(self, buyer_to_send: int) -> Tuple[int, int]:
+        """Buyer and seller fees for a fill, capped to the contract maximum"""
+
+        maximum = buyer_to_send // MAX_FEES_DIVISOR
+        return (
+            min(buyer_to_send * self.buyer.fee_numerator // self.buyer.fee_denominator, maximum),
+            min(buyer_to_send * self.seller.fee_numerator // self.seller.fee_denominator, maximum),
+        )
+
+    def amounts(self, buyer_to_send: int) -> SettleAmounts:
+        """Settle amounts for a fill, borrowing only what is missing and repaying as much as allowed"""
+
+        buyer, seller = self.buyer, self.seller
+        seller_to_send = self.seller_to_send(buyer_to_send)
+        buyer_fees, seller_fees = self.fees(buyer_to_send)
+
+        buyer_cash = get_position(buyer.positions, buyer.sell_instrument).cash
+        seller_cash = get_position(seller.positions, seller.sell_instrument).cash
+
+        return SettleAmounts(
+            buyer_fees=buyer_fees,
+            buyer_to_send=buyer_to_send,
+            buyer_to_borrow=max(0, buyer_to_send + buyer_fees - buyer_cash),
+            buyer_to_repay=min(buyer.repay_remaining, seller_to_send, self.buyer_snapshot.debt),
+            buyer_negative_margin=self.buyer_snapshot.old is not None,
+            seller_fees=seller_fees,
+            seller_to_send=seller_to_send,
+            seller_to_borrow=max(0, seller_to_send - seller_cash),
+            seller_to_repay=min(seller.repay_remaining, buyer_to_send - seller_fees, self.seller_snapshot.debt),
+            seller_negative_margin=self.seller_snapshot.old is not None,
+        )
+
+    def slack(self, buyer_to_send: int) -> Optional[int]:
+        """
+        Returns how far the least healthy account is from failing the settle, or None if any
+        other check of the contract fails for this fill.
+        NOTE: The fairness of the price is not checked here, see fair
+        """
+
+        amounts = self.amounts(buyer_to_send)
+        buyer, seller = self.buyer, self.seller
+        if (
+            amounts.buyer_to_send > buyer.sell_remaining or amounts.seller_to_send > seller.sell_remaining
+            or amounts.buyer_to_borrow > buyer.borrow_remaining or amounts.seller_to_borrow > seller.borrow_remaining
+        ):
+            return None
+
+        sell_id, buy_id = self.traded
+        instruments = {instrument_id: pool.instrument for instrument_id, pool in self.pools.items()}
+        moved = set()
+
+        def pool_move(instrument_id: int, position: Position, amount: int) -> Position:
+            if instrument_id not in moved:
+                moved.add(instrument_id)
+                accrued = self.pools[instrument_id].accrued
+                if accrued is None:
+                    raise AvmError("pool accrual")
+                instruments[instrument_id] = accrued
+            instruments[instrument_id], position = transfer_position(instruments[instrument_id], position, amount)
+            return position
+
+        buyer_positions: List[Position] = [get_position(buyer.positions, sell_id), get_position(buyer.positions, buy_id)]
+        seller_positions: List[Position] = [get_position(seller.positions, sell_id), get_position(seller.positions, buy_id)]
+
+        try:
+            if amounts.buyer_to_borrow > 0:
+                buyer_positions[0] = pool_move(sell_id, buyer_positions[0], -amounts.buyer_to_borrow)
+            if amounts.seller_to_borrow > 0:
+                seller_positions[1] = pool_move(buy_id, seller_positions[1], -amounts.seller_to_borrow)
+
+            buyer_positions = _add_to_cash(_add_to_cash(buyer_positions, 1, amounts.seller_to_send), 0, -(amounts.buyer_to_send + amounts.buyer_fees))
+            seller_positions = _add_to_cash(_add_to_cash(seller_positions, 0, amounts.buyer_to_send - amounts.seller_fees), 1, -amounts.seller_to_send)
+
+            if amounts.buyer_to_repay > 0:
+                buyer_positions[1] = pool_move(buy_id, buyer_positions[1], amounts.buyer_to_repay)
+            if amounts.seller_to_repay > 0:
+                seller_positions[0] = pool_move(sell_id, seller_positions[0], amounts.seller_to_repay)
+
+            slacks = []
+            for positions, snapshot in ((buyer_positions, self.buyer_snapshot), (seller_positions, self.seller_snapshot)):
+                health = snapshot.other + sum(
+                    instrument_health(position, instruments[instrument_id], self.pools[instrument_id].price, _USE_MAINT)
+                    for position, instrument_id in zip(positions, self.traded)
+                )
+                slacks.append(health - min(snapshot.old or 0, 0))
+        except AvmError:
+            return None
+
+        return min(slacks)
+
+    def fair(self, buyer_to_send: int) -> bool:
+        """Whether the rounded execution price is within both limit prices"""
+
+        seller_to_send = self.seller_to_send(buyer_to_send)
+        return (
+            buyer_to_send * self.seller.sell_amount >= seller_to_send * self.seller.buy_amount
+            and seller_to_send * self.buyer.sell_amount >= buyer_to_send * self.buyer.buy_amount
+        )
+
+    def fair_at_most(self, buyer_to_send: int) -> int:
+        """
+        Largest fair fill not above buyer_to_send. When the limit prices are close only some fills
+        are fair once rounded, the fills exactly at the execution price always are.
+        """
+
+        for candidate in range(buyer_to_send, max(buyer_to_send - _FAIR_SCAN, 0), -1):
+            if self.fair(candidate):
+                return candidate
+
+        if self.at_seller_price:
+            period = self.seller.buy_amount // gcd(self.seller.sell_amount, self.seller.buy_amount)
+        else:
+            period = self.buyer.sell_amount // gcd(self.buyer.sell_amount, self.buyer.buy_amount)
+        return buyer_to_send - buyer_to_send % period
+
+    def upper_bound(self) -> int:
+        """Largest fill allowed by the remaining amounts of both orders"""
+
+        bound = self.buyer.sell_remaining
+        seller_remaining = self.seller.sell_remaining
+        if self.at_seller_price:
+            # floor(x * sell / buy) <= remaining
+            bound = min(bound, ((seller_remaining + 1) * self.seller.buy_amount - 1) // self.seller.sell_amount)
+        else:
+            # ceil(x * buy / sell) <= remaining
+            bound = min(bound, seller_remaining * self.buyer.sell_amount // self.buyer.buy_amount)
+
+        # The seller can not borrow more than the order allows
+        seller_available = get_position(self.seller.positions, self.seller.sell_instrument).cash + self.seller.borrow_remaining
+        while bound > 0 and self.seller_to_send(bound) > seller_available:
+            bound = min(bound - 1, bound * seller_available // self.seller_to_send(bound))
+
+        # Neither can the buyer, fees included
+        buyer_available = get_position(self.buyer.positions, self.buyer.sell_instrument).cash + self.buyer.borrow_remaining
+        while bound > 0 and bound + self.fees(bound)[0] > buyer_available:
+            bound = min(bound - 1, bound * buyer_available // (bound + self.fees(bound)[0]))
+
+        return max(bound, 0)
+
+    def breakpoints(self, upper: int) -> List[int]:
+        """Fills around which the health stops being linear in the fill"""
+
+        buyer, seller = self.buyer, self.seller
+        sell_id, buy_id = self.traded
+        rate = self.seller_to_send(10**18) / 10**18
+        buyer_fee = min(buyer.fee_numerator / buyer.fee_denominator, 1 / MAX_FEES_DIVISOR)
+        seller_fee = min(seller.fee_numerator / seller.fee_denominator, 1 / MAX_FEES_DIVISOR)
+
+        points = []
+        for positions, instrument_id, per_unit in (
+            (buyer.positions, sell_id, -(1 + buyer_fee)),
+            (buyer.positions, buy_id, rate),
+            (seller.positions, sell_id, 1 - seller_fee),
+            (seller.positions, buy_id, -rate),
+        ):
+            position = get_position(positions, instrument_id)
+            # Cash exhausted, principal changes sign, balance changes sign
+            for level in (position.cash, position.cash + max(position.principal, 0), position.cash + position.principal):
+                if per_unit:
+                    points.append(level / abs(per_unit))
+
+        # Repay saturation
+        if rate:
+            points += [min(buyer.repay_remaining, self.buyer_snapshot.debt) / rate]
+        points += [min(seller.repay_remaining, self.seller_snapshot.debt) / (1 - seller_fee)]
+
+        return sorted({0, upper} | {int(point) for point in points if 0 < point < upper})
+
+
+def _can_match(buyer: OrderSide, seller: OrderSide) -> bool:
+    """Whether the limit prices of the orders cross"""
+
+    if buyer.sell_amount * seller.sell_amount < buyer.buy_amount * seller.buy_amount:
+        return False
+    return bool(buyer.sell_amount and buyer.buy_amount and seller.sell_amount and seller.buy_amount)
+
+
+def max_fill(
+    buyer: OrderSide,
+    seller: OrderSide,
+    instruments: Sequence[Instrument],
+    prices: Sequence[int],
+    timestamp: int,
+    at_seller_price: bool = True,
+) -> Optional[SettleAmounts]:
+    """
+    Returns the settle amounts of the largest fill that keeps both accounts healthy, or None
+    if the orders can not be settled at all.
+
+    The health of each account is linear in the fill between a handful of breakpoints, where a cash
+    balance runs out, a principal or balance changes sign, or a repay saturates. The solver evaluates
+    the exact health at the breakpoints, interpolates in the segment where it crosses zero and
+    corrects the rounding with a few exact evaluations.
+
+    at_seller_price: execute at the seller limit price, the best for the buyer, otherwise at the buyer one
+    """
+
+    if not _can_match(buyer, seller):
+        return None
+    evaluator = _FillEvaluator.create(buyer, seller, instruments, prices, timestamp, at_seller_price)
+    return _largest_fill(evaluator, instruments, prices, timestamp)
+
+
+def _largest_fill(
+    evaluator: _FillEvaluator,
+    instruments: Sequence[Instrument],
+    prices: Sequence[int],
+    timestamp: int,
+) -> Optional[SettleAmounts]:
+    """Solves the largest fill of an order pair, see max_fill"""
+
+    upper = evaluator.upper_bound()
+
+    best = largest_passing_between(evaluator.slack, evaluator.breakpoints(upper)) or 0
+
+    # Round down to a fair price, the health is checked again as the fill changed
+    for _ in range(_FAIR_ATTEMPTS):
+        best = evaluator.fair_at_most(best)
+        if best == 0:
+            return None
+        slack = evaluator.slack(best)
+        if slack is not None and slack >= 0:
+            break
+        best -= 1
+    else:
+        return None
+
+    # Rounding makes the health slightly non monotonic around the solution
+    for candidate in range(best + 1, min(best + _ROUNDING_WINDOW, upper) + 1):
+        slack = evaluator.slack(candidate) if evaluator.fair(candidate) else None
+        if slack is not None and slack >= 0:
+            best = candidate
+
+    amounts = evaluator.amounts(best)
+    if evaluator.magnitude >= SAFE_MAGNITUDE:
+        # The accounts are large enough for the contract accumulation to overflow, check with the mirror
+        try:
+            simulate_settle(evaluator.buyer, evaluator.seller, amounts, instruments, prices, timestamp)
+        except AvmError:
+            return None
+    return amounts
@@ -0,0 +1,158 @@
+"""
+Mirror of the Core contract health calculation in health_check.py
+"""
+
+from typing import Sequence, Tuple
+
+from contracts_unified.library.constants import PRICECASTER_RESCALE_FACTOR, RATIO_ONE
+from contracts_unified.offchain.avm import (
+    signed_add,
+    signed_ltz,
+    signed_neg,
+    signed_sub,
+    sub,
+    to_signed,
+    u64,
+    wide_ratio,
+)
+from contracts_unified.offchain.pool import (
+    calculate_accrued_borrow,
+    calculate_accrued_lend,
+)
+from contracts_unified.offchain.state import Instrument, Position
+
+# Scale of the exposures, health is the sum of price * exposure / EXPOSURE_SCALE
+EXPOSURE_SCALE = PRICECASTER_RESCALE_FACTOR * RATIO_ONE * RATIO_ONE
+
+# Below this sum of absolute health terms, summing the terms can not differ from the contract accumulation
+SAFE_MAGNITUDE = 2**61
+
+
+def accumulate_health(
+    output: int,
+    position: Position,
+    instrument: Instrument,
+    price: int,
+    use_maint: bool,
+) -> int:
+    """Adds the health of a single position to output, both being uint64 bit patterns"""
+
+    if not position.cash and not position.principal:
+        return output
+    cash = position.cash
+    principal = u64(position.principal)
+
+    # Get loan balance(netting)
+    if principal != 0:
+        has_lend = not signed_ltz(principal)
+        if has_lend:
+            loaned_balance = calculate_accrued_lend(principal, position.slot, instrument.lend_index)
+        else:
+            loaned_balance = calculate_accrued_borrow(principal, position.slot, instrument.borrow_index)
+    else:
+        has_lend = False
+        loaned_balance = 0
+
+    # Calculate balance sum
+    balance_sum = signed_add(cash, loaned_balance)
+
+    # Load risk factors
+    if use_maint:
+        haircut, margin = instrument.maintenance_haircut, instrument.maintenance_margin
+    else:
+        haircut, margin = instrument.initial_haircut, instrument.initial_margin
+
+    # Add first term, health += price * sum * ratio
+    if signed_ltz(balance_sum):
+        output = signed_sub(output, wide_ratio([price, signed_neg(balance_sum), RATIO_ONE + margin], [PRICECASTER_RESCALE_FACTOR * RATIO_ONE]))
+    else:
+        output = signed_add(output, wide_ratio([price, balance_sum, sub(RATIO_ONE, haircut)], [PRICECASTER_RESCALE_FACTOR * RATIO_ONE]))
+
+    # Lend positions should be further multiplied by (1 - optimal_utilization)
+    if has_lend:
+        output = signed_sub(
+            output,
+            wide_ratio(
+                [price, loaned_balance, sub(RATIO_ONE, haircut), instrument.optimal_utilization],
+                [PRICECASTER_RESCALE_FACTOR * RATIO_ONE * RATIO_ONE],
+            ),
+        )
+
+    return output
+
+
+def instrument_exposure(
+    position: Position,
+    instrument: Instrument,
+    use_maint: bool,
+) -> Tuple[int, int]:
+    """
+    Returns the health of a single position per unit of price, scaled by EXPOSURE_SCALE, and the
+    number of WideRatio truncations done by the contract when computing it.
+
+    The balances do not depend on the price, so the term added by accumulate_health is
+    price * exposure / EXPOSURE_SCALE up to less than one unit per truncation.
+    """
+
+    cash = position.cash
+    principal = u64(position.principal)
+    if not cash | principal:
+        return 0, 0
+
+    has_lend = principal != 0 and not signed_ltz(principal)
+    if principal == 0:
+        loaned_balance = 0
+    elif has_lend:
+        loaned_balance = calculate_accrued_lend(principal, position.slot, instrument.lend_index)
+    else:
+        loaned_balance = calculate_accrued_borrow(principal, position.slot, instrument.borrow_index)
+    balance_sum = to_signed(signed_add(cash, loaned_balance))
+
+    if use_maint:
+        haircut, margin = instrument.maintenance_haircut, instrument.maintenance_margin
+    else:
+        haircut, margin = instrument.initial_haircut, instrument.initial_margin
+
+    if balance_sum < 0:
+        exposure = balance_sum * (RATIO_ONE + margin) * RATIO_ONE
+    else:
+        exposure = balance_sum * (RATIO_ONE - haircut) * RATIO_ONE
+    if has_lend:
+        exposure -= loaned_balance * (RATIO_ONE - haircut) * instrument.optimal_utilization
+
+    return exposure, 1 + int(has_lend)
+
+
+def instrument_health(
+    position: Position,
+    instrument: Instrument,
+    price: int,
+    use_maint: bool,
+) -> int:
+    """
+    Returns the contribution of a single position to the account health as a signed integer.
+    Health is the sum of these terms, as long as the contract does not overflow while adding them.
+    """
+
+    return to_signed(accumulate_health(0, position, instrument, price, use_maint))
+
+
+def health_check(
+    positions: Sequence[Position],
+    instruments: Sequence[Instrument],
+    prices: Sequence[int],
+    use_maint: bool,
+) -> int:
+    """
+    Calculates the user's health exactly like the contract does and returns it as a signed integer.
+
+    positions: the account positions, as decoded from the account box
+    instruments: the instruments, as decoded from the "i" box
+    prices: the normalized pricecaster price of each instrument
+    """
+
+    output = 0
+    for instrument_id in range(min(len(positions), len(instruments))):
+        output = accumulate_health(output, positions[instrument_id], instruments[instrument_id], prices[instrument_id], use_maint)
+
+    return to_signed(output)
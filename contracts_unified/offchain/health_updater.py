@@ -0,0 +1,382 @@
+"""
+Incremental health of a large set of accounts, updated on every price tick.
+
+Once the balances are known the health of an account is a sum over its instruments of terms
+that only depend on the instrument price, as in health_check:
+
+    term = +- WideRatio([price, |balance|, 1 +- ratio], [RESCALE * RATIO_ONE])
+           - WideRatio([price, loaned, 1 - haircut, optimal_utilization], [RESCALE * RATIO_ONE * RATIO_ONE])
+
+The updater keeps, for each instrument, the balances of its holders and their current term. A price
+tick only recomputes the terms of the holders of the moved instrument and adds the differences to the
+account health. The balances, and the sign which selects the haircut or margin branch, only change
+with the account or the instrument indexes, in which case the affected terms are computed again.
+
+Terms are computed in floating point and certified, the few that can not be certified are computed
+exactly, so the result is always the contract's. Accounts whose terms are large enough that the
+contract could overflow are computed with the exact mirror instead.
+"""
+
+from typing import Callable, Dict, Hashable, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+
+from contracts_unified.library.constants import PRICECASTER_RESCALE_FACTOR, RATIO_ONE
+from contracts_unified.offchain.avm import AvmError
+from contracts_unified.offchain.health import health_check
+from contracts_unified.offchain.state import Instrument, Position
+from contracts_unified.offchain.wide import wide_ratio
+
+# Terms above this bound may overflow the contract accumulator
+SAFE_TERM = 2**56
+# Number of terms under SAFE_TERM that can be summed without overflowing an int64
+MAX_INSTRUMENTS = 2**63 // SAFE_TERM
+# Relative error bound of the floating point terms, with margin
+_FLOAT_ERROR = 2.0**-48
+# Unsorted entries allowed before the holdings are sorted again
+_MAX_UNSORTED = 256
+
+
+# One array per field of the positions, they are grown and sorted together
+# pylint: disable-next=too-many-instance-attributes
+class _Holdings:
+    """Struct of arrays of the positions on a single instrument, at most one entry per account"""
+
+    def __init__(self, capacity: int = 16) -> None:
+        self.size = 0
+        # The first sorted_size entries are sorted by row, the others were appended since
+        self.sorted_size = 0
+        # Account row and raw position
+        self.rows = np.zeros(capacity, dtype=np.int64)
+        self.cash = np.zeros(capacity, dtype=np.uint64)
+        self.principal = np.zeros(capacity, dtype=np.int64)
+        self.slot = np.zeros(capacity, dtype=np.uint64)
+        # Balances derived from the position and the instrument indexes
+        self.magnitude = np.zeros(capacity, dtype=np.uint64)
+        self.negative = np.zeros(capacity, dtype=np.bool_)
+        self.loaned = np.zeros(capacity, dtype=np.uint64)
+        self.balance_unsafe = np.zeros(capacity, dtype=np.bool_)
+        # Floating point term per unit of price
+        self.coefficient = np.zeros(capacity, dtype=np.float64)
+        self.lend_coefficient = np.zeros(capacity, dtype=np.float64)
+        # Current term and whether it is computed exactly instead
+        self.term = np.zeros(capacity, dtype=np.int64)
+        self.unsafe = np.zeros(capacity, dtype=np.bool_)
+
+    def _arrays(self) -> List[np.ndarray]:
+        """Returns the arrays, in the order expected by _set_arrays"""
+        return [
+            self.rows, self.cash, self.principal, self.slot, self.magnitude, self.negative,
+            self.loaned, self.balance_unsafe, self.coefficient, self.lend_coefficient, self.term, self.unsafe,
+        ]
+
+    def _set_arrays(self, arrays: List[np.ndarray]) -> None:
+        """Replaces the arrays, in the order returned by _arrays"""
+        (
+            self.rows, self.cash, self.principal, self.slot, self.magnitude, self.negative,
+            self.loaned, self.balance_unsafe, self.coefficient, self.lend_coefficient, self.term, self.unsafe,
+        ) = arrays
+
+    def find(self, row: int) -> int:
+        """Returns the entry of an account or -1"""
+
+        position = int(np.searchsorted(self.rows[:self.sorted_size], row))
+        if position < self.sorted_size and self.rows[position] == row:
+            return position
+        tail = np.flatnonzero(self.rows[self.sorted_size:self.size] == row)
+        return self.sorted_size + int(tail[0]) if len(tail) else -1
+
+    def append(self, rows: np.ndarray) -> np.ndarray:
+        """Appends zeroed entries for the rows, returns the new entries"""
+
+        start, end = self.size, self.size + len(rows)
+        if end > len(self.rows):
+            capacity = max(end, 2 * len(self.rows))
+            grown = [np.zeros(capacity, dtype=array.dtype) for array in self._arrays()]
+            for array, new_array in zip(self._arrays(), grown):
+                new_array[:start] = array[:start]
+            self._set_arrays(grown)
+
+        self.rows[start:end] = rows
+        self.size = end
+        if self.sorted_size == start and (start == 0 or rows[0] > self.rows[start - 1]) and np.all(np.diff(rows) > 0):
+            self.sorted_size = end
+        elif end - self.sorted_size > _MAX_UNSORTED:
+            self._sort()
+            return np.flatnonzero(np.isin(self.rows[:self.size], rows))
+        return np.arange(start, end)
+
+    def _sort(self) -> None:
+        order = np.argsort(self.rows[:self.size], kind="stable")
+        for array in self._arrays():
+            array[:self.size] = array[:self.size][order]
+        self.sorted_size = self.size
+
+
+# pylint: disable-next=too-many-instance-attributes
+class HealthUpdater:
+    """
+    Keeps the health of many accounts up to date with the prices.
+
+    Accounts are identified by any hashable key, typically their address.
+    """
+
+    def __init__(self, instruments: Sequence[Instrument], prices: Sequence[int], use_maint: bool = True) -> None:
+        if len(instruments) > MAX_INSTRUMENTS:
+            raise ValueError(f"at most {MAX_INSTRUMENTS} instruments are supported")
+
+        self.instruments = list(instruments)
+        self.prices = list(prices)
+        self.use_maint = use_maint
+
+        self._holdings = [_Holdings() for _ in self.instruments]
+        self._rows: Dict[Hashable, int] = {}
+        self._accounts: List[Hashable] = []
+        self._health = np.zeros(16, dtype=np.int64)
+        self._unsafe_count = np.zeros(16, dtype=np.int32)
+        # Health of the accounts with unsafe terms, None when the contract health check fails
+        self._exact: Dict[int, Optional[int]] = {}
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def health(self, account: Hashable) -> Optional[int]:
+        """Returns the health of an account, None if the contract health check would fail"""
+
+        row = self._rows[account]
+        if self._unsafe_count[row]:
+            return self._exact[row]
+        return int(self._health[row])
+
+    def liquidatable(self) -> List[Hashable]:
+        """Returns the accounts with a negative health"""
+
+        rows = np.flatnonzero((self._health[:len(self._accounts)] < 0) & (self._unsafe_count[:len(self._accounts)] == 0))
+        result = [self._accounts[row] for row in rows if self._accounts[row] is not None]
+        result += [self._accounts[row] for row, health in self._exact.items() if health is not None and health < 0]
+        return result
+
+    def load(
+        self,
+        accounts: Sequence[Hashable],
+        account_ids: np.ndarray,
+        instrument_ids: np.ndarray,
+        cash: np.ndarray,
+        principal: np.ndarray,
+        slot: np.ndarray,
+    ) -> None:
+        """
+        Adds many new accounts at once from their non zero positions, given as parallel arrays.
+        account_ids refers to the position of the account in accounts.
+        """
+
+        first_row = self._add_rows(accounts)
+        rows = np.asarray(account_ids, dtype=np.int64) + first_row
+        instrument_ids = np.asarray(instrument_ids)
+        for instrument_id in range(len(self.instruments)):
+            selected = np.flatnonzero(instrument_ids == instrument_id)
+            if selected.size == 0:
+                continue
+            selected = selected[np.argsort(rows[selected], kind="stable")]
+            holdings = self._holdings[instrument_id]
+            entries = holdings.append(rows[selected])
+            holdings.cash[entries] = cash[selected]
+            holdings.principal[entries] = principal[selected]
+            holdings.slot[entries] = slot[selected]
+            self._refresh(instrument_id, entries)
+
+        self._recompute_exact(np.arange(first_row, len(self._accounts)))
+
+    def update_account(self, account: Hashable, positions: Sequence[Position]) -> None:
+        """Adds or replaces the positions of an account"""
+
+        row = self._rows.get(account)
+        if row is None:
+            row = self._add_rows([account])
+
+        for instrument_id, holdings in enumerate(self._holdings):
+            position = positions[instrument_id] if instrument_id < len(positions) else Position()
+            entry = holdings.find(row)
+            if entry < 0:
+                if not position.cash and not position.principal:
+                    continue
+                entry = int(holdings.append(np.array([row]))[0])
+            entries = np.array([entry])
+            holdings.cash[entries] = position.cash
+            holdings.principal[entries] = position.principal
+            holdings.slot[entries] = position.slot
+            self._refresh(instrument_id, entries)
+
+        self._recompute_exact(np.array([row]))
+
+    def remove_account(self, account: Hashable) -> None:
+        """Stops tracking an account"""
+
+        self.update_account(account, [])
+        row = self._rows.pop(account)
+        self._accounts[row] = None
+        self._exact.pop(row, None)
+
+    def update_prices(self, prices: Mapping[int, int]) -> None:
+        """Applies a price tick, only the holders of the moved instruments are updated"""
+
+        unsafe_rows = []
+        for instrument_id, price in prices.items():
+            self.prices[instrument_id] = price
+            holdings = self._holdings[instrument_id]
+            entries = np.arange(holdings.size)
+            self._update_terms(instrument_id, entries)
+            unsafe_rows.append(holdings.rows[:holdings.size][self._unsafe_count[holdings.rows[:holdings.size]] > 0])
+
+        if unsafe_rows:
+            self._recompute_exact(np.unique(np.concatenate(unsafe_rows)))
+
+    def update_instrument(self, instrument_id: int, instrument: Instrument) -> None:
+        """Updates an instrument, the balances of its holders are computed again"""
+
+        self.instruments[instrument_id] = instrument
+        holdings = self._holdings[instrument_id]
+        self._refresh(instrument_id, np.arange(holdings.size))
+        rows = holdings.rows[:holdings.size]
+        self._recompute_exact(rows[self._unsafe_count[rows] > 0])
+
+    def _add_rows(self, accounts: Sequence[Hashable]) -> int:
+        first_row = len(self._accounts)
+        for offset, account in enumerate(accounts):
+            assert account not in self._rows, "account already tracked"
+            self._rows[account] = first_row + offset
+        self._accounts.extend(accounts)
+
+        if len(self._accounts) > len(self._health):
+            capacity = max(len(self._accounts), 2 * len(self._health))
+            self._health = np.concatenate([self._health, np.zeros(capacity - len(self._health), dtype=np.int64)])
+            self._unsafe_count = np.concatenate([self._unsafe_count, np.zeros(capacity - len(self._unsafe_count), dtype=np.int32)])
+        return first_row
+
+    def _ratios(self, instrument: Instrument) -> Tuple[int, int]:
+        if self.use_maint:
+            return instrument.maintenance_haircut, instrument.maintenance_margin
+        return instrument.initial_haircut, instrument.initial_margin
+
+    def _refresh(self, instrument_id: int, entries: np.ndarray) -> None:
+        """Computes the balances of the entries, then their terms"""
+
+        holdings = self._holdings[instrument_id]
+        instrument = self.instruments[instrument_id]
+        haircut, margin = self._ratios(instrument)
+
+        cash = holdings.cash[entries]
+        principal = holdings.principal[entries]
+        slot = holdings.slot[entries]
+        lend = principal > 0
+        borrow = principal < 0
+        magnitude = np.abs(principal).astype(np.uint64)
+
+        # Accrued balances, see calculate_accrued_lend and calculate_accrued_borrow
+        pool_index = np.where(lend, np.uint64(instrument.lend_index), np.uint64(instrument.borrow_index))
+        accrued, failed = wide_ratio([magnitude, pool_index], slot)
+        accrued = accrued + (borrow & (accrued == magnitude)).astype(np.uint64)
+        failed &= lend | borrow
+
+        # Balance sum, the contract adds them as signed values
+        unsafe = failed | (cash >= np.uint64(SAFE_TERM)) | (accrued >= np.uint64(SAFE_TERM)) | (haircut > RATIO_ONE)
+        accrued = np.where(unsafe | ~(lend | borrow), np.uint64(0), accrued)
+        balance = cash.astype(np.int64) + np.where(borrow, -accrued.astype(np.int64), accrued.astype(np.int64))
+        negative = balance < 0
+        loaned = np.where(lend, accrued, np.uint64(0))
+
+        factor = np.where(negative, RATIO_ONE + margin, RATIO_ONE - haircut).astype(np.float64)
+        holdings.magnitude[entries] = np.abs(balance).astype(np.uint64)
+        holdings.negative[entries] = negative
+        holdings.loaned[entries] = loaned
+        holdings.balance_unsafe[entries] = unsafe
+        holdings.coefficient[entries] = np.abs(balance).astype(np.float64) * factor / (PRICECASTER_RESCALE_FACTOR * RATIO_ONE)
+        holdings.lend_coefficient[entries] = (
+            loaned.astype(np.float64) * (RATIO_ONE - haircut) * instrument.optimal_utilization
+            / (PRICECASTER_RESCALE_FACTOR * RATIO_ONE * RATIO_ONE)
+        )
+
+        self._update_terms(instrument_id, entries)
+
+    def _update_terms(self, instrument_id: int, entries: np.ndarray) -> None:
+        """Computes the terms of the entries at the current price and applies the differences"""
+
+        holdings = self._holdings[instrument_id]
+        instrument = self.instruments[instrument_id]
+        haircut, margin = self._ratios(instrument)
+        price = self.prices[instrument_id]
+        negative = holdings.negative[entries]
+
+        factor = np.where(negative, np.uint64(RATIO_ONE + margin), np.uint64(max(RATIO_ONE - haircut, 0)))
+        first, first_failed = _floor_terms(
+            float(price) * holdings.coefficient[entries],
+            lambda selected: wide_ratio(
+                [np.uint64(price), holdings.magnitude[entries][selected], factor[selected]],
+                np.uint64(PRICECASTER_RESCALE_FACTOR * RATIO_ONE),
+            ),
+        )
+        second, second_failed = _floor_terms(
+            float(price) * holdings.lend_coefficient[entries],
+            lambda selected: wide_ratio(
+                [
+                    np.uint64(price),
+                    holdings.loaned[entries][selected],
+                    np.uint64(max(RATIO_ONE - haircut, 0)),
+                    np.uint64(instrument.optimal_utilization),
+                ],
+                np.uint64(PRICECASTER_RESCALE_FACTOR * RATIO_ONE * RATIO_ONE),
+            ),
+        )
+
+        unsafe = holdings.balance_unsafe[entries] | first_failed | second_failed
+        term = np.where(negative, -first, first) - second
+        term[unsafe] = 0
+
+        rows = holdings.rows[entries]
+        self._health[rows] += term - holdings.term[entries]
+        self._unsafe_count[rows] += unsafe.astype(np.int32) - holdings.unsafe[entries].astype(np.int32)
+        holdings.term[entries] = term
+        holdings.unsafe[entries] = unsafe
+
+    def _recompute_exact(self, rows: np.ndarray) -> None:
+        """Computes the health of the accounts with unsafe terms with the exact mirror"""
+
+        for row in rows[self._unsafe_count[rows] > 0] if len(rows) else []:
+            row = int(row)
+            positions = []
+            for holdings in self._holdings:
+                entry = holdings.find(row)
+                if entry < 0:
+                    positions.append(Position())
+                else:
+                    positions.append(Position(int(holdings.cash[entry]), int(holdings.principal[entry]), int(holdings.slot[entry])))
+            try:
+                self._exact[row] = health_check(positions, self.instruments, self.prices, self.use_maint)
+            except AvmError:
+                self._exact[row] = None
+
+        for row in rows[self._unsafe_count[rows] == 0] if len(rows) else []:
+            self._exact.pop(int(row), None)
+
+
+def _floor_terms(
+    estimates: np.ndarray,
+    exact: Callable[[np.ndarray], Tuple[np.ndarray, np.ndarray]],
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Returns the floor of the estimated terms as int64 and a mask of the unsafe terms.
+    The terms whose floor can not be certified from the estimate are computed with exact(selected).
+    """
+
+    low = np.floor(estimates * (1 - _FLOAT_ERROR))
+    high = np.floor(estimates * (1 + _FLOAT_ERROR))
+    result = np.minimum(high, SAFE_TERM).astype(np.int64)
+    unsafe = high >= SAFE_TERM
+
+    uncertain = np.flatnonzero((low != high) & ~unsafe)
+    if len(uncertain):
+        value, failed = exact(uncertain)
+        unsafe[uncertain] = failed | (value >= np.uint64(SAFE_TERM))
+        result[uncertain] = np.minimum(value, np.uint64(SAFE_TERM)).astype(np.int64)
+
+    return result, unsafe
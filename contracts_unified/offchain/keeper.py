@@ -0,0 +1,282 @@
+"""
+Keeper cleaning the expired orders of the Core contract order book.
+
+Expired orders are found in a mirror of the order boxes, or tracked from the user operations of the
+add_order and settle calls. They are cleaned with clean_orders_by_id calls packed up to the limits of
+an application call and of a group. Calls go through a CleanupClient, AlgodCleanupClient submits them
+to a node and LocalCleanupClient stands in for the contract in tests.
+"""
+
+import heapq
+import struct
+from typing import (
+    Dict,
+    Iterable,
+    List,
+    Mapping,
+    NamedTuple,
+    Optional,
+    Protocol,
+    Sequence,
+    Tuple,
+)
+
+from contracts_unified.offchain.avm import check
+from contracts_unified.offchain.orders import ORDER_ID_SIZE, ORDER_PREFIX, get_order_id
+from contracts_unified.offchain.state import LEGACY_ORDER_SIZE
+
+CLEAN_ORDERS_BY_ID_SIGNATURE = "clean_orders_by_id(byte[37][])void"
+
+# Index of the user operation in the arguments of add_order and the settle methods
+ARG_INDEX_OP = 2
+# Offset of the operation offset in an encoded OperationMetaData, after the signed header
+_OPERATION_OFFSET = 72
+# Offset of the expiration in an encoded OrderData, after the operation, account and nonce
+_ORDER_EXPIRATION_OFFSET = 41
+
+_UINT16 = struct.Struct(">H")
+_UINT64 = struct.Struct(">Q")
+
+# Method selector and array length
+_CALL_OVERHEAD = 4 + 2
+
+Call = Sequence[bytes]
+Group = Sequence[Call]
+
+
+class TransactionLimits(NamedTuple):
+    """Limits of an application call and of a group, with the measured costs of clean_orders_by_id"""
+
+    max_args_size: int = 2048
+    max_references: int = 8
+    max_group_size: int = 16
+    opcode_budget: int = 700
+    # Method dispatch and argument decoding
+    call_cost: int = 200
+    # One iteration of the clean loop, including delete_expired_order
+    order_cost: int = 40
+
+    def orders_per_call(self) -> int:
+        """Largest number of orders cleaned by one call, every order box needs its own reference"""
+
+        by_args = (self.max_args_size - _CALL_OVERHEAD) // ORDER_ID_SIZE
+        by_budget = (self.opcode_budget - self.call_cost) // self.order_cost
+        return max(0, min(by_args, self.max_references, by_budget))
+
+
+class CleanupClient(Protocol):
+    """Submits clean_orders_by_id calls, each call lists its order IDs and references their boxes"""
+
+    def latest_timestamp(self) -> int:
+        """Timestamp of the latest block, orders expiring before it can be cleaned"""
+
+    def submit(self, group: Group) -> None:
+        """Submits one group of calls, raising if it fails"""
+
+
+def is_order_id(key: bytes) -> bool:
+    """Checks a box key is an order ID"""
+    return len(key) == ORDER_ID_SIZE and key.startswith(ORDER_PREFIX)
+
+
+def get_expiration(box: bytes) -> Optional[int]:
+    """
+    Gets the expiration of an order box, open or fully filled. The boxes of the previous layout do not
+    hold it and delete_expired_order keeps them, None is returned for them.
+    """
+
+    if len(box) == LEGACY_ORDER_SIZE:
+        return None
+    return _UINT64.unpack_from(box)[0]
+
+
+def is_expired(box: bytes, timestamp: int) -> bool:
+    """Checks delete_expired_order would delete an order box at timestamp"""
+
+    expiration = get_expiration(box)
+    return expiration is not None and timestamp > expiration
+
+
+def expired_order_ids(boxes: Mapping[bytes, bytes], timestamp: int) -> List[bytes]:
+    """Returns the IDs of the expired orders among the boxes of the contract"""
+
+    return [
+        key for key, box in boxes.items()
+        if is_order_id(key) and is_expired(box, timestamp)
+    ]
+
+
+def get_call_order(app_args: Sequence[bytes]) -> Tuple[bytes, int]:
+    """
+    Returns the ID and expiration of the order of an add_order or settle call, from its arguments.
+    The call may not create the order if it already exists, tracking it again is harmless.
+    """
+
+    user_op = app_args[ARG_INDEX_OP]
+    offset = _UINT16.unpack_from(user_op, _OPERATION_OFFSET)[0]
+    length = _UINT16.unpack_from(user_op, offset)[0]
+    order = user_op[offset + 2:offset + 2 + length]
+    return get_order_id(order), _UINT64.unpack_from(order, _ORDER_EXPIRATION_OFFSET)[0]
+
+
+def pack_calls(order_ids: Iterable[bytes], limits: TransactionLimits = TransactionLimits()) -> List[List[List[bytes]]]:
+    """
+    Packs the orders into groups of clean_orders_by_id calls.
+
+    Calls are filled to orders_per_call and groups to max_group_size, which gives the fewest transactions
+    as every order box takes one of the references of its call.
+    """
+
+    per_call = limits.orders_per_call()
+    check(per_call > 0, "no order fits in a call")
+
+    order_ids = list(order_ids)
+    calls = [order_ids[start:start + per_call] for start in range(0, len(order_ids), per_call)]
+    return [calls[start:start + limits.max_group_size] for start in range(0, len(calls), limits.max_group_size)]
+
+
+class OrderKeeper:
+    """Tracks the orders of the book by expiration and cleans the expired ones"""
+
+    def __init__(self, client: CleanupClient, limits: TransactionLimits = TransactionLimits()) -> None:
+        self.client = client
+        self.limits = limits
+        # (expiration, order ID), duplicates are removed when popped
+        self._orders: List[Tuple[int, bytes]] = []
+
+    def track(self, order_id: bytes, expiration: int) -> None:
+        """Tracks an order of the book"""
+        heapq.heappush(self._orders, (expiration, order_id))
+
+    def track_call(self, app_args: Sequence[bytes]) -> None:
+        """Tracks the order of an add_order or settle call"""
+        order_id, expiration = get_call_order(app_args)
+        self.track(order_id, expiration)
+
+    def track_boxes(self, boxes: Mapping[bytes, bytes]) -> None:
+        """Tracks all the orders of a mirror of the contract boxes, the ones that can not be cleaned are skipped"""
+        for key, box in boxes.items():
+            expiration = get_expiration(box)
+            if is_order_id(key) and expiration is not None:
+                self.track(key, expiration)
+
+    def _pop_expired(self, timestamp: int) -> Dict[bytes, int]:
+        """Removes the orders expired at timestamp from the tracked ones, returns their expirations by ID"""
+
+        expired: Dict[bytes, int] = {}
+        while self._orders and timestamp > self._orders[0][0]:
+            expiration, order_id = heapq.heappop(self._orders)
+            expired[order_id] = expiration
+        return expired
+
+    def pop_expired(self, timestamp: int) -> List[bytes]:
+        """Removes the orders expired at timestamp from the tracked ones and returns them"""
+        return list(self._pop_expired(timestamp))
+
+    def clean(self, order_ids: Iterable[bytes]) -> int:
+        """Cleans the given orders, returns the number of submitted groups"""
+
+        groups = pack_calls(order_ids, self.limits)
+        for group in groups:
+            self.client.submit(group)
+        return len(groups)
+
+    def run_once(self, timestamp: Optional[int] = None) -> int:
+        """
+        Cleans every tracked order expired at the latest block, returns the number of orders cleaned.
+        If a group fails, its orders and the ones of the following groups are tracked again before raising.
+        """
+
+        if timestamp is None:
+            timestamp = self.client.latest_timestamp()
+        expired = self._pop_expired(timestamp)
+        groups = pack_calls(expired, self.limits)
+        cleaned = 0
+        for group in groups:
+            try:
+                self.client.submit(group)
+            except Exception:
+                # Groups are packed in order, the orders from the failed group on were not cleaned
+                for order_id in list(expired)[cleaned:]:
+                    self.track(order_id, expired[order_id])
+                raise
+            cleaned += sum(len(call) for call in group)
+        return cleaned
+
+
+class LocalCleanupClient:
+    """
+    Stands in for the Core contract, applying clean_orders_by_id to a mirror of its boxes
+    after validating the calls against the limits like the network would
+    """
+
+    def __init__(self, boxes: Dict[bytes, bytes], timestamp: int, limits: TransactionLimits = TransactionLimits()) -> None:
+        self.boxes = boxes
+        self.timestamp = timestamp
+        self.limits = limits
+        self.groups = 0
+        self.calls = 0
+
+    def latest_timestamp(self) -> int:
+        """Timestamp of the mirrored boxes"""
+        return self.timestamp
+
+    def submit(self, group: Group) -> None:
+        """Validates the group against the limits, then deletes the expired boxes it references"""
+
+        limits = self.limits
+        check(0 < len(group) <= limits.max_group_size, "group size")
+        cost = 0
+        for call in group:
+            check(_CALL_OVERHEAD + len(call) * ORDER_ID_SIZE <= limits.max_args_size, "arguments size")
+            check(len(call) <= limits.max_references, "references")
+            check(all(len(order_id) == ORDER_ID_SIZE for order_id in call), "order ID size")
+            cost += limits.call_cost + len(call) * limits.order_cost
+        check(cost <= len(group) * limits.opcode_budget, "opcode budget")
+
+        for call in group:
+            for order_id in call:
+                box = self.boxes.get(order_id)
+                if box is not None and is_expired(box, self.timestamp):
+                    del self.boxes[order_id]
+        self.groups += 1
+        self.calls += len(group)
+
+
+class AlgodCleanupClient:
+    """Submits the calls to an algod node"""
+
+    def __init__(self, algod, app_id: int, sender: str, signer) -> None:
+        # pylint: disable=import-outside-toplevel
+        from algosdk.abi import Method
+
+        self.algod = algod
+        self.app_id = app_id
+        self.sender = sender
+        self.signer = signer
+        self.method = Method.from_signature(CLEAN_ORDERS_BY_ID_SIGNATURE)
+
+    def latest_timestamp(self) -> int:
+        """Timestamp of the last round of the node"""
+        last_round = self.algod.status()["last-round"]
+        return self.algod.block_info(last_round)["block"]["ts"]
+
+    def submit(self, group: Group) -> None:
+        """Submits the group as an atomic transaction group and waits for its confirmation"""
+
+        # pylint: disable=import-outside-toplevel
+        from algosdk.atomic_transaction_composer import AtomicTransactionComposer
+
+        composer = AtomicTransactionComposer()
+        params = self.algod.suggested_params()
+        for call in group:
+            composer.add_method_call(
+                app_id=self.app_id,
+                method=self.method,
+                sender=self.sender,
+                sp=params,
+                signer=self.signer,
+                method_args=[list(call)],
+                boxes=[(0, order_id) for order_id in call],
+            )
+        composer.execute(self.algod, 4)
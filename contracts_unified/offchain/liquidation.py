@@ -0,0 +1,353 @@
+"""
+Mirror of the Core contract liquidation and an optimizer for the liquidation baskets.
+
+The baskets follow the LiquidationData conventions: they hold what the liquidator takes from
+the liquidatee, cash amounts are positive, and pool amounts must be closer to zero than the
+liquidatee principal.
+"""
+
+from typing import List, NamedTuple, Optional, Sequence, Tuple
+
+from contracts_unified.library.constants import PRICECASTER_RESCALE_FACTOR, RATIO_ONE
+from contracts_unified.offchain.avm import (
+    AvmError,
+    add,
+    check,
+    signed_abs,
+    signed_add,
+    signed_gte,
+    signed_ltz,
+    signed_neg,
+    sub,
+    to_signed,
+    u64,
+    unsigned_min,
+    wide_ratio,
+)
+from contracts_unified.offchain.health import health_check
+from contracts_unified.offchain.lp import maximize
+from contracts_unified.offchain.pool import accrue_instrument, transfer_position
+from contracts_unified.offchain.state import (
+    Instrument,
+    LiquidationFactors,
+    Position,
+    get_position,
+    set_position,
+)
+
+# A basket is a list of (instrument id, signed amount)
+Basket = List[Tuple[int, int]]
+
+# Penalty applied to the liabilities given to the liquidator so the optimizer does not take more than needed
+_GIVE_PENALTY = 1e-9
+
+
+class LiquidationSnapshot(NamedTuple):
+    """Everything the liquidation of an account depends on"""
+
+    positions: Sequence[Position]
+    instruments: Sequence[Instrument]
+    prices: Sequence[int]
+    factors: LiquidationFactors
+    # Relative timestamp, as used to accrue the pools during netting
+    timestamp: int
+
+
+class LiquidationResult(NamedTuple):
+    """Outcome of a liquidation as performed by the contract"""
+
+    # Baskets as signed in the LiquidationData
+    cash: Basket
+    pool: Basket
+    # Baskets actually moved after the alpha scaling
+    scaled_cash: Basket
+    scaled_pool: Basket
+    alpha_numerator: int
+    alpha_denominator: int
+    # Liquidatee state after the liquidation
+    positions: List[Position]
+    instruments: List[Instrument]
+
+
+def calculate_basket_value(
+    basket: Basket,
+    instruments: Sequence[Instrument],
+    prices: Sequence[int],
+    add_negatives: bool,
+    factor: int,
+    use_bonus: bool,
+    invert_bonus_or_use_margin: bool,
+    use_opt_utilization: bool,
+) -> int:
+    """Calculate the value of a basket either using the bonus or hair cut/margin"""
+
+    output = 0
+    for instrument_id, signed_amount in basket:
+        amount = u64(signed_amount)
+        if signed_ltz(amount) != add_negatives:
+            continue
+
+        price = prices[instrument_id]
+        instrument = instruments[instrument_id]
+
+        if use_bonus:
+            # bonus = 1 + factor * haircut
+            bonus = add(RATIO_ONE, wide_ratio([factor, instrument.maintenance_haircut], [RATIO_ONE]))
+            if invert_bonus_or_use_margin:
+                value = wide_ratio([signed_abs(amount), price, RATIO_ONE], [bonus, PRICECASTER_RESCALE_FACTOR])
+            else:
+                value = wide_ratio([signed_abs(amount), price, bonus], [RATIO_ONE * PRICECASTER_RESCALE_FACTOR])
+        else:
+            if invert_bonus_or_use_margin:
+                margin_or_haircut = RATIO_ONE + instrument.initial_margin
+            else:
+                margin_or_haircut = sub(RATIO_ONE, instrument.initial_haircut)
+            check(margin_or_haircut < 2**16, "uint16 overflow")
+            if use_opt_utilization:
+                optimal_utilization = sub(RATIO_ONE, instrument.optimal_utilization)
+            else:
+                optimal_utilization = RATIO_ONE
+            value = wide_ratio(
+                [signed_abs(amount), price, margin_or_haircut, optimal_utilization],
+                [RATIO_ONE * RATIO_ONE * PRICECASTER_RESCALE_FACTOR],
+            )
+
+        output = add(output, value)
+
+    return output
+
+
+def scale_basket(basket: Basket, numerator: int, denominator: int) -> Basket:
+    """Scale the value of basket by some wide ratio"""
+
+    result = []
+    for instrument_id, signed_amount in basket:
+        amount = u64(signed_amount)
+        if signed_ltz(amount):
+            scaled = signed_neg(wide_ratio([signed_neg(amount), numerator], [denominator]))
+        else:
+            scaled = wide_ratio([amount, numerator], [denominator])
+        result.append((instrument_id, to_signed(scaled)))
+    return result
+
+
+def closer_to_zero(positions: Sequence[Position], pool_basket: Basket) -> None:
+    """Ensure that the basket amounts are closer to zero than the account pool balance"""
+
+    for instrument_id, signed_amount in pool_basket:
+        amount = u64(signed_amount)
+        balance = u64(get_position(positions, instrument_id).principal)
+        if signed_ltz(balance):
+            check((signed_ltz(amount) or amount == 0) and signed_gte(amount, balance), "pool basket not closer to zero")
+        else:
+            check(not signed_ltz(amount) and signed_gte(balance, amount), "pool basket not closer to zero")
+
+
+def perform_netting(
+    positions: Sequence[Position],
+    instruments: Sequence[Instrument],
+    timestamp: int,
+) -> Tuple[List[Position], List[Instrument]]:
+    """Performs netting on the liquidatee account, returning its positions and the instruments afterwards"""
+
+    positions = list(positions)
+    instruments = list(instruments)
+    for instrument_id in range(min(len(positions), len(instruments))):
+        position = positions[instrument_id]
+        if position.principal == 0:
+            continue
+
+        # Repay the minimum of the the amount possessed or the amount owed
+        if position.principal < 0:
+            repay_amount = unsigned_min(position.cash, -position.principal)
+        else:
+            repay_amount = 0
+
+        # The liquidator position is only capitalized, which leaves the instrument as it is
+        instrument = accrue_instrument(instruments[instrument_id], timestamp)
+        instruments[instrument_id], positions[instrument_id] = transfer_position(instrument, position, repay_amount)
+
+    return positions, instruments
+
+
+def _move_baskets(positions: Sequence[Position], cash: Basket, pool: Basket) -> List[Position]:
+    """Removes the moved baskets from the liquidatee positions"""
+
+    result = list(positions)
+    for instrument_id, amount in cash:
+        check(amount >= 0, "negative cash amount")
+        position = get_position(result, instrument_id)
+        new_cash = to_signed(signed_add(position.cash, signed_neg(u64(amount))))
+        check(new_cash >= 0, "negative user cash")
+        result = set_position(result, instrument_id, position._replace(cash=new_cash))
+    for instrument_id, amount in pool:
+        position = get_position(result, instrument_id)
+        principal = to_signed(signed_add(u64(position.principal), signed_neg(u64(amount))))
+        result = set_position(result, instrument_id, position._replace(principal=principal))
+    return result
+
+
+def simulate_liquidation(snapshot: LiquidationSnapshot, cash: Basket, pool: Basket) -> LiquidationResult:
+    """
+    Mirrors perform_liquidation for the liquidatee side, raising AvmError where the contract would fail.
+    NOTE: The liquidator health check is not part of this, it depends on the liquidator positions.
+    """
+
+    instruments, prices, factors = snapshot.instruments, snapshot.prices, snapshot.factors
+
+    # Validate liquidatee is liquidatable
+    check(health_check(snapshot.positions, instruments, prices, True) < 0, "account is not liquidatable")
+
+    # Perform netting on liquidatee account
+    positions, instruments = perform_netting(snapshot.positions, instruments, snapshot.timestamp)
+
+    # Check the closer-to-zero condition for the pool basket
+    closer_to_zero(positions, pool)
+
+    # Check the basket values inequality
+    cash_factor, pool_factor = factors.cash_liquidation_factor, factors.pool_liquidation_factor
+    cash_take_value = calculate_basket_value(cash, instruments, prices, False, cash_factor, True, True, False)
+    pool_take_value = calculate_basket_value(pool, instruments, prices, False, pool_factor, True, True, False)
+    pool_give_value = calculate_basket_value(pool, instruments, prices, True, cash_factor, True, False, False)
+    check(add(cash_take_value, pool_take_value) <= pool_give_value, "baskets take more than they give")
+
+    # Calculate alpha
+    alpha_numerator = u64(health_check(positions, instruments, prices, False))
+    cash_take_value = calculate_basket_value(cash, instruments, prices, False, 0, False, False, False)
+    pool_take_value = calculate_basket_value(pool, instruments, prices, False, 0, False, False, True)
+    pool_give_value = calculate_basket_value(pool, instruments, prices, True, 0, False, True, False)
+    alpha_denominator = sub(pool_give_value, add(cash_take_value, pool_take_value))
+
+    # Clamp alpha to be between 0 and 1
+    alpha_numerator = min(signed_abs(alpha_numerator), alpha_denominator)
+
+    # Scale the baskets and move them
+    scaled_cash = scale_basket(cash, alpha_numerator, alpha_denominator)
+    scaled_pool = scale_basket(pool, alpha_numerator, alpha_denominator)
+    positions = _move_baskets(positions, scaled_cash, scaled_pool)
+
+    return LiquidationResult(
+        list(cash), list(pool), scaled_cash, scaled_pool, alpha_numerator, alpha_denominator, positions, instruments,
+    )
+
+
+def _bonus(factor: int, instrument: Instrument) -> int:
+    return RATIO_ONE + factor * instrument.maintenance_haircut // RATIO_ONE
+
+
+def _basket_variables(
+    positions: Sequence[Position],
+    instruments: Sequence[Instrument],
+    prices: Sequence[int],
+    factors: LiquidationFactors,
+) -> Tuple[List[Tuple[str, int, int]], List[float], List[float], List[float]]:
+    """
+    Builds one LP variable per possible basket entry as (basket, instrument id, upper bound), with
+    its objective, basket value inequality and alpha denominator coefficients
+    """
+
+    variables: List[Tuple[str, int, int]] = []
+    objective: List[float] = []
+    budget: List[float] = []
+    denominator: List[float] = []
+    scale = float(PRICECASTER_RESCALE_FACTOR)
+    for instrument_id, position in enumerate(positions[:len(instruments)]):
+        instrument = instruments[instrument_id]
+        value = prices[instrument_id] / scale
+        haircut = (RATIO_ONE - instrument.initial_haircut) / RATIO_ONE
+        if position.cash > 0:
+            bonus = _bonus(factors.cash_liquidation_factor, instrument) / RATIO_ONE
+            variables.append(("cash", instrument_id, position.cash))
+            objective.append(value * position.cash)
+            budget.append(value * bonus * position.cash)
+            denominator.append(-value * haircut * position.cash)
+        if position.principal > 0:
+            bonus = _bonus(factors.pool_liquidation_factor, instrument) / RATIO_ONE
+            utilization = (RATIO_ONE - instrument.optimal_utilization) / RATIO_ONE
+            variables.append(("pool", instrument_id, position.principal))
+            objective.append(value * position.principal)
+            budget.append(value * bonus * position.principal)
+            denominator.append(-value * haircut * utilization * position.principal)
+        elif position.principal < 0:
+            bonus = _bonus(factors.cash_liquidation_factor, instrument) / RATIO_ONE
+            margin = (RATIO_ONE + instrument.initial_margin) / RATIO_ONE
+            owed = -position.principal
+            variables.append(("pool", instrument_id, -owed))
+            objective.append(-_GIVE_PENALTY * value * owed)
+            budget.append(-value / bonus * owed)
+            denominator.append(value * margin * owed)
+
+    return variables, objective, budget, denominator
+
+
+def optimize_liquidation(snapshot: LiquidationSnapshot) -> Optional[LiquidationResult]:
+    """
+    Finds the baskets that maximize the market value of the assets seized by the liquidator,
+    after the alpha scaling, while passing every check the contract performs.
+
+    Because the contract scales the baskets down until they restore the liquidatee initial health,
+    this is the linear program of maximizing the assets taken subject to the basket value inequality
+    and to the alpha denominator not exceeding the liquidatee initial health. The LP solution is then
+    rounded and validated against the bit-exact mirror.
+
+    Returns None if the account can not be liquidated.
+    """
+
+    instruments, prices, factors = snapshot.instruments, snapshot.prices, snapshot.factors
+
+    try:
+        if health_check(snapshot.positions, instruments, prices, True) >= 0:
+            return None
+        positions, netted_instruments = perform_netting(snapshot.positions, instruments, snapshot.timestamp)
+        target_health = abs(health_check(positions, netted_instruments, prices, False))
+    except AvmError:
+        return None
+
+    variables, objective, budget, denominator = _basket_variables(positions, netted_instruments, prices, factors)
+    if not variables:
+        return None
+
+    # Normalize the problem so that each variable is the fraction of its bound
+    normalization = max(abs(coefficient) for coefficient in objective + budget + denominator) or 1.0
+    fractions = maximize(
+        [c / normalization for c in objective],
+        [[c / normalization for c in budget], [c / normalization for c in denominator]],
+        [0.0, target_health / normalization],
+        [1.0] * len(variables),
+    )
+
+    cash: Basket = []
+    pool: Basket = []
+    for (basket, instrument_id, bound), fraction in zip(variables, fractions):
+        amount = int(fraction * bound)
+        if amount:
+            (cash if basket == "cash" else pool).append((instrument_id, amount))
+
+    # Rounding may break the inequality, shrink the take until the contract accepts it
+    while True:
+        take = (
+            calculate_basket_value(cash, netted_instruments, prices, False, factors.cash_liquidation_factor, True, True, False)
+            + calculate_basket_value(pool, netted_instruments, prices, False, factors.pool_liquidation_factor, True, True, False)
+        )
+        give = calculate_basket_value(pool, netted_instruments, prices, True, factors.cash_liquidation_factor, True, False, False)
+        if take <= give:
+            break
+        ratio = give / take
+        shrunk_cash = [(i, min(a - 1, int(a * ratio))) for i, a in cash]
+        shrunk_pool = [(i, min(a - 1, int(a * ratio)) if a > 0 else a) for i, a in pool]
+        cash = [(i, a) for i, a in shrunk_cash if a > 0]
+        pool = [(i, a) for i, a in shrunk_pool if a != 0]
+
+    if not any(amount > 0 for _, amount in cash + pool):
+        return None
+
+    try:
+        return simulate_liquidation(snapshot, cash, pool)
+    except AvmError:
+        return None
+
+
+def optimize_liquidations(snapshots: Sequence[LiquidationSnapshot]) -> List[Optional[LiquidationResult]]:
+    """Runs the optimizer over a list of accounts, typically all the candidates of a price tick"""
+
+    return [optimize_liquidation(snapshot) for snapshot in snapshots]
@@ -0,0 +1,146 @@
+"""
+A small dense bounded-variable simplex, used by the off-chain solvers.
+
+The problems solved here have a handful of coupling constraints and one variable per
+instrument, so a textbook implementation with Bland's rule is plenty.
+"""
+
+from typing import List, Sequence, Tuple
+
+EPSILON = 1e-12
+
+
+def _solve(matrix: List[List[float]], rhs: List[float]) -> List[float]:
+    """Solves a small square linear system with partial pivoting"""
+
+    size = len(rhs)
+    rows = [list(row) + [value] for row, value in zip(matrix, rhs)]
+    for column in range(size):
+        magnitudes = [abs(row[column]) for row in rows]
+        pivot = max(range(column, size), key=magnitudes.__getitem__)
+        if magnitudes[pivot] < EPSILON:
+            raise ZeroDivisionError("singular basis")
+        rows[column], rows[pivot] = rows[pivot], rows[column]
+        for row in range(size):
+            if row != column:
+                factor = rows[row][column] / rows[column][column]
+                if factor:
+                    rows[row] = [value - factor * pivot_value for value, pivot_value in zip(rows[row], rows[column])]
+    return [rows[i][size] / rows[i][i] for i in range(size)]
+
+
+def _entering(
+    costs: Sequence[float],
+    duals: Sequence[float],
+    columns: Sequence[Sequence[float]],
+    basis: Sequence[int],
+    at_upper: Sequence[bool],
+    uppers: Sequence[float],
+) -> Tuple[int, float]:
+    """Picks the first variable improving the objective by Bland's rule, and its direction, or -1 at the optimum"""
+
+    for variable, column in enumerate(columns):
+        if variable in basis:
+            continue
+        reduced = costs[variable] - sum(dual * coefficient for dual, coefficient in zip(duals, column))
+        if not at_upper[variable] and reduced > EPSILON and uppers[variable] > 0:
+            return variable, 1.0
+        if at_upper[variable] and reduced < -EPSILON:
+            return variable, -1.0
+    return -1, 0.0
+
+
+def _ratio_test(
+    values: Sequence[float],
+    change: Sequence[float],
+    direction: float,
+    basis: Sequence[int],
+    uppers: Sequence[float],
+    step: float,
+) -> Tuple[float, int, bool]:
+    """
+    Finds how far the entering variable moves before a basic variable reaches a bound, starting from step.
+    Returns the step, the position in the basis of the leaving variable or -1, and whether it leaves at its upper bound.
+    """
+
+    leaving = -1
+    leaving_to_upper = False
+    for position, variable in enumerate(basis):
+        rate = direction * change[position]
+        if rate > EPSILON:
+            limit = values[position] / rate
+            if limit < step:
+                step, leaving, leaving_to_upper = limit, position, False
+        elif rate < -EPSILON and uppers[variable] != float("inf"):
+            limit = (uppers[variable] - values[position]) / -rate
+            if limit < step:
+                step, leaving, leaving_to_upper = limit, position, True
+    return step, leaving, leaving_to_upper
+
+
+def maximize(
+    objective: Sequence[float],
+    constraints: Sequence[Sequence[float]],
+    limits: Sequence[float],
+    upper_bounds: Sequence[float],
+) -> List[float]:
+    """
+    Maximizes objective . x subject to constraints . x <= limits and 0 <= x <= upper_bounds.
+
+    The limits must be non-negative so that x = 0 is feasible.
+    Returns the optimal x.
+    """
+
+    count = len(objective)
+    size = len(limits)
+    if any(limit < 0 for limit in limits):
+        raise ValueError("negative limit")
+
+    # Slack variables complete the columns, one per constraint
+    columns = [[constraints[r][j] for r in range(size)] for j in range(count)]
+    columns += [[1.0 if r == s else 0.0 for r in range(size)] for s in range(size)]
+    costs = list(objective) + [0.0] * size
+    uppers = list(upper_bounds) + [float("inf")] * size
+
+    basis = list(range(count, count + size))
+    at_upper = [False] * (count + size)
+
+    def basic_values() -> List[float]:
+        remaining = list(limits)
+        for j in range(count + size):
+            if at_upper[j] and j not in basis:
+                remaining = [value - uppers[j] * coefficient for value, coefficient in zip(remaining, columns[j])]
+        matrix = [[columns[variable][r] for variable in basis] for r in range(size)]
+        return _solve(matrix, remaining)
+
+    # NOTE: Bland's rule guarantees termination, the iteration cap is only a safety net
+    for _ in range(50 * (count + size)):
+        values = basic_values()
+        transposed = [[columns[variable][r] for r in range(size)] for variable in basis]
+        duals = _solve(transposed, [costs[variable] for variable in basis])
+
+        entering, direction = _entering(costs, duals, columns, basis, at_upper, uppers)
+        if entering < 0:
+            break
+
+        matrix = [[columns[variable][r] for variable in basis] for r in range(size)]
+        change = _solve(matrix, columns[entering])
+
+        # Ratio test, starting with the entering variable reaching its other bound
+        step, leaving, leaving_to_upper = _ratio_test(values, change, direction, basis, uppers, uppers[entering])
+        if step == float("inf"):
+            raise ValueError("unbounded problem")
+
+        if leaving < 0:
+            at_upper[entering] = not at_upper[entering]
+        else:
+            at_upper[basis[leaving]] = leaving_to_upper
+            at_upper[entering] = False
+            basis[leaving] = entering
+
+    values = basic_values()
+    result = [uppers[j] if at_upper[j] else 0.0 for j in range(count)]
+    for position, variable in enumerate(basis):
+        if variable < count:
+            result[variable] = min(max(values[position], 0.0), uppers[variable])
+    return result
@@ -0,0 +1,274 @@
+"""
+Price-time priority matching engine emitting fills the Core contract settle methods accept.
+
+An incoming order is the buyer of its fills, as the order passed to settle, and the resting orders it
+matches are the sellers. Fills are priced at the seller's price, the buyer sends buyer_to_send of its
+sell instrument and receives seller_to_send of its buy instrument. Every fill passes the checks of
+validate_fill: the orders cross, the swap is fair for both sides, the fees are capped by
+MAX_FEES_DIVISOR and the amounts fit the remaining amounts of both orders. Account health is not
+checked, max_fill finds the largest fill a pair of accounts can afford.
+
+Orders are kept in arrays indexed by slot, each book is a heap of slots by price and arrival.
+"""
+
+import heapq
+from math import gcd
+from typing import Dict, List, NamedTuple, Optional, Protocol, Tuple
+
+from contracts_unified.library.constants import MAX_FEES_DIVISOR
+from contracts_unified.offchain.avm import check
+from contracts_unified.offchain.fill import OrderSide, SettleAmounts, validate_fill
+from contracts_unified.offchain.orders import SETTLE_OPERATION, Order, get_order_id
+
+# Shift of the price keys, two different prices of 64 bits amounts always have different keys
+_PRICE_SHIFT = 128
+
+
+class FundingPolicy(Protocol):
+    """Decides how much of a fill each account borrows and repays, the engine caps it to what settle accepts"""
+
+    def borrow(self, account: bytes, instrument_id: int, amount: int) -> int:
+        """Amount to borrow to send amount of an instrument, fees included"""
+
+    def repay(self, account: bytes, instrument_id: int, amount: int) -> int:
+        """Amount to repay out of amount received of an instrument"""
+
+
+class NoFunding:
+    """Fills are paid with cash only"""
+
+    def borrow(self, _account: bytes, _instrument_id: int, _amount: int) -> int:
+        """Never borrows"""
+        return 0
+
+    def repay(self, _account: bytes, _instrument_id: int, _amount: int) -> int:
+        """Never repays"""
+        return 0
+
+
+class SettleCall(NamedTuple):
+    """
+    A fill to submit, as an add_order of the seller followed by settle. When the seller is already in
+    the order book the add_order keeps its remaining amounts, so several fills of a resting order can
+    be submitted in one group.
+    """
+
+    buyer: Order
+    buyer_id: bytes
+    seller: Order
+    seller_id: bytes
+    seller_in_book: bool
+    amounts: SettleAmounts
+
+
+def _price_key(order: Order) -> int:
+    """Orders the prices asked by sellers, buy amount per sell amount, exactly"""
+    return (order.buy_amount << _PRICE_SHIFT) // order.sell_amount
+
+
+def _ceil_div(numerator: int, denominator: int) -> int:
+    return -(-numerator // denominator)
+
+
+# pylint: disable-next=too-many-instance-attributes
+class MatchingEngine:
+    """
+    Matches incoming orders against the resting ones.
+
+    buyer_fee, seller_fee: fees as (numerator, denominator) of buyer_to_send, capped by the contract maximum
+    funding: the borrow and repay policy, cash only by default
+    verify: check every fill with validate_fill
+    """
+
+    def __init__(
+        self,
+        buyer_fee: Tuple[int, int] = (0, 1),
+        seller_fee: Tuple[int, int] = (0, 1),
+        funding: Optional[FundingPolicy] = None,
+        verify: bool = False,
+    ) -> None:
+        self.buyer_fee = buyer_fee
+        self.seller_fee = seller_fee
+        self.funding: FundingPolicy = funding or NoFunding()
+        self.verify = verify
+
+        # Orders by slot
+        self._orders: List[Order] = []
+        self._ids: List[bytes] = []
+        self._sell_remaining: List[int] = []
+        self._borrow_remaining: List[int] = []
+        self._repay_remaining: List[int] = []
+        self._in_book: List[bool] = []
+
+        self._slots: Dict[bytes, int] = {}
+        # (price key, arrival, slot) by (sell instrument, buy instrument)
+        self._books: Dict[Tuple[int, int], List[Tuple[int, int, int]]] = {}
+
+    def remaining(self, order_id: bytes) -> Tuple[int, int, int]:
+        """Remaining sell, borrow and repay amounts of an order, as in its order box"""
+
+        slot = self._slots[order_id]
+        return self._sell_remaining[slot], self._borrow_remaining[slot], self._repay_remaining[slot]
+
+    def cancel(self, order_id: bytes) -> None:
+        """Stops matching an order, it stays in the contract order book until it expires"""
+        self._sell_remaining[self._slots[order_id]] = 0
+
+    def best(self, sell_instrument: int, buy_instrument: int, timestamp: int) -> Optional[Order]:
+        """Best resting order selling an instrument for another one"""
+
+        book = self._books.get((sell_instrument, buy_instrument))
+        if not book or not self._top(book, timestamp):
+            return None
+        return self._orders[book[0][2]]
+
+    def submit(self, order: Order, timestamp: int, order_id: Optional[bytes] = None) -> List[SettleCall]:
+        """
+        Matches an order against the book at a block timestamp and returns its fills, any remaining
+        amount rests in the book. Orders already submitted are ignored, like add_order does.
+        """
+
+        check(order.operation == SETTLE_OPERATION, "not a settle order")
+        if order_id is None:
+            order_id = get_order_id(order.encode())
+        if order_id in self._slots:
+            return []
+
+        slot = len(self._orders)
+        self._slots[order_id] = slot
+        self._orders.append(order)
+        self._ids.append(order_id)
+        self._sell_remaining.append(order.sell_amount)
+        self._borrow_remaining.append(order.max_borrow_amount)
+        self._repay_remaining.append(order.max_repay_amount)
+        self._in_book.append(False)
+
+        if order.expiration_time <= timestamp or order.sell_amount == 0 or order.buy_amount == 0:
+            return []
+
+        calls = []
+        book = self._books.get((order.buy_instrument, order.sell_instrument), [])
+        # Sellers too small to fill at the buyer's price after rounding, the next ones may still be filled
+        skipped = []
+        while book and self._sell_remaining[slot] > 0 and self._top(book, timestamp):
+            seller = book[0][2]
+            if not self._crosses(slot, seller):
+                break
+            call = self._fill(slot, seller)
+            if call is None:
+                skipped.append(heapq.heappop(book))
+                continue
+            calls.append(call)
+            if self._sell_remaining[seller] == 0:
+                heapq.heappop(book)
+        for entry in skipped:
+            heapq.heappush(book, entry)
+
+        if self._sell_remaining[slot] > 0:
+            heapq.heappush(
+                self._books.setdefault((order.sell_instrument, order.buy_instrument), []),
+                (_price_key(order), slot, slot),
+            )
+        return calls
+
+    def _top(self, book: List[Tuple[int, int, int]], timestamp: int) -> bool:
+        """Drops the filled, cancelled and expired orders from the top of a book, returns whether one is left"""
+
+        while book:
+            slot = book[0][2]
+            if self._sell_remaining[slot] > 0 and self._orders[slot].expiration_time > timestamp:
+                return True
+            heapq.heappop(book)
+        return False
+
+    def _crosses(self, buyer: int, seller: int) -> bool:
+        """Checks the buyer pays at least the seller's price, as settle validates the orders match"""
+
+        buyer_order = self._orders[buyer]
+        seller_order = self._orders[seller]
+        return buyer_order.sell_amount * seller_order.sell_amount >= buyer_order.buy_amount * seller_order.buy_amount
+
+    def _fill(self, buyer: int, seller: int) -> Optional[SettleCall]:
+        """
+        Fills the buyer against a crossing seller as much as possible at the seller's price,
+        returns None when rounding leaves nothing to fill
+        """
+
+        buyer_order = self._orders[buyer]
+        seller_order = self._orders[seller]
+
+        # Largest amount of the seller's sell instrument the buyer can pay for
+        seller_to_send = min(
+            self._sell_remaining[seller],
+            self._sell_remaining[buyer] * seller_order.sell_amount // seller_order.buy_amount,
+        )
+        buyer_to_send = _ceil_div(seller_to_send * seller_order.buy_amount, seller_order.sell_amount)
+
+        # Rounding up is unfair to the buyer on small fills, fall back to a multiple of the exact price
+        if seller_to_send * buyer_order.sell_amount < buyer_to_send * buyer_order.buy_amount:
+            step = seller_order.sell_amount // gcd(seller_order.sell_amount, seller_order.buy_amount)
+            seller_to_send -= seller_to_send % step
+            buyer_to_send = seller_to_send * seller_order.buy_amount // seller_order.sell_amount
+        if seller_to_send == 0 or buyer_to_send == 0:
+            return None
+
+        max_fees = buyer_to_send // MAX_FEES_DIVISOR
+        buyer_fees = min(buyer_to_send * self.buyer_fee[0] // self.buyer_fee[1], max_fees)
+        seller_fees = min(buyer_to_send * self.seller_fee[0] // self.seller_fee[1], max_fees)
+        seller_receives = buyer_to_send - seller_fees
+
+        funding = self.funding
+        buyer_to_borrow = min(
+            funding.borrow(buyer_order.account, buyer_order.sell_instrument, buyer_to_send + buyer_fees),
+            buyer_to_send + buyer_fees,
+            self._borrow_remaining[buyer],
+        )
+        buyer_to_repay = min(
+            funding.repay(buyer_order.account, buyer_order.buy_instrument, seller_to_send),
+            seller_to_send,
+            self._repay_remaining[buyer],
+        )
+        seller_to_borrow = min(
+            funding.borrow(seller_order.account, seller_order.sell_instrument, seller_to_send),
+            seller_to_send,
+            self._borrow_remaining[seller],
+        )
+        seller_to_repay = min(
+            funding.repay(seller_order.account, seller_order.buy_instrument, seller_receives),
+            seller_receives,
+            self._repay_remaining[seller],
+        )
+
+        amounts = SettleAmounts(
+            buyer_fees, buyer_to_send, max(0, buyer_to_borrow), max(0, buyer_to_repay), False,
+            seller_fees, seller_to_send, max(0, seller_to_borrow), max(0, seller_to_repay), False,
+        )
+        if self.verify:
+            validate_fill(self._side(buyer), self._side(seller), amounts)
+
+        # Update the order book
+        self._sell_remaining[buyer] -= buyer_to_send
+        self._borrow_remaining[buyer] -= amounts.buyer_to_borrow
+        self._repay_remaining[buyer] -= amounts.buyer_to_repay
+        self._sell_remaining[seller] -= seller_to_send
+        self._borrow_remaining[seller] -= amounts.seller_to_borrow
+        self._repay_remaining[seller] -= amounts.seller_to_repay
+
+        call = SettleCall(buyer_order, self._ids[buyer], seller_order, self._ids[seller], self._in_book[seller], amounts)
+        # settle adds both orders to the order book
+        self._in_book[buyer] = True
+        self._in_book[seller] = True
+        return call
+
+    def _side(self, slot: int) -> OrderSide:
+        order = self._orders[slot]
+        return OrderSide(
+            (),
+            order.sell_instrument,
+            order.sell_amount,
+            order.buy_instrument,
+            order.buy_amount,
+            self._sell_remaining[slot],
+            self._borrow_remaining[slot],
+            self._repay_remaining[slot],
+        )
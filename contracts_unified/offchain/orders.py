@@ -0,0 +1,142 @@
+"""
+Order IDs of the Core contract order book, computed in batches.
+
+Orders are ABI encoded with a precomputed struct layout of OrderData and hashed like
+OrderStateHandler.get_order_id. Large batches are encoded in the current process and
+hashed across a process pool, sending the encoded orders as one buffer per chunk.
+"""
+
+import hashlib
+import os
+import struct
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Iterable, List, NamedTuple, Optional, Sequence
+
+ORDER_PREFIX = b"order"
+ORDER_ID_SIZE = len(ORDER_PREFIX) + 32
+# OperationId.Settle, the operation of every order
+SETTLE_OPERATION = 6
+
+_ORDER_FORMAT = struct.Struct(">B32sQQBQQBQQ")
+ORDER_SIZE = struct.calcsize(_ORDER_FORMAT.format)
+
+_SHA512_256 = hashlib.new("sha512_256")
+
+# Orders hashed in the current process, below it the pool costs more than it saves
+_MIN_PARALLEL = 20_000
+
+
+class Order(NamedTuple):
+    """Mirrors OrderData, the account is the 32 bytes public key"""
+
+    operation: int
+    account: bytes
+    nonce: int
+    expiration_time: int
+    sell_instrument: int
+    sell_amount: int
+    max_borrow_amount: int
+    buy_instrument: int
+    buy_amount: int
+    max_repay_amount: int
+
+    def encode(self) -> bytes:
+        """ABI encodes the order"""
+        return _ORDER_FORMAT.pack(
+            self.operation,
+            self.account,
+            self.nonce,
+            self.expiration_time,
+            self.sell_instrument,
+            self.sell_amount,
+            self.max_borrow_amount,
+            self.buy_instrument,
+            self.buy_amount,
+            self.max_repay_amount,
+        )
+
+    @staticmethod
+    def decode(data: bytes) -> "Order":
+        """ABI decodes an order"""
+        return Order(*_ORDER_FORMAT.unpack(data))
+
+
+def get_order_id(order: bytes) -> bytes:
+    """Mirrors OrderStateHandler.get_order_id on an encoded OrderData"""
+
+    digest = _SHA512_256.copy()
+    digest.update(order)
+    return ORDER_PREFIX + digest.digest()
+
+
+def encode_orders(orders: Iterable[Order]) -> bytes:
+    """ABI encodes the orders back to back"""
+
+    pack = _ORDER_FORMAT.pack
+    return b"".join(pack(*order) for order in orders)
+
+
+def hash_orders(encoded: bytes) -> bytes:
+    """Returns the IDs of orders encoded back to back, also back to back"""
+
+    return b"".join(
+        get_order_id(encoded[offset:offset + ORDER_SIZE])
+        for offset in range(0, len(encoded), ORDER_SIZE)
+    )
+
+
+def split_ids(ids: bytes) -> List[bytes]:
+    """Splits order IDs stored back to back"""
+    return [ids[offset:offset + ORDER_ID_SIZE] for offset in range(0, len(ids), ORDER_ID_SIZE)]
+
+
+class OrderIdHasher:
+    """
+    Computes order IDs across a process pool kept between batches.
+
+    workers: the number of processes, all the cores by default, one hashes in the current process
+    chunk_size: the number of orders sent to a worker at once
+    """
+
+    def __init__(self, workers: Optional[int] = None, chunk_size: int = 50_000) -> None:
+        self.workers = workers or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        self._executor: Optional[Executor] = None
+
+    def __enter__(self) -> "OrderIdHasher":
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """Stops the workers"""
+
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def hash_encoded(self, encoded: bytes) -> bytes:
+        """Returns the IDs of orders encoded back to back, also back to back"""
+
+        count = len(encoded) // ORDER_SIZE
+        if self.workers <= 1 or count < _MIN_PARALLEL:
+            return hash_orders(encoded)
+
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        # At least one chunk per worker
+        chunk_size = min(self.chunk_size, -(-count // self.workers)) * ORDER_SIZE
+        chunks = [encoded[offset:offset + chunk_size] for offset in range(0, len(encoded), chunk_size)]
+        return b"".join(self._executor.map(hash_orders, chunks))
+
+    def order_ids(self, orders: Sequence[Order]) -> List[bytes]:
+        """Returns the ID of every order"""
+        return split_ids(self.hash_encoded(encode_orders(orders)))
+
+
+def order_ids(orders: Sequence[Order], workers: Optional[int] = None) -> List[bytes]:
+    """Returns the ID of every order, using a pool for this batch only"""
+
+    with OrderIdHasher(workers) as hasher:
+        return hasher.order_ids(orders)
@@ -0,0 +1,183 @@
+"""
+Mirrors of the Core contract pool accounting in perform_pool_move.py
+"""
+
+from typing import Optional, Tuple
+
+from contracts_unified.library.constants import RATE_ONE, RATIO_ONE
+from contracts_unified.offchain.avm import (
+    add,
+    check,
+    signed_add,
+    signed_ltz,
+    signed_max,
+    signed_min,
+    signed_neg,
+    signed_sub,
+    sub,
+    teal_expt,
+    to_signed,
+    u64,
+    uint_check,
+    wide_ratio,
+)
+from contracts_unified.offchain.state import Instrument, Position
+
+
+def calculate_accrued_borrow(user_principal: int, user_index: int, pool_borrow_index: int) -> int:
+    """Calculate the accrued borrow with user instrument data, on uint64 bit patterns"""
+    # BB_t(u) = PB(u) * BI_t / BI_{t(u)}
+    borrowed = signed_neg(user_principal)
+    result = wide_ratio([borrowed, pool_borrow_index], [user_index])
+    return signed_neg(add(result, int(result == borrowed)))
+
+
+def calculate_accrued_lend(user_principal: int, user_index: int, pool_lend_index: int) -> int:
+    """Calculate the accrued lend with user instrument data, on uint64 bit patterns"""
+    # LB_t(u) = PL(u) * LI_t / LI_{t(u)}
+    return wide_ratio([user_principal, pool_lend_index], [user_index])
+
+
+def _accrued_interest(instrument: Instrument, delta_time: int) -> int:
+    """Interest accrued by the pool borrows over delta_time seconds"""
+
+    optimal_utilization_rate = wide_ratio([instrument.optimal_utilization, RATE_ONE], [RATIO_ONE])
+
+    # 1.1.2 U_{t-1} = B_{t-1} / L_{t-1}
+    if instrument.liquidity == 0:
+        old_utilization_rate = 0
+    else:
+        old_utilization_rate = wide_ratio([instrument.borrowed, RATE_ONE], [instrument.liquidity])
+
+    # 1.1.3 Interest rate curve
+    if old_utilization_rate < optimal_utilization_rate:
+        old_interest_rate = add(
+            instrument.min_rate,
+            wide_ratio(
+                [old_utilization_rate, sub(instrument.opt_rate, instrument.min_rate)],
+                [optimal_utilization_rate],
+            ),
+        )
+    else:
+        old_interest_rate = add(
+            instrument.opt_rate,
+            wide_ratio(
+                [sub(old_utilization_rate, optimal_utilization_rate), sub(instrument.max_rate, instrument.opt_rate)],
+                [sub(RATE_ONE, optimal_utilization_rate)],
+            ),
+        )
+
+    # 1.1.4 AI_t = ((1+R_{t_1})^dT - 1) * B_{t-1}
+    compounding_per_period_rate = teal_expt(add(RATE_ONE, old_interest_rate), delta_time)
+    return wide_ratio([sub(compounding_per_period_rate, RATE_ONE), instrument.borrowed], [RATE_ONE])
+
+
+def accrue_instrument(instrument: Instrument, timestamp: int) -> Instrument:
+    """
+    Accrues the pool interest up to the relative timestamp, this is the part of
+    perform_pool_move that runs before the user is looked at
+    """
+
+    # 1.1.1 Time since previous update, a pool already accrued at this timestamp accrues nothing
+    new_last_update_time = uint_check(timestamp, 32)
+    delta_time = sub(new_last_update_time, instrument.last_update_time)
+    pool_accrued_interest = 0 if delta_time == 0 else _accrued_interest(instrument, delta_time)
+
+    # 1.2 Capitalize the pool accrued interest
+    new_borrowed = add(instrument.borrowed, pool_accrued_interest)
+    new_liquidity = add(instrument.liquidity, pool_accrued_interest)
+
+    # 1.3 Updates pool indexes
+    if instrument.borrowed == 0:
+        new_borrow_index = RATE_ONE
+    else:
+        new_borrow_index = wide_ratio([instrument.borrow_index, new_borrowed], [instrument.borrowed])
+    if instrument.liquidity == 0:
+        new_lend_index = RATE_ONE
+    else:
+        new_lend_index = wide_ratio([instrument.lend_index, new_liquidity], [instrument.liquidity])
+
+    return instrument._replace(
+        last_update_time=new_last_update_time,
+        borrow_index=new_borrow_index,
+        lend_index=new_lend_index,
+        borrowed=new_borrowed,
+        liquidity=new_liquidity,
+    )
+
+
+def capitalize_principal(position: Position, borrow_index: int, lend_index: int) -> int:
+    """Returns the user's principal, as an uint64 bit pattern, with the accrued interest capitalized"""
+
+    principal = u64(position.principal)
+    if position.slot == 0:
+        return 0
+    if signed_ltz(principal):
+        return calculate_accrued_borrow(principal, position.slot, borrow_index)
+    return calculate_accrued_lend(principal, position.slot, lend_index)
+
+
+def perform_pool_move(
+    instrument: Instrument,
+    position: Optional[Position],
+    transfer_amount: int,
+    timestamp: int,
+) -> Tuple[Instrument, Optional[Position]]:
+    """
+    Transfers transfer_amount from the user to the pool at the given relative timestamp.
+    When no position is given only the pool is accrued, like the zero address on chain.
+    Returns the new instrument and position.
+    """
+
+    instrument = accrue_instrument(instrument, timestamp)
+    if position is None:
+        return instrument, None
+    return transfer_position(instrument, position, transfer_amount)
+
+
+def transfer_position(instrument: Instrument, position: Position, transfer_amount: int) -> Tuple[Instrument, Position]:
+    """
+    The part of perform_pool_move that runs once the pool is accrued, transferring transfer_amount
+    from the user to the pool. Returns the new instrument and position.
+    """
+
+    transfer = u64(transfer_amount)
+    pool_borrowed = instrument.borrowed
+    pool_liquidity = instrument.liquidity
+    pool_lend_index = instrument.lend_index
+
+    # 2 Capitalize user's accrued interest into user's principal
+    principal = capitalize_principal(position, instrument.borrow_index, pool_lend_index)
+
+    # 3.0 Validate user's position against pool size
+    check(pool_liquidity >= signed_max(0, principal), "user position larger than pool")
+
+    # 3.1.1 Decompose the transfer
+    liquidity_transfer = signed_max(
+        signed_add(transfer, signed_min(0, principal)),
+        signed_min(0, signed_neg(principal)),
+    )
+    borrowed_transfer = signed_sub(transfer, liquidity_transfer)
+
+    # 3.1.2 Apply to the pool
+    pool_borrowed = signed_sub(pool_borrowed, borrowed_transfer)
+    if signed_ltz(pool_borrowed):
+        remainder = signed_neg(pool_borrowed)
+        pool_lend_index = add(pool_lend_index, wide_ratio([pool_lend_index, remainder], [pool_liquidity]))
+        pool_liquidity = signed_add(pool_liquidity, remainder)
+        pool_borrowed = 0
+    pool_liquidity = signed_add(pool_liquidity, liquidity_transfer)
+
+    # 3.1.3 Validate the pool has sufficient liquidity
+    check(pool_liquidity >= pool_borrowed, "insufficient pool liquidity")
+
+    # 3.2 Update user's principal and cash
+    principal = signed_add(principal, transfer)
+    cash = signed_sub(position.cash, transfer)
+    check(not signed_ltz(cash), "negative user cash")
+
+    # 3.3 Update user's index
+    slot = instrument.borrow_index if signed_ltz(principal) else pool_lend_index
+
+    instrument = instrument._replace(lend_index=pool_lend_index, borrowed=pool_borrowed, liquidity=pool_liquidity)
+    return instrument, Position(cash, to_signed(principal), slot)
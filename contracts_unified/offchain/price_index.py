@@ -0,0 +1,176 @@
+"""
+Index of the prices at which accounts may become liquidatable.
+
+The balances used by health_check do not depend on the prices, so the maintenance health of an
+account is linear in each instrument price. The index splits the health of each account into
+per-instrument allowances and stores, for each instrument, the price at which the allowance would
+be exhausted. While every price stays on the safe side of the account thresholds the account can
+not become liquidatable, so a price update only has to look at the accounts whose threshold was
+crossed. Those are then checked exactly and either reported or indexed again at the new prices.
+Accounts whose health check fails at the current prices have no thresholds and are checked on every update.
+"""
+
+import heapq
+from itertools import count
+from typing import Dict, Hashable, Iterable, List, Mapping, Sequence, Set, Tuple
+
+from contracts_unified.offchain.avm import AvmError
+from contracts_unified.offchain.health import (
+    EXPOSURE_SCALE,
+    health_check,
+    instrument_exposure,
+)
+from contracts_unified.offchain.state import Instrument, Position
+
+# Heap entry: (ordering key, sequence number, account, account version)
+_Entry = Tuple[int, int, Hashable, int]
+
+# Stale heap entries are dropped when they outnumber the live ones by this factor
+_COMPACTION_FACTOR = 4
+
+
+# pylint: disable-next=too-many-instance-attributes
+class LiquidationPriceIndex:
+    """
+    Tracks the maintenance health of a set of accounts against price updates.
+
+    Accounts are identified by any hashable key, typically their address.
+    """
+
+    def __init__(self, instruments: Sequence[Instrument], prices: Sequence[int]) -> None:
+        self.instruments = list(instruments)
+        self.prices = list(prices)
+        self.liquidatable: Set[Hashable] = set()
+
+        self._positions: Dict[Hashable, List[Position]] = {}
+        self._versions: Dict[Hashable, int] = {}
+        self._holders: List[Set[Hashable]] = [set() for _ in self.instruments]
+        # Accounts whose health check fails have no thresholds, they are checked again on every update
+        self._unchecked: Set[Hashable] = set()
+        # Accounts become candidates when the price falls under the threshold, max-heap
+        self._falling: List[List[_Entry]] = [[] for _ in self.instruments]
+        # Accounts become candidates when the price rises over the threshold, min-heap
+        self._rising: List[List[_Entry]] = [[] for _ in self.instruments]
+        self._sequence = count()
+
+    def __len__(self) -> int:
+        return len(self._positions)
+
+    def update_account(self, account: Hashable, positions: Sequence[Position]) -> bool:
+        """Adds or replaces the positions of an account, returns whether it is liquidatable"""
+
+        self.remove_account(account)
+        positions = list(positions[:len(self.instruments)])
+        self._positions[account] = positions
+        self._versions[account] = 0
+        for instrument_id, position in enumerate(positions):
+            if position.cash or position.principal:
+                self._holders[instrument_id].add(account)
+        return self._index(account)
+
+    def remove_account(self, account: Hashable) -> None:
+        """Stops tracking an account"""
+
+        positions = self._positions.pop(account, None)
+        if positions is None:
+            return
+        del self._versions[account]
+        self.liquidatable.discard(account)
+        self._unchecked.discard(account)
+        for instrument_id in range(len(positions)):
+            self._holders[instrument_id].discard(account)
+
+    def update_price(self, instrument_id: int, price: int) -> List[Hashable]:
+        """Updates the price of an instrument, returns the accounts that became liquidatable"""
+
+        return self.update_prices({instrument_id: price})
+
+    def update_prices(self, prices: Mapping[int, int]) -> List[Hashable]:
+        """Updates several prices at once, returns the accounts that became liquidatable"""
+
+        candidates: Set[Hashable] = set(self._unchecked)
+        for instrument_id, price in prices.items():
+            self.prices[instrument_id] = price
+
+            falling = self._falling[instrument_id]
+            while falling and -falling[0][0] > price:
+                _, _, account, version = heapq.heappop(falling)
+                if self._versions.get(account) == version:
+                    candidates.add(account)
+
+            rising = self._rising[instrument_id]
+            while rising and rising[0][0] < price:
+                _, _, account, version = heapq.heappop(rising)
+                if self._versions.get(account) == version:
+                    candidates.add(account)
+
+        return self._recheck(candidates)
+
+    def update_instrument(self, instrument_id: int, instrument: Instrument) -> List[Hashable]:
+        """
+        Updates an instrument, e.g. after its indexes moved, returns the accounts that became liquidatable.
+        Only the accounts holding a position on the instrument, or whose health check failed, are indexed again.
+        """
+
+        self.instruments[instrument_id] = instrument
+        return self._recheck(self._holders[instrument_id] | self._unchecked)
+
+    def refresh_liquidatable(self) -> List[Hashable]:
+        """Checks the liquidatable accounts again, returns the ones that are still liquidatable"""
+
+        accounts = list(self.liquidatable)
+        self.liquidatable.clear()
+        return self._recheck(accounts)
+
+    def _recheck(self, accounts: Iterable[Hashable]) -> List[Hashable]:
+        return [account for account in list(accounts) if self._index(account)]
+
+    def _index(self, account: Hashable) -> bool:
+        """Invalidates the account thresholds and computes new ones, returns whether it is liquidatable"""
+
+        positions = self._positions[account]
+        version = self._versions[account] + 1
+        self._versions[account] = version
+
+        try:
+            health = health_check(positions, self.instruments, self.prices, True)
+        except AvmError:
+            # NOTE: The contract can not liquidate an account whose health check fails
+            self.liquidatable.discard(account)
+            self._unchecked.add(account)
+            return False
+        self._unchecked.discard(account)
+
+        if health < 0:
+            self.liquidatable.add(account)
+            return True
+        self.liquidatable.discard(account)
+
+        exposures = []
+        truncations = 0
+        for instrument_id, position in enumerate(positions):
+            exposure, instrument_truncations = instrument_exposure(position, self.instruments[instrument_id], True)
+            truncations += instrument_truncations
+            if exposure:
+                exposures.append((instrument_id, exposure))
+
+        # Each truncation moves the contract health by less than one unit from the linear model
+        budget = max(health - truncations, 0)
+        total = sum(abs(exposure) * self.prices[instrument_id] for instrument_id, exposure in exposures)
+
+        for instrument_id, exposure in exposures:
+            price = self.prices[instrument_id]
+            allowance = budget * abs(exposure) * price // total if total else 0
+            move = allowance * EXPOSURE_SCALE // abs(exposure)
+            if exposure > 0:
+                self._push(self._falling[instrument_id], -(price - move), account, version)
+            else:
+                self._push(self._rising[instrument_id], price + move, account, version)
+
+        return False
+
+    def _push(self, heap: List[_Entry], key: int, account: Hashable, version: int) -> None:
+        heapq.heappush(heap, (key, next(self._sequence), account, version))
+        if len(heap) > _COMPACTION_FACTOR * (len(self._positions) + 16):
+            heap[:] = [entry for entry in heap if self._versions.get(entry[2]) == entry[3]]
+            heapq.heapify(heap)
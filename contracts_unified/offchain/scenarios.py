@@ -0,0 +1,156 @@
+"""
+Stress tests of the whole book against price shocks and risk factor changes.
+
+Each scenario replaces some prices and some instrument fields, as update_instrument would, and the
+health of every account is evaluated with batch_health, bit-exact with the Core contract. Scenarios
+are independent and are spread across processes, each worker decoding the book once.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from fractions import Fraction
+from typing import Dict, Iterable, List, Mapping, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+from contracts_unified.offchain.batch_health import (
+    BookHealth,
+    batch_health,
+    decode_book,
+)
+from contracts_unified.offchain.state import Instrument, decode_instruments
+
+
+class Scenario(NamedTuple):
+    """Changes applied to the snapshot, instruments and prices not listed keep their current value"""
+
+    name: str
+    # New normalized prices, by instrument id
+    prices: Mapping[int, int] = {}
+    # New instrument fields, e.g. {"maintenance_haircut": 200}, by instrument id
+    instruments: Mapping[int, Mapping[str, int]] = {}
+
+
+class ScenarioResult(NamedTuple):
+    """Aggregated health of the book under a scenario"""
+
+    name: str
+    # Accounts with a negative maintenance health, the ones that can be liquidated
+    liquidatable: int
+    # Opposite of the sum of the negative maintenance healths, in the health unit
+    shortfall: int
+    # Accounts with a negative initial health, the ones that can not trade or withdraw
+    unhealthy: int
+    # Opposite of the sum of the negative initial healths
+    initial_shortfall: int
+    # Accounts whose health check would fail on chain, excluded from the counts above
+    failed: int
+    # Health of every account, only kept when requested
+    health: Optional[BookHealth] = None
+
+
+class _Book(NamedTuple):
+    cash: np.ndarray
+    principal: np.ndarray
+    slot: np.ndarray
+    instruments: List[Instrument]
+    prices: List[int]
+
+
+# Book of the current worker process, set once by _load_book
+_BOOK: Optional[_Book] = None
+
+
+def shock_prices(prices: Sequence[int], shocks: Mapping[int, Fraction]) -> Dict[int, int]:
+    """Returns the prices of the shocked instruments, each multiplied by its shock and rounded down"""
+    return {instrument_id: int(prices[instrument_id] * Fraction(shock)) for instrument_id, shock in shocks.items()}
+
+
+def price_grid(prices: Sequence[int], instrument_ids: Iterable[int], shocks: Iterable[Fraction]) -> List[Scenario]:
+    """Returns one scenario per shock, moving the prices of all the given instruments together"""
+
+    instrument_ids = list(instrument_ids)
+    return [
+        Scenario(f"prices x{float(shock):g}", shock_prices(prices, dict.fromkeys(instrument_ids, shock)))
+        for shock in shocks
+    ]
+
+
+def _load_book(
+    boxes: Sequence[bytes],
+    instruments_box: bytes,
+    instrument_count: int,
+    prices: Sequence[int],
+) -> _Book:
+    global _BOOK  # pylint: disable=global-statement
+    cash, principal, slot = decode_book(boxes, instrument_count)
+    _BOOK = _Book(cash, principal, slot, decode_instruments(instruments_box, instrument_count), list(prices))
+    return _BOOK
+
+
+def _shortfall(health: np.ndarray, failed: np.ndarray) -> Tuple[int, int]:
+    """Returns the number of negative healths and their sum, exactly"""
+
+    negative = health[(health < 0) & ~failed]
+    return len(negative), sum(int(value) for value in negative)
+
+
+def _evaluate(book: _Book, scenario: Scenario, keep_health: bool) -> ScenarioResult:
+    instruments = list(book.instruments)
+    for instrument_id, fields in scenario.instruments.items():
+        instruments[instrument_id] = instruments[instrument_id]._replace(**fields)
+    prices = list(book.prices)
+    for instrument_id, price in scenario.prices.items():
+        prices[instrument_id] = price
+
+    health = batch_health(book.cash, book.principal, book.slot, instruments, prices)
+    failed = health.initial_failed | health.maintenance_failed
+    liquidatable, shortfall = _shortfall(health.maintenance, failed)
+    unhealthy, initial_shortfall = _shortfall(health.initial, failed)
+    return ScenarioResult(
+        scenario.name,
+        liquidatable,
+        -shortfall,
+        unhealthy,
+        -initial_shortfall,
+        int(np.count_nonzero(failed)),
+        health if keep_health else None,
+    )
+
+
+def _evaluate_in_worker(scenario: Scenario, keep_health: bool) -> ScenarioResult:
+    assert _BOOK is not None
+    return _evaluate(_BOOK, scenario, keep_health)
+
+
+def run_scenarios(
+    boxes: Sequence[bytes],
+    instruments_box: bytes,
+    instrument_count: int,
+    prices: Sequence[int],
+    scenarios: Sequence[Scenario],
+    workers: Optional[int] = None,
+    keep_health: bool = False,
+) -> List[ScenarioResult]:
+    """
+    Evaluates the initial and maintenance health of every account under every scenario.
+
+    boxes: the account boxes, results are in the same order
+    instruments_box: the "i" box
+    instrument_count: the number of instruments, from the global state
+    prices: the normalized pricecaster price of each instrument
+    workers: the number of processes, all the cores by default, one evaluates in the current process
+    keep_health: keep the health of every account in the results, it takes four arrays per scenario
+    """
+
+    workers = min(workers or os.cpu_count() or 1, len(scenarios))
+    if workers <= 1:
+        book = _load_book(boxes, instruments_box, instrument_count, prices)
+        return [_evaluate(book, scenario, keep_health) for scenario in scenarios]
+
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_load_book,
+        initargs=(list(boxes), instruments_box, instrument_count, list(prices)),
+    ) as executor:
+        return list(executor.map(_evaluate_in_worker, scenarios, [keep_health] * len(scenarios)))
@@ -0,0 +1,70 @@
+"""
+Search for the largest amount passing the contract checks, when the health is piecewise linear in the amount
+"""
+
+from typing import Callable, Dict, Optional, Sequence
+
+# Evaluates an amount, returns the health slack or None when the contract would fail on another check
+SlackFunction = Callable[[int], Optional[int]]
+
+# Bounds of the search inside a segment
+_MAX_INTERPOLATIONS = 8
+_MAX_ITERATIONS = 128
+
+
+def largest_passing(
+    slack: SlackFunction,
+    low: int,
+    low_slack: int,
+    high: int,
+    high_slack: Optional[int],
+) -> int:
+    """
+    Largest passing amount in [low, high], low passing and high failing. The health is linear up to
+    the contract rounding, so the Illinois variant of the regula falsi finds it in a few evaluations.
+    Falls back to bisection when high fails on another check than health or when the rounding dominates.
+    """
+
+    retained = 0
+    for iteration in range(_MAX_ITERATIONS):
+        if high - low <= 1:
+            break
+        if high_slack is None or iteration >= _MAX_INTERPOLATIONS:
+            guess = (low + high) // 2
+        else:
+            guess = low + int((high - low) * low_slack / (low_slack - high_slack))
+        guess = min(max(guess, low + 1), high - 1)
+
+        value = slack(guess)
+        if value is not None and value >= 0:
+            low, low_slack = guess, value
+            # The high end was retained twice, halve its weight
+            if retained > 0 and high_slack is not None:
+                high_slack //= 2
+            retained = 1
+        else:
+            high, high_slack = guess, value
+            if retained < 0:
+                low_slack //= 2
+            retained = -1
+    return low
+
+
+def largest_passing_between(slack: SlackFunction, points: Sequence[int]) -> Optional[int]:
+    """
+    Largest passing amount between the first and the last of the sorted breakpoints, or None if none of
+    the breakpoints passes. The segments are scanned from the top, the search runs in the last one
+    starting with a passing amount.
+    """
+
+    high_slack = slack(points[-1])
+    if high_slack is not None and high_slack >= 0:
+        return points[-1]
+    slacks: Dict[int, Optional[int]] = {points[-1]: high_slack}
+    for low, high in reversed(list(zip(points, points[1:]))):
+        low_slack = slack(low)
+        slacks[low] = low_slack
+        if low_slack is None or low_slack < 0:
+            continue
+        return largest_passing(slack, low, low_slack, high, slacks[high])
+    return None
@@ -0,0 +1,359 @@
+"""
+Vectorized SettleExtraData calculator, pre-validating the fills against every check of settle.
+
+Each fill gives the two orders, the order boxes of the orders already in the order book and the
+amount the buyer sends. The calculator derives the rest of SettleExtraData: the seller sends
+floor(buyer_to_send * sell_amount / buy_amount) at the seller price, the fees follow the server
+ratios capped by the contract maximum, each account borrows only the cash it is missing and repays
+as much of its debt as the orders allow, and the negative margin flags are set for the accounts
+that start unhealthy.
+
+The order checks run on whole batches with the exact 128-bit helpers of wide. The health of every
+account is computed once on the whole batch with batch_health, a fill passing the order checks then
+only recomputes the health terms of the two instruments it trades, after mirroring the pool moves of
+the settle one fill at a time. Fills whose accounts are too large for the terms to be summed like the
+contract accumulates them are checked with the full settle mirror instead.
+
+Fills are checked independently against the snapshot, fills sharing an account must be checked again
+once the first is applied.
+"""
+
+from typing import Dict, List, Mapping, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+from contracts_unified.library.constants import MAX_FEES_DIVISOR
+from contracts_unified.offchain.avm import AvmError, check, to_signed
+from contracts_unified.offchain.batch_health import batch_health, health_magnitude
+from contracts_unified.offchain.fill import (
+    OrderSide,
+    SettleAmounts,
+    SettleOutcome,
+    settle_positions,
+    simulate_settle,
+    validate_fill,
+)
+from contracts_unified.offchain.health import SAFE_MAGNITUDE, instrument_health
+from contracts_unified.offchain.orders import SETTLE_OPERATION, Order
+from contracts_unified.offchain.pool import accrue_instrument, capitalize_principal
+from contracts_unified.offchain.state import (
+    Instrument,
+    OnChainOrder,
+    Position,
+    get_position,
+)
+from contracts_unified.offchain.wide import as_u64, mul_wide, wide_ratio
+
+# Settle uses the initial health
+_USE_MAINT = False
+
+
+class FillRequest(NamedTuple):
+    """A fill to price, the boxes are None for the orders added to the order book by the settle"""
+
+    buyer: Order
+    seller: Order
+    buyer_to_send: int
+    buyer_box: Optional[OnChainOrder] = None
+    seller_box: Optional[OnChainOrder] = None
+
+
+class _AccountHealth(NamedTuple):
+    """Initial health of an account in the snapshot, None if the contract would fail, and a bound of the sum of its absolute terms"""
+
+    health: Optional[int]
+    magnitude: float
+
+
+class FillResult(NamedTuple):
+    """The settle amounts of a fill, or why it is rejected, usually the check of the contract it would fail"""
+
+    amounts: Optional[SettleAmounts]
+    error: Optional[str]
+
+
+def _gte_wide(lhs: Tuple[np.ndarray, np.ndarray], rhs: Tuple[np.ndarray, np.ndarray]) -> np.ndarray:
+    """Compares 128-bit (high, low) values"""
+    return (lhs[0] > rhs[0]) | ((lhs[0] == rhs[0]) & (lhs[1] >= rhs[1]))
+
+
+def _remaining(order: Order, box: Optional[OnChainOrder]) -> Tuple[int, int, int]:
+    """Remaining amounts of an order, from its box once it is in the order book"""
+
+    if box is None:
+        return order.sell_amount, order.max_borrow_amount, order.max_repay_amount
+    return box.sell_remaining, box.borrow_remaining, box.repay_remaining
+
+
+class SettleDataCalculator:
+    """
+    Derives and pre-validates the settle amounts of fills against a snapshot of the contract.
+
+    instruments, prices: the instrument list and the normalized prices
+    accounts: the positions of each account, missing accounts have none
+    latest_timestamp: the block timestamp the orders must not be expired at
+    relative_timestamp: the same timestamp relative to the contract init, used to accrue the pools
+    buyer_fee, seller_fee: fees as (numerator, denominator) of buyer_to_send, capped by the contract maximum
+    """
+
+    def __init__(
+        self,
+        instruments: Sequence[Instrument],
+        prices: Sequence[int],
+        accounts: Mapping[bytes, Sequence[Position]],
+        latest_timestamp: int,
+        relative_timestamp: int,
+        buyer_fee: Tuple[int, int] = (0, 1),
+        seller_fee: Tuple[int, int] = (0, 1),
+    ) -> None:
+        self.instruments = list(instruments)
+        self.prices = list(prices)
+        self.accounts = accounts
+        self.latest_timestamp = latest_timestamp
+        self.relative_timestamp = relative_timestamp
+        self.fees = (buyer_fee, seller_fee)
+
+        self._health: Dict[bytes, _AccountHealth] = {}
+
+    def positions(self, account: bytes) -> Sequence[Position]:
+        """Positions of an account in the snapshot"""
+        return self.accounts.get(account, ())
+
+    def _accrued(self) -> List[Optional[Instrument]]:
+        """Pools accrued to the settle time, None where the accrual fails"""
+
+        result: List[Optional[Instrument]] = []
+        for instrument in self.instruments:
+            try:
+                result.append(accrue_instrument(instrument, self.relative_timestamp))
+            except AvmError:
+                result.append(None)
+        return result
+
+    def _debt(self, accrued: Sequence[Optional[Instrument]], account: bytes, instrument_id: int) -> int:
+        """Outstanding debt of an account once the pool is accrued, the most that is worth repaying"""
+
+        position = get_position(self.positions(account), instrument_id)
+        instrument = accrued[instrument_id] if instrument_id < len(accrued) else None
+        if position.principal >= 0 or instrument is None:
+            return 0
+        return -to_signed(capitalize_principal(position, instrument.borrow_index, instrument.lend_index))
+
+    def _load_health(self, accounts: Sequence[bytes]) -> None:
+        """Computes the initial health of the accounts, and a bound of the sum of their absolute health terms"""
+
+        missing = [account for account in dict.fromkeys(accounts) if account not in self._health]
+        if not missing:
+            return
+
+        columns = len(self.instruments)
+        cash = np.zeros((len(missing), columns), dtype=np.uint64)
+        principal = np.zeros((len(missing), columns), dtype=np.int64)
+        slot = np.zeros((len(missing), columns), dtype=np.uint64)
+        for row, account in enumerate(missing):
+            for column, position in enumerate(self.positions(account)[:columns]):
+                cash[row, column], principal[row, column], slot[row, column] = position
+
+        health = batch_health(cash, principal, slot, self.instruments, self.prices)
+        magnitude = health_magnitude(cash, principal, slot, self.instruments, self.prices)
+
+        # A failed health check can not be used as the old health
+        for account, value, failed, bound in zip(missing, health.initial.tolist(), health.initial_failed.tolist(), magnitude.tolist()):
+            self._health[account] = _AccountHealth(None if failed else value, bound)
+
+    def _unhealthy(self, account: bytes) -> bool:
+        """Whether the account starts with a negative initial health, the negative margin flag of settle"""
+
+        health = self._health[account].health
+        return health is not None and health < 0
+
+    def calculate(self, fills: Sequence[FillRequest]) -> List[FillResult]:
+        """Derives the settle amounts of every fill and rejects the ones the contract would fail"""
+
+        count = len(fills)
+        if not count:
+            return []
+
+        buyers = [fill.buyer for fill in fills]
+        sellers = [fill.seller for fill in fills]
+
+        def column(values) -> np.ndarray:
+            return as_u64(list(values))
+
+        buy_sell_amount = column(order.sell_amount for order in buyers)
+        buy_buy_amount = column(order.buy_amount for order in buyers)
+        sell_sell_amount = column(order.sell_amount for order in sellers)
+        sell_buy_amount = column(order.buy_amount for order in sellers)
+        buyer_remaining = np.array([_remaining(fill.buyer, fill.buyer_box) for fill in fills], dtype=np.uint64)
+        seller_remaining = np.array([_remaining(fill.seller, fill.seller_box) for fill in fills], dtype=np.uint64)
+        buyer_to_send = column(fill.buyer_to_send for fill in fills)
+
+        # Derive the amounts at the seller price
+        seller_to_send, price_failed = wide_ratio([buyer_to_send, sell_sell_amount], sell_buy_amount)
+        max_fees = buyer_to_send // np.uint64(MAX_FEES_DIVISOR)
+        (buyer_fee_numerator, buyer_fee_denominator), (seller_fee_numerator, seller_fee_denominator) = self.fees
+        buyer_fees, buyer_fee_failed = wide_ratio([buyer_to_send, np.uint64(buyer_fee_numerator)], np.uint64(buyer_fee_denominator))
+        seller_fees, seller_fee_failed = wide_ratio([buyer_to_send, np.uint64(seller_fee_numerator)], np.uint64(seller_fee_denominator))
+        buyer_fees = np.minimum(buyer_fees, max_fees)
+        seller_fees = np.minimum(seller_fees, max_fees)
+        buyer_spends = buyer_to_send + buyer_fees
+        seller_receives = buyer_to_send - seller_fees
+
+        # Borrow the missing cash, repay the outstanding debt
+        buyer_cash = column(get_position(self.positions(order.account), order.sell_instrument).cash for order in buyers)
+        seller_cash = column(get_position(self.positions(order.account), order.sell_instrument).cash for order in sellers)
+        accrued = self._accrued()
+        buyer_debt = column(self._debt(accrued, order.account, order.buy_instrument) for order in buyers)
+        seller_debt = column(self._debt(accrued, order.account, order.buy_instrument) for order in sellers)
+        buyer_to_borrow = np.where(buyer_spends > buyer_cash, buyer_spends - buyer_cash, np.uint64(0))
+        seller_to_borrow = np.where(seller_to_send > seller_cash, seller_to_send - seller_cash, np.uint64(0))
+        buyer_to_repay = np.minimum(np.minimum(buyer_remaining[:, 2], seller_to_send), buyer_debt)
+        seller_to_repay = np.minimum(np.minimum(seller_remaining[:, 2], seller_receives), seller_debt)
+
+        # The checks of settle, in the order the contract makes them
+        checks = [
+            (np.array([order.operation != SETTLE_OPERATION for order in buyers + sellers]).reshape(2, count).any(axis=0), "not a settle order"),
+            (np.array([buyer.account == seller.account for buyer, seller in zip(buyers, sellers)]), "self trades are not mirrored"),
+            (price_failed | buyer_fee_failed | seller_fee_failed, "amount overflow"),
+            (np.array([
+                buyer.sell_instrument != seller.buy_instrument or buyer.buy_instrument != seller.sell_instrument
+                for buyer, seller in zip(buyers, sellers)
+            ]), "instrument mismatch"),
+            (np.array([
+                buyer.expiration_time <= self.latest_timestamp or seller.expiration_time <= self.latest_timestamp
+                for buyer, seller in zip(buyers, sellers)
+            ]), "order expired"),
+            (~_gte_wide(mul_wide(buy_sell_amount, sell_sell_amount), mul_wide(buy_buy_amount, sell_buy_amount)), "orders do not match"),
+            (~_gte_wide(mul_wide(buyer_to_send, sell_sell_amount), mul_wide(seller_to_send, sell_buy_amount)), "unfair for the seller"),
+            (~_gte_wide(mul_wide(seller_to_send, buy_sell_amount), mul_wide(buyer_to_send, buy_buy_amount)), "unfair for the buyer"),
+            (buyer_spends < buyer_to_send, "buyer borrow"),
+            ((buyer_remaining[:, 0] < buyer_to_send) | (seller_remaining[:, 0] < seller_to_send), "sell remaining"),
+            ((buyer_remaining[:, 1] < buyer_to_borrow) | (seller_remaining[:, 1] < seller_to_borrow), "borrow remaining"),
+            ((buyer_to_send == 0) | (seller_to_send == 0), "empty fill"),
+        ]
+        error = np.full(count, -1)
+        for check_index, (failed, _) in reversed(list(enumerate(checks))):
+            error[failed] = check_index
+
+        results = [FillResult(None, checks[check_index][1] if check_index >= 0 else None) for check_index in error.tolist()]
+        passing = [row for row in range(count) if results[row].error is None]
+        self._load_health([buyers[row].account for row in passing] + [sellers[row].account for row in passing])
+
+        columns = [
+            values.tolist() for values in (
+                buyer_fees, buyer_to_send, buyer_to_borrow, buyer_to_repay,
+                seller_fees, seller_to_send, seller_to_borrow, seller_to_repay,
+            )
+        ]
+        for row in passing:
+            amounts = SettleAmounts(
+                buyer_fees=columns[0][row],
+                buyer_to_send=columns[1][row],
+                buyer_to_borrow=columns[2][row],
+                buyer_to_repay=columns[3][row],
+                buyer_negative_margin=self._unhealthy(buyers[row].account),
+                seller_fees=columns[4][row],
+                seller_to_send=columns[5][row],
+                seller_to_borrow=columns[6][row],
+                seller_to_repay=columns[7][row],
+                seller_negative_margin=self._unhealthy(sellers[row].account),
+            )
+            try:
+                self._check_fill(fills[row], amounts, accrued)
+                results[row] = FillResult(amounts, None)
+            except AvmError as exception:
+                results[row] = FillResult(None, str(exception))
+        return results
+
+    def _health_after(
+        self,
+        account: bytes,
+        positions: Sequence[Position],
+        instruments: Sequence[Instrument],
+        traded: Sequence[int],
+    ) -> Optional[int]:
+        """
+        Initial health of an account once a fill only changed its positions on the traded instruments,
+        None when it must be computed by the settle mirror
+        """
+
+        snapshot = self._health[account]
+        if snapshot.health is None:
+            return None
+
+        try:
+            before = [
+                instrument_health(get_position(self.positions(account), instrument_id), self.instruments[instrument_id], self.prices[instrument_id], _USE_MAINT)
+                for instrument_id in traded
+            ]
+            after = [
+                instrument_health(get_position(positions, instrument_id), instruments[instrument_id], self.prices[instrument_id], _USE_MAINT)
+                for instrument_id in traded
+            ]
+        except AvmError:
+            return None
+
+        # Summing the terms only differs from the contract accumulation if it overflows
+        if snapshot.magnitude + sum(abs(term) for term in after) >= SAFE_MAGNITUDE:
+            return None
+        return snapshot.health - sum(before) + sum(after)
+
+    def _check_fill(self, fill: FillRequest, amounts: SettleAmounts, accrued: Sequence[Optional[Instrument]]) -> None:
+        """Same as check, reusing the accrued pools and the snapshot health of the instruments the fill does not trade"""
+
+        buyer = self.side(fill.buyer, fill.buyer_box)
+        seller = self.side(fill.seller, fill.seller_box)
+        validate_fill(buyer, seller, amounts)
+
+        # Accruing a pool again at the same timestamp does not change it
+        instruments = list(self.instruments)
+        for instrument_id, amount in (
+            (buyer.sell_instrument, amounts.buyer_to_borrow),
+            (seller.sell_instrument, amounts.seller_to_borrow),
+            (buyer.buy_instrument, amounts.buyer_to_repay),
+            (seller.buy_instrument, amounts.seller_to_repay),
+        ):
+            if amount > 0:
+                pool = accrued[instrument_id]
+                if pool is None:
+                    self.check(fill, amounts)
+                    return
+                instruments[instrument_id] = pool
+        buyer_positions, seller_positions, instruments = settle_positions(buyer, seller, amounts, instruments, self.relative_timestamp)
+
+        traded = sorted({buyer.sell_instrument, buyer.buy_instrument})
+        for name, account, positions, negative_margin in (
+            ("buyer", fill.buyer.account, buyer_positions, amounts.buyer_negative_margin),
+            ("seller", fill.seller.account, seller_positions, amounts.seller_negative_margin),
+        ):
+            health = self._health_after(account, positions, instruments, traded)
+            if health is None:
+                self.check(fill, amounts)
+                return
+
+            old = self._health[account].health if negative_margin else None
+            check(health >= 0 or (old is not None and health >= old), f"{name} unhealthy")
+
+    def side(self, order: Order, box: Optional[OnChainOrder]) -> OrderSide:
+        """The order as seen by settle, with the positions of its account"""
+
+        return OrderSide(
+            self.positions(order.account),
+            order.sell_instrument,
+            order.sell_amount,
+            order.buy_instrument,
+            order.buy_amount,
+            *_remaining(order, box),
+        )
+
+    def check(self, fill: FillRequest, amounts: SettleAmounts) -> SettleOutcome:
+        """Runs a fill through the settle mirror, raising AvmError where the contract would fail"""
+
+        return simulate_settle(
+            self.side(fill.buyer, fill.buyer_box),
+            self.side(fill.seller, fill.seller_box),
+            amounts,
+            self.instruments,
+            self.prices,
+            self.relative_timestamp,
+        )
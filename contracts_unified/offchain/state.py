@@ -0,0 +1,167 @@
+"""
+Snapshot types mirroring the Core contract boxes and global state.
+"""
+
+import struct
+from typing import List, NamedTuple, Sequence
+
+# Box key of the global instrument list
+INSTRUMENTS_BOX = b"i"
+
+_INSTRUMENT_FORMAT = struct.Struct(">QHHHHIQQHQQQQQ")
+_POSITION_FORMAT = struct.Struct(">QqQ")
+_FACTORS_FORMAT = struct.Struct(">HH")
+_ORDER_FORMAT = struct.Struct(">QQQQ")
+
+
+class Instrument(NamedTuple):
+    """Mirrors an InstrumentListElement from the "i" box"""
+
+    asset_id: int
+    initial_haircut: int
+    initial_margin: int
+    maintenance_haircut: int
+    maintenance_margin: int
+    last_update_time: int
+    borrow_index: int
+    lend_index: int
+    optimal_utilization: int
+    min_rate: int
+    opt_rate: int
+    max_rate: int
+    borrowed: int
+    liquidity: int
+
+    def encode(self) -> bytes:
+        """ABI encodes the instrument"""
+        return _INSTRUMENT_FORMAT.pack(
+            self.asset_id,
+            self.initial_haircut,
+            self.initial_margin,
+            self.maintenance_haircut,
+            self.maintenance_margin,
+            self.last_update_time,
+            self.borrow_index,
+            self.lend_index,
+            self.optimal_utilization,
+            self.min_rate,
+            self.opt_rate,
+            self.max_rate,
+            self.borrowed,
+            self.liquidity,
+        )
+
+    @staticmethod
+    def decode(data: bytes) -> "Instrument":
+        """ABI decodes an instrument"""
+        return Instrument(*_INSTRUMENT_FORMAT.unpack(data))
+
+
+class Position(NamedTuple):
+    """Mirrors an UserInstrumentData from an account box, the principal is a signed integer"""
+
+    cash: int = 0
+    principal: int = 0
+    # The index field of UserInstrumentData, the pool index the principal was last capitalized at
+    slot: int = 0
+
+    def encode(self) -> bytes:
+        """ABI encodes the position"""
+        return _POSITION_FORMAT.pack(self.cash, self.principal, self.slot)
+
+    @staticmethod
+    def decode(data: bytes) -> "Position":
+        """ABI decodes a position"""
+        return Position(*_POSITION_FORMAT.unpack(data))
+
+
+class LiquidationFactors(NamedTuple):
+    """Mirrors the global liquidation factors"""
+
+    cash_liquidation_factor: int
+    pool_liquidation_factor: int
+
+    @staticmethod
+    def decode(data: bytes) -> "LiquidationFactors":
+        """ABI decodes the liquidation factors"""
+        return LiquidationFactors(*_FACTORS_FORMAT.unpack(data))
+
+
+class OnChainOrder(NamedTuple):
+    """Mirrors an OnChainOrderData from an order box"""
+
+    expiration_time: int
+    sell_remaining: int
+    borrow_remaining: int
+    repay_remaining: int
+
+    def encode(self) -> bytes:
+        """ABI encodes the order"""
+        return _ORDER_FORMAT.pack(self.expiration_time, self.sell_remaining, self.borrow_remaining, self.repay_remaining)
+
+    @staticmethod
+    def decode(data: bytes) -> "OnChainOrder":
+        """ABI decodes an order"""
+        return OnChainOrder(*_ORDER_FORMAT.unpack(data))
+
+
+INSTRUMENT_SIZE = struct.calcsize(_INSTRUMENT_FORMAT.format)
+POSITION_SIZE = struct.calcsize(_POSITION_FORMAT.format)
+ORDER_DATA_SIZE = struct.calcsize(_ORDER_FORMAT.format)
+# Size of the expiration at the start of every order box, fully filled orders keep only it
+ORDER_EXPIRATION_SIZE = 8
+# Size of the order boxes written before the expiration was stored
+LEGACY_ORDER_SIZE = ORDER_DATA_SIZE - ORDER_EXPIRATION_SIZE
+
+
+def decode_instruments(box: bytes, instrument_count: int) -> List[Instrument]:
+    """Decodes the first instrument_count entries of the "i" box"""
+
+    return [
+        Instrument.decode(box[offset:offset + INSTRUMENT_SIZE])
+        for offset in range(0, instrument_count * INSTRUMENT_SIZE, INSTRUMENT_SIZE)
+    ]
+
+
+def decode_positions(box: bytes, instrument_count: int) -> List[Position]:
+    """
+    Decodes an account box, like LocalStateHandler.get_user_instrument_count the result
+    is capped to the global instrument count
+    """
+
+    count = min(len(box) // POSITION_SIZE, instrument_count)
+    return [
+        Position.decode(box[offset:offset + POSITION_SIZE])
+        for offset in range(0, count * POSITION_SIZE, POSITION_SIZE)
+    ]
+
+
+def decode_order_box(box: bytes, expiration_time: int) -> OnChainOrder:
+    """
+    Decodes an order box as settle reads it after add_order, expiration_time is the one of the order.
+    add_order prepends it to the boxes of the previous layout, fully filled orders have nothing left.
+    """
+
+    if len(box) == LEGACY_ORDER_SIZE:
+        box = expiration_time.to_bytes(ORDER_EXPIRATION_SIZE, "big") + box
+    elif len(box) == ORDER_EXPIRATION_SIZE:
+        box += bytes(LEGACY_ORDER_SIZE)
+    return OnChainOrder.decode(box)
+
+
+def get_position(positions: Sequence[Position], instrument_id: int) -> Position:
+    """Returns the position on an instrument, boxes are zero extended on chain when needed"""
+
+    if instrument_id < len(positions):
+        return positions[instrument_id]
+    return Position()
+
+
+def set_position(positions: Sequence[Position], instrument_id: int, position: Position) -> List[Position]:
+    """Returns a copy of the positions with the position on an instrument replaced"""
+
+    result = list(positions)
+    if instrument_id >= len(result):
+        result.extend(Position() for _ in range(instrument_id + 1 - len(result)))
+    result[instrument_id] = position
+    return result
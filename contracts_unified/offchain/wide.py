@@ -0,0 +1,122 @@
+"""
+Vectorized, exact 128-bit helpers mirroring WideRatio on numpy uint64 arrays.
+
+Each function also returns a mask of the elements for which the contract would fail,
+the values of those elements are unspecified.
+"""
+
+from typing import Tuple
+
+import numpy as np
+
+_LOW_32 = np.uint64(0xFFFFFFFF)
+_SHIFT_32 = np.uint64(32)
+_ONE = np.uint64(1)
+_TWO_64 = 2.0**64
+# Largest float64 below 2**64
+_MAX_FLOAT_U64 = 2.0**64 - 2048
+
+
+def as_u64(values) -> np.ndarray:
+    """Converts values to an uint64 array"""
+    return np.asarray(values, dtype=np.uint64)
+
+
+def mul_wide(lhs: np.ndarray, rhs: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Mirrors mulw, returns the high and low words of lhs * rhs"""
+
+    lhs, rhs = np.broadcast_arrays(as_u64(lhs), as_u64(rhs))
+    lhs_low, lhs_high = lhs & _LOW_32, lhs >> _SHIFT_32
+    rhs_low, rhs_high = rhs & _LOW_32, rhs >> _SHIFT_32
+
+    low_low = lhs_low * rhs_low
+    low_high = lhs_low * rhs_high
+    high_low = lhs_high * rhs_low
+
+    middle = (low_low >> _SHIFT_32) + (low_high & _LOW_32) + (high_low & _LOW_32)
+    low = (low_low & _LOW_32) | (middle << _SHIFT_32)
+    high = lhs_high * rhs_high + (low_high >> _SHIFT_32) + (high_low >> _SHIFT_32) + (middle >> _SHIFT_32)
+    return high, low
+
+
+def mul_wide_small(high: np.ndarray, low: np.ndarray, factor: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Multiplies a 128-bit value by a factor, returns the product and a mask of where it does not fit in 128 bits"""
+
+    factor = as_u64(factor)
+    carry, low = mul_wide(low, factor)
+    overflow_high, high = mul_wide(high, factor)
+    new_high = high + carry
+    overflow = (overflow_high != 0) | (new_high < high)
+    return new_high, low, overflow
+
+
+def _float(high: np.ndarray, low: np.ndarray) -> np.ndarray:
+    """Approximates an unsigned 128-bit value as a float"""
+    return high.astype(np.float64) * _TWO_64 + low.astype(np.float64)
+
+
+def _float_signed(high: np.ndarray, low: np.ndarray) -> np.ndarray:
+    """Approximates a signed 128-bit value as a float, exactly for small values of either sign"""
+    # NOTE: Moving the sign bit of the low word into the high word avoids cancellations
+    high = high.view(np.int64) + (low >> np.uint64(63)).view(np.int64)
+    return high.astype(np.float64) * _TWO_64 + low.view(np.int64).astype(np.float64)
+
+
+def _residual(high: np.ndarray, low: np.ndarray, quotient: np.ndarray, divisor: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Returns (high, low) - quotient * divisor, as a signed 128-bit value"""
+
+    product_high, product_low = mul_wide(quotient, divisor)
+    borrow = (low < product_low).astype(np.uint64)
+    return high - product_high - borrow, low - product_low
+
+
+def div_wide(high: np.ndarray, low: np.ndarray, divisor: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Mirrors divw, returns the truncated quotient of (high, low) / divisor and a mask of where
+    the contract would fail, either because the divisor is zero or because the quotient does not
+    fit in 64 bits.
+
+    The quotient is estimated in floating point and then corrected with exact arithmetic.
+    """
+
+    high, low, divisor = np.broadcast_arrays(as_u64(high), as_u64(low), as_u64(divisor))
+    failed = (divisor == 0) | (high >= divisor)
+    # Replace failing elements by harmless values
+    safe_divisor = np.where(failed, _ONE, divisor)
+    high = np.where(failed, np.uint64(0), high)
+
+    divisor_float = safe_divisor.astype(np.float64)
+    estimate = np.clip(np.floor(_float(high, low) / divisor_float), 0.0, _MAX_FLOAT_U64)
+    quotient = estimate.astype(np.uint64)
+
+    # The estimate is off by less than 2**13, so the residual is small enough to be corrected in float
+    residual_high, residual_low = _residual(high, low, quotient, safe_divisor)
+    correction = np.floor(_float_signed(residual_high, residual_low) / divisor_float).astype(np.int64)
+    quotient = quotient + correction.view(np.uint64)
+
+    # The float correction may still be off by one in either direction
+    for _ in range(2):
+        residual_high, residual_low = _residual(high, low, quotient, safe_divisor)
+        negative = residual_high.view(np.int64) < 0
+        too_large = ~negative & ((residual_high != 0) | (residual_low >= safe_divisor))
+        quotient = quotient - negative.astype(np.uint64) + too_large.astype(np.uint64)
+
+    return quotient, failed
+
+
+def wide_ratio(numerators, denominator) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Mirrors WideRatio(numerators, [denominator]) element-wise.
+
+    The numerator product must fit in 128 bits, like on chain. Products of constant denominators
+    must be computed by the caller, like the contract does with Int(RATIO_ONE * PRICECASTER_RESCALE_FACTOR).
+    """
+
+    high, low = mul_wide(numerators[0], numerators[1] if len(numerators) > 1 else as_u64(1))
+    failed = np.zeros(high.shape, dtype=bool)
+    for factor in numerators[2:]:
+        high, low, overflow = mul_wide_small(high, low, factor)
+        failed |= overflow
+
+    quotient, division_failed = div_wide(high, low, denominator)
+    return quotient, failed | division_failed
@@ -0,0 +1,362 @@
+"""
+Mirror of the Core contract withdraw and a calculator for the largest amounts an account can withdraw.
+
+A withdraw only touches one instrument: the cash above the locked cash is withdrawn first, the rest is
+borrowed from the pool with perform_pool_move. The health of the other instruments does not change, so
+the largest amounts are found by only recomputing the health term of the withdrawn instrument.
+"""
+
+from typing import Dict, Hashable, List, Mapping, NamedTuple, Optional, Sequence, Tuple
+
+from contracts_unified.offchain.avm import (
+    AvmError,
+    add,
+    check,
+    signed_add,
+    signed_ltz,
+    sub,
+    to_signed,
+    u64,
+)
+from contracts_unified.offchain.health import (
+    SAFE_MAGNITUDE,
+    health_check,
+    instrument_health,
+)
+from contracts_unified.offchain.pool import (
+    accrue_instrument,
+    capitalize_principal,
+    transfer_position,
+)
+from contracts_unified.offchain.search import largest_passing_between
+from contracts_unified.offchain.state import (
+    Instrument,
+    Position,
+    get_position,
+    set_position,
+)
+
+# Withdraw uses the initial health
+_USE_MAINT = False
+
+# Amounts checked above the solution for rounding effects
+_ROUNDING_WINDOW = 8
+
+
+class WithdrawLimits(NamedTuple):
+    """Largest amounts withdrawable from an instrument, zero when no withdraw is possible"""
+
+    # Largest amount withdrawable with a max_borrow of zero
+    amount: int
+    # Largest amount withdrawable when borrowing is allowed
+    amount_with_borrow: int
+    # The max_borrow needed to withdraw amount_with_borrow
+    max_borrow: int
+
+
+class WithdrawOutcome(NamedTuple):
+    """State after a withdraw as performed by the contract"""
+
+    positions: List[Position]
+    instruments: List[Instrument]
+    health: int
+
+
+def simulate_withdraw(
+    positions: Sequence[Position],
+    instruments: Sequence[Instrument],
+    prices: Sequence[int],
+    instrument_id: int,
+    amount: int,
+    max_borrow: int,
+    timestamp: int,
+    locked_cash: int = 0,
+    withdraw_fee: int = 0,
+) -> WithdrawOutcome:
+    """
+    Mirrors withdraw, raising AvmError where the contract would fail.
+    NOTE: The fee is not added to the fee target account, which must not be the withdrawing account.
+    """
+
+    instruments = list(instruments)
+    balance = sub(get_position(positions, instrument_id).cash, locked_cash)
+
+    # Validate the user is not borrowing more than they have allowed
+    check(amount <= add(max_borrow, balance), "max borrow")
+    # The amount the user will actually get, fails if fees are bigger than the amount
+    sub(amount, withdraw_fee)
+
+    # Borrow if needed
+    if amount > balance:
+        instrument = accrue_instrument(instruments[instrument_id], timestamp)
+        instrument, position = transfer_position(instrument, get_position(positions, instrument_id), -(amount - balance))
+        instruments[instrument_id] = instrument
+        positions = set_position(positions, instrument_id, position)
+
+    # Remove assets
+    position = get_position(positions, instrument_id)
+    cash = signed_add(u64(-amount), position.cash)
+    check(not signed_ltz(cash), "negative user cash")
+    positions = set_position(positions, instrument_id, position._replace(cash=cash))
+
+    # Validate user is still healthy
+    health = health_check(positions, instruments, prices, _USE_MAINT)
+    check(health >= 0, "user unhealthy")
+
+    return WithdrawOutcome(positions, instruments, health)
+
+
+class _WithdrawEvaluator:
+    """Evaluates withdraws of an account, only recomputing the health term of the withdrawn instrument"""
+
+    def __init__(
+        self,
+        positions: Sequence[Position],
+        instruments: Sequence[Instrument],
+        prices: Sequence[int],
+        timestamp: int,
+    ) -> None:
+        self.positions = positions
+        self.instruments = instruments
+        self.prices = prices
+        self.timestamp = timestamp
+
+        # Health terms before the withdraw
+        # NOTE: The contract accumulates the terms, summing them only differs if the accumulation overflows
+        self.terms: Dict[int, int] = {}
+        for instrument_id in range(min(len(positions), len(instruments))):
+            position = positions[instrument_id]
+            if position.cash or position.principal:
+                self.terms[instrument_id] = instrument_health(position, instruments[instrument_id], prices[instrument_id], _USE_MAINT)
+        self.total = sum(self.terms.values())
+        self.magnitude = sum(abs(term) for term in self.terms.values())
+
+    def limits(self, instrument_id: int, locked_cash: int, withdraw_fee: int) -> Tuple[WithdrawLimits, bool]:
+        """Largest withdraws of an instrument, and whether borrowing was looked at, making them depend on the timestamp"""
+
+        instrument = self.instruments[instrument_id]
+        position = get_position(self.positions, instrument_id)
+        if locked_cash > position.cash:
+            return WithdrawLimits(0, 0, 0), False
+        balance = position.cash - locked_cash
+        other = self.total - self.terms.get(instrument_id, 0)
+
+        # The pool accrued to the withdraw time, accruing again at the same time does not change it
+        accrued = accrue_instrument(instrument, self.timestamp)
+
+        def slack(amount: int) -> Optional[int]:
+            if amount < withdraw_fee:
+                return None
+            try:
+                moved_instrument, moved = instrument, position
+                if amount > balance:
+                    moved_instrument, moved = transfer_position(accrued, position, -(amount - balance))
+                if moved.cash < amount:
+                    return None
+                moved = moved._replace(cash=moved.cash - amount)
+                return other + instrument_health(moved, moved_instrument, self.prices[instrument_id], _USE_MAINT)
+            except AvmError:
+                return None
+
+        # The balance sum crosses zero when the withdraw exceeds the cash and the accrued loans
+        loaned = to_signed(capitalize_principal(position, accrued.borrow_index, accrued.lend_index))
+        crossing = position.cash + loaned
+
+        # Amounts under the fee fail, the cash withdraw is looked for first
+        cash_limit = self._largest(slack, [withdraw_fee, crossing, balance], withdraw_fee, balance)
+        if withdraw_fee <= balance and cash_limit < balance:
+            return WithdrawLimits(cash_limit, cash_limit, 0), False
+
+        # Borrowing first redeems the lend position then borrows, up to the pool free liquidity
+        upper = balance + max(accrued.liquidity - accrued.borrowed, 0)
+        low = max(balance, withdraw_fee)
+        borrow_limit = self._largest(slack, [low, balance + max(loaned, 0), crossing, upper], low, upper)
+        return WithdrawLimits(cash_limit, borrow_limit, max(borrow_limit - balance, 0)), True
+
+    @staticmethod
+    def _largest(slack, points: List[int], low: int, high: int) -> int:
+        if high < low:
+            return 0
+        points = sorted({point for point in points if low <= point <= high})
+        best = largest_passing_between(slack, points)
+        if best is None:
+            return 0
+
+        # Rounding makes the health slightly non monotonic around the solution
+        for candidate in range(best + 1, min(best + _ROUNDING_WINDOW, high) + 1):
+            value = slack(candidate)
+            if value is not None and value >= 0:
+                best = candidate
+        return best
+
+
+def _verified(
+    evaluator: _WithdrawEvaluator,
+    instrument_id: int,
+    limits: WithdrawLimits,
+    locked_cash: int,
+    withdraw_fee: int,
+) -> WithdrawLimits:
+    """Checks the limits with the full mirror when the contract accumulation could overflow"""
+
+    if evaluator.magnitude < SAFE_MAGNITUDE:
+        return limits
+
+    def passes(amount: int, max_borrow: int) -> bool:
+        try:
+            simulate_withdraw(
+                evaluator.positions, evaluator.instruments, evaluator.prices, instrument_id,
+                amount, max_borrow, evaluator.timestamp, locked_cash, withdraw_fee,
+            )
+        except AvmError:
+            return False
+        return True
+
+    amount = limits.amount if limits.amount and passes(limits.amount, 0) else 0
+    if limits.max_borrow and passes(limits.amount_with_borrow, limits.max_borrow):
+        return WithdrawLimits(amount, limits.amount_with_borrow, limits.max_borrow)
+    return WithdrawLimits(amount, amount, 0)
+
+
+def max_withdrawals(
+    positions: Sequence[Position],
+    instruments: Sequence[Instrument],
+    prices: Sequence[int],
+    timestamp: int,
+    locked_cash: Optional[Sequence[int]] = None,
+    withdraw_fees: Optional[Sequence[int]] = None,
+) -> List[WithdrawLimits]:
+    """
+    Returns the withdraw limits of every instrument for an account.
+
+    positions: the account positions, as decoded from the account box
+    instruments: the instruments, as decoded from the "i" box
+    prices: the normalized pricecaster price of each instrument
+    timestamp: the relative timestamp the pools are accrued to
+    locked_cash: the cash locked by the server on each instrument, see WithdrawExtraData
+    withdraw_fees: the fee charged by the server on each instrument
+    """
+
+    evaluator = _WithdrawEvaluator(positions, instruments, prices, timestamp)
+    result = []
+    for instrument_id in range(len(instruments)):
+        locked = locked_cash[instrument_id] if locked_cash else 0
+        fee = withdraw_fees[instrument_id] if withdraw_fees else 0
+        limits, _ = evaluator.limits(instrument_id, locked, fee)
+        result.append(_verified(evaluator, instrument_id, limits, locked, fee))
+    return result
+
+
+class _CachedLimits(NamedTuple):
+    limits: WithdrawLimits
+    # Versions of the instruments the limits depend on
+    versions: Tuple[int, ...]
+    # Timestamp of the borrow limits, None when borrowing was not looked at as the cash limits do not accrue the pool
+    timestamp: Optional[int]
+
+
+class _Account(NamedTuple):
+    positions: List[Position]
+    locked_cash: Optional[List[int]]
+    # The instruments with a position, they all take part in the health
+    held: Tuple[int, ...]
+    cache: Dict[int, _CachedLimits]
+
+
+class WithdrawCalculator:
+    """
+    Caches the withdraw limits of a set of accounts.
+
+    The limits of an instrument depend on the account positions, on the price and state of the instruments
+    the account holds, and on the price and state of the withdrawn instrument. Each instrument has a version
+    bumped when its price or state change, cached limits are only computed again when one of the versions
+    they depend on changed. The borrow limits also depend on the timestamp the pool is accrued to.
+
+    Accounts are identified by any hashable key, typically their address.
+    """
+
+    def __init__(
+        self,
+        instruments: Sequence[Instrument],
+        prices: Sequence[int],
+        timestamp: int,
+        withdraw_fees: Optional[Sequence[int]] = None,
+    ) -> None:
+        self.instruments = list(instruments)
+        self.prices = list(prices)
+        self.timestamp = timestamp
+        self.withdraw_fees = list(withdraw_fees) if withdraw_fees else [0] * len(self.instruments)
+
+        self._versions = [0] * len(self.instruments)
+        self._accounts: Dict[Hashable, _Account] = {}
+
+    def __len__(self) -> int:
+        return len(self._accounts)
+
+    def update_account(self, account: Hashable, positions: Sequence[Position], locked_cash: Optional[Sequence[int]] = None) -> None:
+        """Adds or replaces the positions and locked cash of an account, the cache is kept if they did not change"""
+
+        positions = list(positions[:len(self.instruments)])
+        locked = list(locked_cash) if locked_cash else None
+        current = self._accounts.get(account)
+        if current is not None and current.positions == positions and current.locked_cash == locked:
+            return
+
+        held = tuple(instrument_id for instrument_id, position in enumerate(positions) if position.cash or position.principal)
+        self._accounts[account] = _Account(positions, locked, held, {})
+
+    def remove_account(self, account: Hashable) -> None:
+        """Stops tracking an account"""
+        self._accounts.pop(account, None)
+
+    def update_prices(self, prices: Mapping[int, int]) -> None:
+        """Updates some prices, invalidating the limits depending on them"""
+
+        for instrument_id, price in prices.items():
+            if self.prices[instrument_id] != price:
+                self.prices[instrument_id] = price
+                self._versions[instrument_id] += 1
+
+    def update_instrument(self, instrument_id: int, instrument: Instrument) -> None:
+        """Updates an instrument, e.g. after a pool move, invalidating the limits depending on it"""
+
+        if self.instruments[instrument_id] != instrument:
+            self.instruments[instrument_id] = instrument
+            self._versions[instrument_id] += 1
+
+    def update_timestamp(self, timestamp: int) -> None:
+        """Updates the relative timestamp, only the borrow limits are invalidated"""
+        self.timestamp = timestamp
+
+    def limits(self, account: Hashable, instrument_id: int) -> WithdrawLimits:
+        """Returns the withdraw limits of an instrument for an account"""
+        return self.all_limits(account, [instrument_id])[0]
+
+    def all_limits(self, account: Hashable, instrument_ids: Optional[Sequence[int]] = None) -> List[WithdrawLimits]:
+        """Returns the withdraw limits of the given instruments, all of them by default, for an account"""
+
+        state = self._accounts[account]
+        if instrument_ids is None:
+            instrument_ids = range(len(self.instruments))
+        held_versions = tuple(self._versions[instrument_id] for instrument_id in state.held)
+
+        evaluator: Optional[_WithdrawEvaluator] = None
+        result = []
+        for instrument_id in instrument_ids:
+            versions = held_versions + (self._versions[instrument_id],)
+            cached = state.cache.get(instrument_id)
+            if cached is not None and cached.versions == versions:
+                if cached.timestamp is None or cached.timestamp == self.timestamp:
+                    result.append(cached.limits)
+                    continue
+
+            if evaluator is None:
+                evaluator = _WithdrawEvaluator(state.positions, self.instruments, self.prices, self.timestamp)
+            locked = state.locked_cash[instrument_id] if state.locked_cash else 0
+            fee = self.withdraw_fees[instrument_id]
+            limits, borrowed = evaluator.limits(instrument_id, locked, fee)
+            limits = _verified(evaluator, instrument_id, limits, locked, fee)
+            state.cache[instrument_id] = _CachedLimits(limits, versions, self.timestamp if borrowed else None)
+            result.append(limits)
+
+        return result
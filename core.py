@@ -5,6 +5,7 @@ import sys
 import click
 
 from contracts_unified.core.main import CORE_TEAL_APPROVAL, CORE_TEAL_CLEAR, CORE_CONTRACT
+from contracts_unified.library.program_size import MAX_PROGRAM_SIZE, program_size
 import json
 
 
@@ -15,6 +16,10 @@ import json
 @click.argument("output_abi", type=click.File("w"), required=False)
 def cli(output_approval, output_clear, test_fixed_delta, output_abi):
     """Write the compiled contracts"""
+    for name, teal in (("approval", CORE_TEAL_APPROVAL), ("clear", CORE_TEAL_CLEAR)):
+        size = program_size(teal)
+        if size > MAX_PROGRAM_SIZE:
+            raise click.ClickException(f"The {name} program is {size} bytes, over the {MAX_PROGRAM_SIZE} bytes limit")
     output_approval.write(CORE_TEAL_APPROVAL)
     output_clear.write(CORE_TEAL_CLEAR)
     if (output_abi):
@@ -0,0 +1,52 @@
+"""
+Times the vectorized health engine against the per-account mirror on a synthetic book.
+Run from the repository root: python -m scripts.bench.batch_health
+"""
+
+import time
+
+import numpy as np
+
+from contracts_unified.library.constants import RATE_ONE
+from contracts_unified.offchain.batch_health import batch_health
+from contracts_unified.offchain.health import health_check
+from contracts_unified.offchain.state import Instrument, Position
+
+
+def benchmark(account_count: int = 200_000, instrument_count: int = 80, positions_per_account: int = 4) -> None:
+    """Times the engine and checks it against the mirror on a sample of the accounts"""
+
+    rng = np.random.default_rng(0)
+    instruments = [
+        Instrument(0, 100, 150, 50, 75, 0, RATE_ONE + 10**9, RATE_ONE + 10**8, 800, 0, 0, 0, 10**15, 10**16)
+        for _ in range(instrument_count)
+    ]
+    prices = [int(price) for price in rng.integers(10**6, 10**12, instrument_count)]
+
+    cash = np.zeros((account_count, instrument_count), dtype=np.uint64)
+    principal = np.zeros((account_count, instrument_count), dtype=np.int64)
+    slot = np.zeros((account_count, instrument_count), dtype=np.uint64)
+    for _ in range(positions_per_account):
+        columns = rng.integers(0, instrument_count, account_count)
+        rows = np.arange(account_count)
+        cash[rows, columns] = rng.integers(0, 10**10, account_count).astype(np.uint64)
+        principal[rows, columns] = rng.integers(-10**10, 10**10, account_count)
+        slot[rows, columns] = RATE_ONE
+
+    start = time.perf_counter()
+    result = batch_health(cash, principal, slot, instruments, prices)
+    elapsed = time.perf_counter() - start
+    print(f"batch: {elapsed:.2f}s for {account_count} accounts")
+
+    sample = 2000
+    start = time.perf_counter()
+    for row in range(sample):
+        positions = [Position(int(c), int(p), int(i)) for c, p, i in zip(cash[row], principal[row], slot[row])]
+        assert health_check(positions, instruments, prices, True) == result.maintenance[row]
+        assert health_check(positions, instruments, prices, False) == result.initial[row]
+    mirror = (time.perf_counter() - start) * account_count / sample
+    print(f"mirror: {mirror:.2f}s extrapolated, results identical on {sample} accounts")
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,49 @@
+"""
+Times the largest fill solver on random order pairs.
+Run from the repository root: python -m scripts.bench.fill
+"""
+
+import random
+import time
+from typing import List
+
+from contracts_unified.library.constants import RATE_ONE
+from contracts_unified.offchain.fill import OrderSide, max_fill
+from contracts_unified.offchain.state import Instrument, Position
+
+
+def benchmark(pair_count: int = 2000, instrument_count: int = 80, positions_per_account: int = 6) -> None:
+    """Times max_fill on pairs of orders priced around the instrument prices"""
+
+    rng = random.Random(0)
+    instruments = [
+        Instrument(0, 100, 150, 50, 75, 0, RATE_ONE + 10**9, RATE_ONE + 10**8, 800, 10**9, 2 * 10**9, 10**10, 10**15, 10**16)
+        for _ in range(instrument_count)
+    ]
+    prices = [rng.randint(10**8, 10**10) for _ in range(instrument_count)]
+
+    def account() -> List[Position]:
+        positions = [Position()] * instrument_count
+        for instrument_id in rng.sample(range(instrument_count), positions_per_account):
+            positions[instrument_id] = Position(rng.randint(0, 10**10), rng.randint(-10**9, 10**9), RATE_ONE)
+        return positions
+
+    def side(sell_instrument: int, buy_instrument: int) -> OrderSide:
+        sell_amount = rng.randint(10**8, 10**10)
+        buy_amount = sell_amount * prices[sell_instrument] // prices[buy_instrument] * rng.randint(95, 100) // 100
+        return OrderSide(account(), sell_instrument, sell_amount, buy_instrument, buy_amount, sell_amount, 10**9, 10**9, 1, 1000)
+
+    pairs = []
+    for _ in range(pair_count):
+        first, second = rng.sample(range(instrument_count), 2)
+        pairs.append((side(first, second), side(second, first)))
+
+    start = time.perf_counter()
+    results = [max_fill(buyer, seller, instruments, prices, 1000) for buyer, seller in pairs]
+    elapsed = time.perf_counter() - start
+    filled = sum(result is not None for result in results)
+    print(f"{pair_count / elapsed:.0f} pairs/s, {filled} of {pair_count} pairs can be settled")
+
+
+if __name__ == "__main__":
+    benchmark()
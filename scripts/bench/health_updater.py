@@ -0,0 +1,47 @@
+"""
+Times a full price tick of the incremental health updater over a synthetic book.
+Run from the repository root: python -m scripts.bench.health_updater
+"""
+
+import time
+
+import numpy as np
+
+from contracts_unified.library.constants import RATE_ONE
+from contracts_unified.offchain.health_updater import HealthUpdater
+from contracts_unified.offchain.state import Instrument
+
+
+def benchmark(account_count: int = 1_000_000, instrument_count: int = 80, positions_per_account: int = 4) -> None:
+    """Times loading the book, then moving every price at once"""
+
+    rng = np.random.default_rng(0)
+    instruments = [
+        Instrument(0, 100, 150, 50, 75, 0, RATE_ONE, RATE_ONE, 800, 0, 0, 0, 10**15, 10**16)
+        for _ in range(instrument_count)
+    ]
+    prices = [int(price) for price in rng.integers(10**6, 10**12, instrument_count)]
+    updater = HealthUpdater(instruments, prices)
+
+    # At most one position per account and instrument, the drawn pairs are deduplicated as a set
+    keys = np.repeat(np.arange(account_count), positions_per_account) * instrument_count
+    keys = np.unique(keys + rng.integers(0, instrument_count, len(keys)))
+    account_ids, instrument_ids = np.divmod(keys, instrument_count)
+    entries = len(keys)
+    cash = rng.integers(0, 10**10, entries).astype(np.uint64)
+    principal = rng.integers(-10**10, 10**10, entries)
+
+    start = time.perf_counter()
+    updater.load(
+        range(account_count), account_ids, instrument_ids, cash, principal, np.full(entries, RATE_ONE, dtype=np.uint64),
+    )
+    print(f"load: {time.perf_counter() - start:.2f}s for {account_count} accounts")
+
+    tick = {instrument_id: int(price * 0.99) for instrument_id, price in enumerate(prices)}
+    start = time.perf_counter()
+    updater.update_prices(tick)
+    print(f"tick: {time.perf_counter() - start:.3f}s for {instrument_count} instruments")
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,37 @@
+"""
+Times tracking and cleaning a synthetic order book with the expiry keeper, against the local stand-in.
+Run from the repository root: python -m scripts.bench.keeper
+"""
+
+import random
+import time
+
+from contracts_unified.offchain.keeper import LocalCleanupClient, OrderKeeper
+from contracts_unified.offchain.orders import ORDER_PREFIX
+
+
+def benchmark(order_count: int = 200_000) -> None:
+    """Times cleaning the orders of a book where about half of them expired"""
+
+    rng = random.Random(0)
+    now = 1_700_000_000
+    boxes = {}
+    for _ in range(order_count):
+        order_id = ORDER_PREFIX + rng.randbytes(32)
+        # Open orders keep their remaining amounts after the expiration, fully filled ones only the expiration
+        boxes[order_id] = (now + rng.randint(-86_400, 86_400)).to_bytes(8, "big") + bytes(rng.choice([24, 0]))
+
+    client = LocalCleanupClient(boxes, now)
+    keeper = OrderKeeper(client)
+    start = time.perf_counter()
+    keeper.track_boxes(boxes)
+    cleaned = keeper.run_once()
+    elapsed = time.perf_counter() - start
+    print(
+        f"{cleaned} of {order_count} orders cleaned in {elapsed:.2f}s, {cleaned / elapsed:.0f} orders/s, "
+        f"{client.calls} calls in {client.groups} groups"
+    )
+
+
+if __name__ == "__main__":
+    benchmark()
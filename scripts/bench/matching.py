@@ -0,0 +1,42 @@
+"""
+Times the matching engine on a stream of synthetic orders.
+Run from the repository root: python -m scripts.bench.matching
+"""
+
+import random
+import time
+
+from contracts_unified.offchain.matching import MatchingEngine
+from contracts_unified.offchain.orders import SETTLE_OPERATION, Order
+
+
+def benchmark(order_count: int = 200_000) -> None:
+    """Times matching orders on one pair, priced within 1% around one"""
+
+    rng = random.Random(0)
+    now = 1_700_000_000
+    accounts = [rng.randbytes(32) for _ in range(1000)]
+    orders = []
+    for nonce in range(order_count):
+        size = rng.randrange(10**6, 10**9)
+        price = 1 + rng.uniform(-0.01, 0.01)
+        sell_instrument = rng.randrange(2)
+        # Instrument 1 is worth price units of instrument 0
+        if sell_instrument == 1:
+            sell_amount, buy_amount = size, int(size * price)
+        else:
+            sell_amount, buy_amount = int(size * price), size
+        orders.append(Order(
+            SETTLE_OPERATION, rng.choice(accounts), nonce, now + 3600,
+            sell_instrument, sell_amount, sell_amount // 2, 1 - sell_instrument, buy_amount, buy_amount // 2,
+        ))
+
+    engine = MatchingEngine(buyer_fee=(1, 1000), seller_fee=(1, 2000))
+    start = time.perf_counter()
+    fills = sum(len(engine.submit(order, now)) for order in orders)
+    elapsed = time.perf_counter() - start
+    print(f"{order_count} orders matched in {elapsed:.2f}s, {order_count / elapsed:.0f} orders/s, {fills} fills")
+
+
+if __name__ == "__main__":
+    benchmark()
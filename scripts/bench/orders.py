@@ -0,0 +1,47 @@
+"""
+Times encoding and hashing a batch of synthetic orders into order IDs.
+Run from the repository root: python -m scripts.bench.orders
+"""
+
+import random
+import time
+
+from contracts_unified.offchain.orders import (
+    _MIN_PARALLEL,
+    SETTLE_OPERATION,
+    Order,
+    OrderIdHasher,
+)
+
+
+def benchmark(order_count: int = 500_000) -> None:
+    """Times the order IDs of a batch on all the cores, the workers are started beforehand"""
+
+    rng = random.Random(0)
+    orders = [
+        Order(
+            SETTLE_OPERATION,
+            rng.randbytes(32),
+            rng.getrandbits(64),
+            rng.getrandbits(32),
+            rng.randrange(80),
+            rng.getrandbits(48),
+            rng.getrandbits(48),
+            rng.randrange(80),
+            rng.getrandbits(48),
+            rng.getrandbits(48),
+        )
+        for _ in range(order_count)
+    ]
+
+    with OrderIdHasher() as hasher:
+        # Start the workers outside of the measure
+        hasher.order_ids(orders[:_MIN_PARALLEL])
+        start = time.perf_counter()
+        hasher.order_ids(orders)
+        elapsed = time.perf_counter() - start
+    print(f"{order_count} order IDs in {elapsed:.2f}s, {order_count / elapsed:.0f} orders/s on {hasher.workers} processes")
+
+
+if __name__ == "__main__":
+    benchmark()
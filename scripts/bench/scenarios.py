@@ -0,0 +1,46 @@
+"""
+Times a price grid of stress scenarios over a synthetic book.
+Run from the repository root: python -m scripts.bench.scenarios
+"""
+
+import os
+import time
+from fractions import Fraction
+
+import numpy as np
+
+from contracts_unified.library.constants import RATE_ONE
+from contracts_unified.offchain.scenarios import price_grid, run_scenarios
+from contracts_unified.offchain.state import Instrument, Position
+
+
+def benchmark(account_count: int = 200_000, instrument_count: int = 80, positions_per_account: int = 4) -> None:
+    """Times moving every price together from 50% to 150%, on all the cores"""
+
+    rng = np.random.default_rng(0)
+    instruments = [
+        Instrument(0, 100, 150, 50, 75, 0, RATE_ONE + 10**9, RATE_ONE + 10**8, 800, 0, 0, 0, 10**15, 10**16)
+        for _ in range(instrument_count)
+    ]
+    prices = [int(price) for price in rng.integers(10**6, 10**12, instrument_count)]
+
+    empty = Position().encode()
+    boxes = []
+    for _ in range(account_count):
+        positions = [empty] * instrument_count
+        for instrument_id in rng.integers(0, instrument_count, positions_per_account):
+            positions[instrument_id] = Position(int(rng.integers(0, 10**10)), int(rng.integers(-10**10, 10**10)), RATE_ONE).encode()
+        boxes.append(b"".join(positions))
+    instruments_box = b"".join(instrument.encode() for instrument in instruments)
+
+    scenarios = price_grid(prices, range(instrument_count), [Fraction(percent, 100) for percent in range(50, 151, 10)])
+    start = time.perf_counter()
+    results = run_scenarios(boxes, instruments_box, instrument_count, prices, scenarios)
+    elapsed = time.perf_counter() - start
+    print(f"{len(scenarios)} scenarios over {account_count} accounts in {elapsed:.2f}s on {os.cpu_count()} cores")
+    for result in results:
+        print(f"{result.name}: {result.liquidatable} liquidatable, shortfall {result.shortfall}")
+
+
+if __name__ == "__main__":
+    benchmark()
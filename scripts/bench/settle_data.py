@@ -0,0 +1,51 @@
+"""
+Times the settle amounts calculator on random fills over a synthetic book.
+Run from the repository root: python -m scripts.bench.settle_data
+"""
+
+import random
+import time
+
+from contracts_unified.library.constants import RATE_ONE
+from contracts_unified.offchain.orders import SETTLE_OPERATION, Order
+from contracts_unified.offchain.settle_data import FillRequest, SettleDataCalculator
+from contracts_unified.offchain.state import Instrument, Position
+
+
+def benchmark(fill_count: int = 20_000, instrument_count: int = 80, account_count: int = 2000) -> None:
+    """Times calculating the amounts of fills between random accounts, priced around the instrument prices"""
+
+    rng = random.Random(0)
+    instruments = [
+        Instrument(0, 100, 150, 50, 75, 0, RATE_ONE + 10**9, RATE_ONE + 10**8, 800, 10**9, 2 * 10**9, 10**10, 10**15, 10**16)
+        for _ in range(instrument_count)
+    ]
+    prices = [rng.randint(10**8, 10**10) for _ in range(instrument_count)]
+
+    accounts = {}
+    for _ in range(account_count):
+        positions = [Position()] * instrument_count
+        for instrument_id in rng.sample(range(instrument_count), 6):
+            positions[instrument_id] = Position(rng.randint(0, 10**10), rng.randint(-10**9, 10**9), RATE_ONE)
+        accounts[rng.randbytes(32)] = positions
+    keys = list(accounts)
+
+    fills = []
+    for nonce in range(fill_count):
+        sell_instrument, buy_instrument = rng.sample(range(instrument_count), 2)
+        sell_amount = rng.randint(10**8, 10**10)
+        buy_amount = sell_amount * prices[sell_instrument] // prices[buy_instrument]
+        buyer = Order(SETTLE_OPERATION, rng.choice(keys), nonce, 2000, sell_instrument, sell_amount, 10**9, buy_instrument, buy_amount, 10**9)
+        seller = Order(SETTLE_OPERATION, rng.choice(keys), nonce, 2000, buy_instrument, buy_amount, 10**9, sell_instrument, sell_amount * 99 // 100, 10**9)
+        fills.append(FillRequest(buyer, seller, rng.randint(1, sell_amount // 10)))
+
+    calculator = SettleDataCalculator(instruments, prices, accounts, 1000, 1000, (1, 1000), (1, 2000))
+    start = time.perf_counter()
+    results = calculator.calculate(fills)
+    elapsed = time.perf_counter() - start
+    accepted = sum(result.amounts is not None for result in results)
+    print(f"{fill_count / elapsed:.0f} fills/s, {accepted} of {fill_count} fills accepted")
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,6 @@
+"""The off-chain tooling needs the offchain extra, its tests are skipped without it"""
+
+import importlib.util
+
+if importlib.util.find_spec("numpy") is None:
+    collect_ignore_glob = ["test_*.py"]
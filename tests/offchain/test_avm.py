@@ -0,0 +1,76 @@
+"""Tests the mirrors of the AVM integer operations"""
+
+import pytest
+
+from contracts_unified.library.constants import RATE_ONE
+from contracts_unified.offchain.avm import (
+    UINT64_MAX,
+    AvmError,
+    add,
+    signed_abs,
+    signed_add,
+    signed_gte,
+    signed_neg,
+    sub,
+    teal_expt,
+    to_signed,
+    u64,
+    wide_ratio,
+)
+
+
+def test_two_complement_encoding():
+    """Signed values are stored as uint64 bit patterns"""
+
+    assert u64(-1) == UINT64_MAX
+    assert to_signed(u64(-5)) == -5
+    assert signed_neg(0) == 0
+    assert signed_neg(u64(7)) == u64(-7)
+    assert signed_abs(u64(-7)) == 7
+    assert signed_gte(u64(3), u64(-3))
+    assert not signed_gte(u64(-4), u64(-3))
+
+    with pytest.raises(AvmError):
+        u64(2**64)
+
+
+def test_unsigned_operations_fail_like_the_opcodes():
+    """+ panics on overflow and - on a negative result"""
+
+    assert add(UINT64_MAX - 1, 1) == UINT64_MAX
+    with pytest.raises(AvmError):
+        add(UINT64_MAX, 1)
+    with pytest.raises(AvmError):
+        sub(1, 2)
+
+
+def test_signed_add_fails_on_overflow():
+    """Adding two values of the same sign must keep the sign"""
+
+    assert to_signed(signed_add(u64(-5), 3)) == -2
+    assert to_signed(signed_add(u64(-(2**63)), 2**63 - 1)) == -1
+    with pytest.raises(AvmError):
+        signed_add(2**63 - 1, 1)
+    with pytest.raises(AvmError):
+        signed_add(u64(-(2**63)), u64(-1))
+
+
+def test_wide_ratio():
+    """Products are computed in 128 bits and the quotient must fit in 64 bits"""
+
+    assert wide_ratio([2**63, 6], [4]) == 3 * 2**62
+    assert wide_ratio([10, 10], [3]) == 33
+    with pytest.raises(AvmError):
+        wide_ratio([2**64, 2**64], [1])
+    with pytest.raises(AvmError):
+        wide_ratio([2**63, 4], [1])
+    with pytest.raises(AvmError):
+        wide_ratio([1], [0])
+
+
+def test_teal_expt():
+    """Compounding is done by squaring, truncating at every step"""
+
+    assert teal_expt(RATE_ONE + RATE_ONE // 100, 0) == RATE_ONE
+    assert teal_expt(RATE_ONE + RATE_ONE // 100, 2) == RATE_ONE * 10201 // 10000
+    assert teal_expt(RATE_ONE + 1, 3) == RATE_ONE + 3
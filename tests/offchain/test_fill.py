@@ -0,0 +1,81 @@
+"""Tests the largest fill solver against the settle mirror"""
+
+import random
+
+from contracts_unified.library.constants import RATE_ONE
+from contracts_unified.offchain.avm import AvmError
+from contracts_unified.offchain.fill import (
+    OrderSide,
+    _FillEvaluator,
+    max_fill,
+    simulate_settle,
+)
+from contracts_unified.offchain.state import Instrument, Position
+
+INSTRUMENT_COUNT = 4
+
+
+def _instrument(rng):
+    """A random instrument with a small pool, so the fills run into the pool and health limits"""
+
+    return Instrument(
+        0, rng.randint(0, 300), rng.randint(0, 300), 50, 50, 0,
+        RATE_ONE + rng.randint(0, 10**10), RATE_ONE + rng.randint(0, 10**10), rng.randint(0, 900),
+        10**9, 2 * 10**9, 10**10, rng.randint(0, 5000), rng.randint(5000, 20000),
+    )
+
+
+def _side(rng, sell_instrument, sell_amount, buy_instrument, buy_amount):
+    """An order of a random account with random remaining amounts and fees"""
+
+    positions = [
+        Position(rng.randint(0, 3000), rng.choice([0, rng.randint(-2000, 2000)]), RATE_ONE)
+        for _ in range(INSTRUMENT_COUNT)
+    ]
+    return OrderSide(
+        positions, sell_instrument, sell_amount, buy_instrument, buy_amount,
+        rng.randint(0, 3000), rng.randint(0, 3000), rng.randint(0, 3000),
+        rng.choice([0, 1]), rng.choice([50, 100]),
+    )
+
+
+def _largest_settled(buyer, seller, instruments, prices, timestamp):
+    """Largest buyer_to_send the settle mirror accepts, found by trying every fill from the largest down"""
+
+    evaluator = _FillEvaluator.create(buyer, seller, instruments, prices, timestamp, True)
+    for buyer_to_send in range(evaluator.upper_bound(), 0, -1):
+        try:
+            simulate_settle(buyer, seller, evaluator.amounts(buyer_to_send), instruments, prices, timestamp)
+        except AvmError:
+            continue
+        return buyer_to_send
+    return 0
+
+
+def test_max_fill_is_the_largest_fill_settle_accepts():
+    """The solver finds the largest fill the settle mirror accepts, and the mirror accepts its amounts"""
+
+    rng = random.Random(11)
+    settled = 0
+    for _ in range(150):
+        instruments = [_instrument(rng) for _ in range(INSTRUMENT_COUNT)]
+        prices = [rng.randint(10**8, 10**10) for _ in range(INSTRUMENT_COUNT)]
+        sold, bought = rng.sample(range(INSTRUMENT_COUNT), 2)
+        buyer_sell, buyer_buy, seller_sell = rng.randint(1, 3000), rng.randint(1, 3000), rng.randint(1, 3000)
+        seller_buy = max(1, buyer_sell * seller_sell // buyer_buy - rng.randint(0, 3))
+        buyer = _side(rng, sold, buyer_sell, bought, buyer_buy)
+        seller = _side(rng, bought, seller_sell, sold, seller_buy)
+        timestamp = rng.randint(0, 1000)
+
+        amounts = max_fill(buyer, seller, instruments, prices, timestamp)
+        if amounts is not None:
+            simulate_settle(buyer, seller, amounts, instruments, prices, timestamp)
+            settled += 1
+
+        if buyer.sell_amount * seller.sell_amount < buyer.buy_amount * seller.buy_amount:
+            assert amounts is None
+        else:
+            expected = _largest_settled(buyer, seller, instruments, prices, timestamp)
+            assert (amounts.buyer_to_send if amounts else 0) == expected
+
+    assert settled > 50
@@ -0,0 +1,178 @@
+"""Tests the health mirrors against values worked out from the contract health_check"""
+
+import random
+
+import numpy as np
+import pytest
+
+from contracts_unified.core.state_handler.global_handler import GlobalStateHandler
+from contracts_unified.library.constants import RATE_ONE
+from contracts_unified.offchain.avm import AvmError
+from contracts_unified.offchain.batch_health import batch_health
+from contracts_unified.offchain.health import health_check, instrument_health
+from contracts_unified.offchain.health_updater import (
+    MAX_INSTRUMENTS,
+    SAFE_TERM,
+    HealthUpdater,
+)
+from contracts_unified.offchain.price_index import LiquidationPriceIndex
+from contracts_unified.offchain.state import Instrument, Position
+
+# Haircuts of 10% and 5%, margins of 15% and 7.5%, optimal utilization of 80%
+INSTRUMENT = Instrument(0, 100, 150, 50, 75, 0, RATE_ONE, RATE_ONE * 11 // 10, 800, 0, 0, 0, 0, 0)
+# A price of 2, in pricecaster units
+PRICE = 2 * 10**9
+
+
+def _random_book(rng, account_count, instrument_count):
+    """Random accounts over random instruments, positions are left empty with some probability"""
+
+    instruments = [
+        Instrument(0, 100, 150, 50, 75, 0, RATE_ONE + rng.randint(0, 10**9), RATE_ONE + rng.randint(0, 10**8), 800, 0, 0, 0, 0, 0)
+        for _ in range(instrument_count)
+    ]
+    prices = [rng.randint(10**6, 10**12) for _ in range(instrument_count)]
+    accounts = [
+        [
+            Position(rng.randint(0, 10**10), rng.randint(-(10**10), 10**10), RATE_ONE) if rng.random() < 0.6 else Position()
+            for _ in range(instrument_count)
+        ]
+        for _ in range(account_count)
+    ]
+    return instruments, prices, accounts
+
+
+def _expected(positions, instruments, prices, use_maint):
+    """Health as computed by the mirror, None where the contract fails"""
+
+    try:
+        return health_check(positions, instruments, prices, use_maint)
+    except AvmError:
+        return None
+
+
+@pytest.mark.parametrize(
+    "position, initial, maintenance",
+    [
+        # price * cash * (1 - haircut)
+        (Position(1000, 0, 0), 1800, 1900),
+        # The borrow rounds up to 1001, -price * 1001 * (1 + margin)
+        (Position(0, -1000, RATE_ONE), -2302, -2152),
+        # The lend accrued to 1100 counts for price * 1100 * (1 - haircut) * (1 - optimal utilization)
+        (Position(0, 1000, RATE_ONE), 1980 - 1584, 2090 - 1672),
+        (Position(0, 0, 0), 0, 0),
+    ],
+)
+def test_instrument_health(position, initial, maintenance):
+    """Health of a single position"""
+
+    assert instrument_health(position, INSTRUMENT, PRICE, False) == initial
+    assert instrument_health(position, INSTRUMENT, PRICE, True) == maintenance
+    assert health_check([position], [INSTRUMENT], [PRICE], False) == initial
+
+
+def test_health_check_fails_on_overflow():
+    """A term that does not fit in 64 bits fails the contract"""
+
+    with pytest.raises(AvmError):
+        health_check([Position(2**62, 0, 0)], [INSTRUMENT], [10**12], True)
+
+
+def test_health_check_ignores_positions_without_instrument():
+    """Only the positions of listed instruments count"""
+
+    positions = [Position(1000, 0, 0), Position(10**6, 0, 0)]
+    assert health_check(positions, [INSTRUMENT], [PRICE], False) == 1800
+
+
+def test_batch_health_matches_health_check():
+    """The vectorized engine is bit-exact with the mirror, failures included"""
+
+    rng = random.Random(0)
+    instruments, prices, accounts = _random_book(rng, 300, 5)
+    accounts.append([Position(2**62, 0, 0)] + [Position()] * 4)
+    prices[0] = 10**12
+
+    cash = np.array([[position.cash for position in positions] for positions in accounts], dtype=np.uint64)
+    principal = np.array([[position.principal for position in positions] for positions in accounts], dtype=np.int64)
+    slot = np.array([[position.slot for position in positions] for positions in accounts], dtype=np.uint64)
+    result = batch_health(cash, principal, slot, instruments, prices)
+
+    for row, positions in enumerate(accounts):
+        for use_maint, health, failed in (
+            (False, result.initial, result.initial_failed),
+            (True, result.maintenance, result.maintenance_failed),
+        ):
+            expected = _expected(positions, instruments, prices, use_maint)
+            assert (None if failed[row] else int(health[row])) == expected
+    assert result.maintenance_failed[-1]
+
+
+def test_health_updater_follows_prices():
+    """The incremental health stays exact through price ticks and account updates"""
+
+    rng = random.Random(1)
+    instruments, prices, accounts = _random_book(rng, 200, 6)
+    updater = HealthUpdater(instruments, prices)
+    for account, positions in enumerate(accounts):
+        updater.update_account(account, positions)
+
+    for _ in range(4):
+        tick = {instrument_id: max(1, int(price * rng.uniform(0.5, 1.5))) for instrument_id, price in enumerate(prices)}
+        prices = [tick[instrument_id] for instrument_id in range(len(prices))]
+        updater.update_prices(tick)
+
+        account = rng.randrange(len(accounts))
+        accounts[account] = [Position(rng.randint(0, 10**10), 0, 0)] * len(instruments)
+        updater.update_account(account, accounts[account])
+
+        expected = [_expected(positions, instruments, prices, True) for positions in accounts]
+        assert [updater.health(account) for account in range(len(accounts))] == expected
+        assert sorted(updater.liquidatable()) == [account for account, health in enumerate(expected) if health is not None and health < 0]
+
+
+def test_price_index_finds_liquidatable_accounts():
+    """
+    Accounts are reported once a price update makes their maintenance health negative, they stay
+    liquidatable until refreshed
+    """
+
+    rng = random.Random(2)
+    instruments, prices, accounts = _random_book(rng, 200, 4)
+    index = LiquidationPriceIndex(instruments, prices)
+    for account, positions in enumerate(accounts):
+        index.update_account(account, positions)
+
+    for _ in range(4):
+        tick = {instrument_id: max(1, int(price * rng.uniform(0.5, 1.5))) for instrument_id, price in enumerate(prices)}
+        prices = [tick[instrument_id] for instrument_id in range(len(prices))]
+        reported = index.update_prices(tick)
+
+        expected = {account for account, positions in enumerate(accounts) if (_expected(positions, instruments, prices, True) or 0) < 0}
+        assert set(reported) <= expected <= index.liquidatable
+        assert set(index.refresh_liquidatable()) == index.liquidatable == expected
+
+
+def test_price_index_rechecks_accounts_whose_health_check_fails():
+    """An account the contract can not check at the current prices is checked again on every update"""
+
+    # A borrow covered by cash on an instrument whose price overflows the health accumulation
+    positions = [Position(0, -(10**10), RATE_ONE), Position(10**10, 0, 0)]
+    index = LiquidationPriceIndex([INSTRUMENT, INSTRUMENT], [PRICE, 2**62])
+    assert not index.update_account("account", positions)
+    assert _expected(positions, index.instruments, index.prices, True) is None
+
+    assert not index.update_price(0, PRICE + 1)
+    assert index.update_price(1, PRICE) == ["account"]
+    assert index.liquidatable == {"account"}
+
+
+def test_health_updater_instrument_bound():
+    """The safe terms of every instrument the contract supports can be summed in an int64"""
+
+    assert GlobalStateHandler.max_instrument_count <= MAX_INSTRUMENTS
+    assert MAX_INSTRUMENTS * SAFE_TERM <= 2**63
+
+    HealthUpdater([INSTRUMENT] * MAX_INSTRUMENTS, [PRICE] * MAX_INSTRUMENTS)
+    with pytest.raises(ValueError):
+        HealthUpdater([INSTRUMENT] * (MAX_INSTRUMENTS + 1), [PRICE] * (MAX_INSTRUMENTS + 1))
@@ -0,0 +1,120 @@
+"""Tests the order expiry keeper against the local stand-in of the contract"""
+
+import hashlib
+
+import pytest
+from algosdk import abi, account
+
+from contracts_unified.offchain.avm import AvmError
+from contracts_unified.offchain.keeper import (
+    LocalCleanupClient,
+    OrderKeeper,
+    TransactionLimits,
+    expired_order_ids,
+    get_call_order,
+    get_expiration,
+    pack_calls,
+)
+from contracts_unified.offchain.orders import ORDER_PREFIX
+
+NOW = 1_700_000_000
+
+
+def _boxes(count, expiration, first=0):
+    """Order boxes expiring from expiration on, one second apart"""
+
+    return {
+        ORDER_PREFIX + (first + index).to_bytes(32, "big"): (expiration + index).to_bytes(8, "big") + bytes(24)
+        for index in range(count)
+    }
+
+
+class _FailingClient(LocalCleanupClient):
+    """Fails the submission of one group"""
+
+    def __init__(self, boxes, timestamp, failing_group):
+        super().__init__(boxes, timestamp)
+        self.failing_group = failing_group
+
+    def submit(self, group):
+        if self.groups == self.failing_group:
+            self.failing_group = None
+            raise AvmError("group rejected")
+        super().submit(group)
+
+
+def test_pack_calls_fills_calls_and_groups():
+    """Calls are limited by the references and the opcode budget, groups by their size"""
+
+    limits = TransactionLimits()
+    assert limits.orders_per_call() == 8
+    assert [len(group) for group in pack_calls([ORDER_PREFIX + bytes(32)] * 300)] == [16, 16, 6]
+    assert pack_calls([]) == []
+
+    with pytest.raises(AvmError):
+        pack_calls([ORDER_PREFIX + bytes(32)], TransactionLimits(opcode_budget=100))
+
+
+def test_get_call_order():
+    """The order and its expiration are read from the user operation of a settle call"""
+
+    order_type = abi.ABIType.from_string("(byte,address,uint64,uint64,uint8,uint64,uint64,uint8,uint64,uint64)")
+    operation_type = abi.ABIType.from_string("((address,byte[32],uint64),byte[],byte[],uint8,byte[],address,byte[])")
+    address = account.generate_account()[1]
+    order = order_type.encode([6, address, 7, 123456, 2, 10, 0, 3, 20, 0])
+    operation = operation_type.encode([[address, bytes(32), 5], order, b"data", 1, b"signature", address, b"proxy"])
+
+    order_id, expiration = get_call_order([b"selector", b"account", operation])
+    assert expiration == 123456
+    assert order_id == ORDER_PREFIX + hashlib.new("sha512_256", order).digest()
+
+
+def test_run_once_cleans_the_expired_orders():
+    """Only the orders expired at the latest block are cleaned"""
+
+    boxes = {**_boxes(100, NOW - 100), **_boxes(50, NOW, first=100)}
+    client = LocalCleanupClient(dict(boxes), NOW)
+    keeper = OrderKeeper(client)
+    keeper.track_boxes(boxes)
+
+    assert sorted(keeper.pop_expired(NOW)) == sorted(expired_order_ids(boxes, NOW))
+    keeper.track_boxes(boxes)
+    assert keeper.run_once() == 100
+    assert sorted(client.boxes) == sorted(key for key, box in boxes.items() if int.from_bytes(box[:8], "big") >= NOW)
+    assert keeper.run_once() == 0
+
+
+def test_run_once_tracks_the_orders_of_a_failed_group_again():
+    """Orders that were not cleaned are tracked again and cleaned by the next run"""
+
+    boxes = _boxes(300, NOW - 1000)
+    client = _FailingClient(dict(boxes), NOW, failing_group=1)
+    keeper = OrderKeeper(client)
+    keeper.track_boxes(boxes)
+
+    with pytest.raises(AvmError):
+        keeper.run_once()
+    assert len(client.boxes) == 300 - 128
+
+    assert keeper.run_once() == 300 - 128
+    assert not client.boxes
+
+
+def test_legacy_order_boxes_are_skipped():
+    """Boxes of the previous layout do not hold the expiration and are kept by the contract"""
+
+    legacy = {ORDER_PREFIX + bytes(31) + b"\xff": (NOW - 100).to_bytes(8, "big") + bytes(16)}
+    closed = {ORDER_PREFIX + bytes(31) + b"\xfe": (NOW - 100).to_bytes(8, "big")}
+    boxes = {**_boxes(10, NOW - 100), **legacy, **closed}
+    assert get_expiration(next(iter(legacy.values()))) is None
+    assert sorted(expired_order_ids(boxes, NOW)) == sorted([*_boxes(10, NOW - 100), *closed])
+
+    client = LocalCleanupClient(dict(boxes), NOW)
+    keeper = OrderKeeper(client)
+    keeper.track_boxes(boxes)
+    assert keeper.run_once() == 11
+    assert client.boxes == legacy
+
+    # A legacy box referenced by a call is left untouched
+    keeper.clean(legacy)
+    assert client.boxes == legacy
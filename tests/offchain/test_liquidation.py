@@ -0,0 +1,142 @@
+"""Tests the liquidation mirror against values worked out from the contract formulas, and the basket optimizer"""
+
+import random
+
+import pytest
+
+from contracts_unified.library.constants import (
+    PRICECASTER_RESCALE_FACTOR,
+    RATE_ONE,
+    RATIO_ONE,
+)
+from contracts_unified.offchain.avm import AvmError, u64
+from contracts_unified.offchain.health import health_check
+from contracts_unified.offchain.liquidation import (
+    LiquidationSnapshot,
+    calculate_basket_value,
+    optimize_liquidation,
+    scale_basket,
+    simulate_liquidation,
+)
+from contracts_unified.offchain.lp import maximize
+from contracts_unified.offchain.state import Instrument, LiquidationFactors, Position
+
+# Initial haircut of 10%, initial margin of 15%, maintenance haircut of 5%, optimal utilization of 80%
+INSTRUMENT = Instrument(0, 100, 150, 50, 75, 0, RATE_ONE, RATE_ONE, 800, 0, 0, 0, 0, 0)
+# A price of 2.5, in pricecaster units
+PRICE = 25 * 10**8
+
+
+def _value(basket, add_negatives, factor, use_bonus, invert_bonus_or_use_margin, use_opt_utilization):
+    """Value of a basket over two copies of INSTRUMENT, the second priced three times the first"""
+    return calculate_basket_value(
+        basket, [INSTRUMENT, INSTRUMENT], [PRICE, 3 * PRICE],
+        add_negatives, factor, use_bonus, invert_bonus_or_use_margin, use_opt_utilization,
+    )
+
+
+def test_basket_value_follows_the_contract_formulas():
+    """Every term is a single wide ratio truncated like WideRatio, only the entries of the requested sign count"""
+
+    basket = [(0, 1_234_567), (1, -7_654_321)]
+    # bonus = 1 + 200 / 1000 * 5% = 1.01
+    bonus = RATIO_ONE + 200 * 50 // RATIO_ONE
+    assert bonus == 1010
+
+    # amount * price * bonus
+    assert _value(basket, False, 200, True, False, False) == 1_234_567 * PRICE * bonus // (RATIO_ONE * PRICECASTER_RESCALE_FACTOR)
+    # amount * price / bonus
+    assert _value(basket, True, 200, True, True, False) == 7_654_321 * 3 * PRICE * RATIO_ONE // (bonus * PRICECASTER_RESCALE_FACTOR)
+    # amount * price * (1 - haircut) * (1 - optimal utilization)
+    assert _value(basket, False, 0, False, False, True) == 1_234_567 * PRICE * 900 * 200 // (RATIO_ONE * RATIO_ONE * PRICECASTER_RESCALE_FACTOR)
+    # amount * price * (1 + margin)
+    assert _value(basket, True, 0, False, True, False) == 7_654_321 * 3 * PRICE * 1150 * RATIO_ONE // (RATIO_ONE * RATIO_ONE * PRICECASTER_RESCALE_FACTOR)
+
+    # The sum is truncated term by term
+    assert _value([(0, 3), (0, 3)], False, 0, False, False, False) == 2 * (3 * PRICE * 900 * RATIO_ONE // (RATIO_ONE * RATIO_ONE * PRICECASTER_RESCALE_FACTOR))
+    assert _value([], False, 0, False, False, False) == 0
+
+
+def test_basket_value_fails_like_the_contract():
+    """Ratios are uint16 and the result of every wide ratio must fit in 64 bits"""
+
+    instruments = [INSTRUMENT._replace(initial_margin=2**16 - RATIO_ONE)]
+    with pytest.raises(AvmError):
+        calculate_basket_value([(0, -1)], instruments, [PRICE], True, 0, False, True, False)
+
+    instruments = [INSTRUMENT._replace(initial_haircut=RATIO_ONE + 1)]
+    with pytest.raises(AvmError):
+        calculate_basket_value([(0, 1)], instruments, [PRICE], False, 0, False, False, False)
+
+    with pytest.raises(AvmError):
+        calculate_basket_value([(0, 2**62)], [INSTRUMENT], [2**63], False, 200, True, False, False)
+
+
+def test_scale_basket_truncates_toward_zero():
+    """Negative amounts are scaled by their absolute value, like the contract does"""
+
+    basket = [(0, 1000), (1, -1000), (2, 0), (3, 2**63 - 1)]
+    assert scale_basket(basket, 1, 3) == [(0, 333), (1, -333), (2, 0), (3, (2**63 - 1) // 3)]
+    assert scale_basket(basket, 5, 5) == basket
+
+    with pytest.raises(AvmError):
+        scale_basket(basket, 1, 0)
+    with pytest.raises(AvmError):
+        scale_basket([(0, 2**62)], 4, 1)
+    # The scaled value is encoded as a uint64 bit pattern
+    assert u64(scale_basket([(0, -(2**62))], 3, 2)[0][1]) == u64(-(3 * 2**61))
+
+
+def test_maximize_solves_small_programs():
+    """The optimum of bounded programs, and the inputs it refuses"""
+
+    # max 3x + 5y st x <= 4, 2y <= 12, 3x + 2y <= 18, the optimum is x = 2, y = 6
+    solution = maximize([3.0, 5.0], [[1.0, 0.0], [0.0, 2.0], [3.0, 2.0]], [4.0, 12.0, 18.0], [float("inf")] * 2)
+    assert solution == pytest.approx([2.0, 6.0])
+
+    # Upper bounds are reached before the constraints
+    solution = maximize([1.0, 1.0], [[1.0, 1.0]], [10.0], [3.0, 4.0])
+    assert solution == pytest.approx([3.0, 4.0])
+
+    # Variables with a negative objective stay at zero
+    solution = maximize([1.0, -1.0], [[1.0, -1.0]], [1.0], [5.0, 5.0])
+    assert solution[0] - solution[1] == pytest.approx(1.0)
+    assert solution == pytest.approx([1.0, 0.0])
+
+    with pytest.raises(ValueError):
+        maximize([1.0], [[1.0]], [-1.0], [1.0])
+    with pytest.raises(ValueError):
+        maximize([1.0], [[-1.0]], [1.0], [float("inf")])
+
+
+def _snapshot(rng):
+    """A random account, liquidatable or not, over instruments with random indexes"""
+
+    instruments = [
+        Instrument(0, 100, 150, 50, 75, 0, RATE_ONE + rng.randint(0, 10**9), RATE_ONE + rng.randint(0, 10**8), 800, 0, 0, 0, 10**12, 10**13)
+        for _ in range(4)
+    ]
+    prices = [rng.randint(10**6, 10**9) for _ in range(4)]
+    positions = [Position(rng.randint(0, 10**6), rng.randint(-3 * 10**6, 10**6), RATE_ONE) for _ in range(4)]
+    return LiquidationSnapshot(positions, instruments, prices, LiquidationFactors(100, 200), 1000)
+
+
+def test_optimized_baskets_pass_the_liquidation_mirror():
+    """The optimizer returns what the mirror does for its baskets, with alpha between 0 and 1"""
+
+    rng = random.Random(1)
+    results = [(snapshot, optimize_liquidation(snapshot)) for snapshot in (_snapshot(rng) for _ in range(200))]
+    liquidated = [(snapshot, result) for snapshot, result in results if result is not None]
+    assert len(liquidated) > 100
+
+    for snapshot, result in liquidated:
+        assert simulate_liquidation(snapshot, result.cash, result.pool) == result
+        assert 0 < result.alpha_numerator <= result.alpha_denominator
+        assert any(amount > 0 for _, amount in result.scaled_cash + result.scaled_pool)
+
+    # Accounts that are not liquidatable get no baskets
+    for snapshot, result in results:
+        if health_check(snapshot.positions, snapshot.instruments, snapshot.prices, True) >= 0:
+            assert result is None
+            with pytest.raises(AvmError):
+                simulate_liquidation(snapshot, [], [])
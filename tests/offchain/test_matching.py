@@ -0,0 +1,120 @@
+"""Tests the matching engine emits fills in price-time priority that settle accepts"""
+
+import random
+
+from contracts_unified.offchain.fill import OrderSide, validate_fill
+from contracts_unified.offchain.matching import MatchingEngine
+from contracts_unified.offchain.orders import SETTLE_OPERATION, Order, get_order_id
+
+
+class _GreedyFunding:
+    """Asks for more than settle accepts, the engine must cap it"""
+
+    def borrow(self, _account, _instrument_id, amount):
+        """Borrows twice the amount"""
+        return 2 * amount
+
+    def repay(self, _account, _instrument_id, amount):
+        """Repays more than received"""
+        return amount + 5
+
+
+def _order(nonce, sell_instrument, sell_amount, buy_amount, expiration_time=10**9):
+    """A cash only order selling one of two instruments for the other"""
+    return Order(SETTLE_OPERATION, bytes(32), nonce, expiration_time, sell_instrument, sell_amount, 0, 1 - sell_instrument, buy_amount, 0)
+
+
+def test_price_time_priority():
+    """The cheapest seller fills first, sellers at the same price fill in arrival order"""
+
+    engine = MatchingEngine(verify=True)
+    engine.submit(_order(1, 0, 100, 110), 0)
+    engine.submit(_order(2, 0, 100, 105), 0)
+    engine.submit(_order(3, 0, 100, 105), 0)
+
+    calls = engine.submit(_order(4, 1, 300, 200), 0)
+    assert [call.seller.nonce for call in calls] == [2, 3, 1]
+    assert [call.amounts.seller_to_send for call in calls] == [100, 100, 81]
+    assert [call.seller_in_book for call in calls] == [False, False, False]
+
+    # The buyer is fully filled, the last seller rests with its remaining amount
+    assert engine.remaining(calls[0].buyer_id)[0] == 0
+    assert engine.remaining(calls[2].seller_id)[0] == 19
+    assert engine.best(0, 1, 0) == calls[2].seller
+
+
+def test_expired_cancelled_and_duplicate_orders_are_not_matched():
+    """Expired and cancelled resting orders are skipped, submitting an order twice does nothing"""
+
+    engine = MatchingEngine(verify=True)
+    engine.submit(_order(1, 0, 100, 100, expiration_time=10), 0)
+    cancelled = _order(2, 0, 100, 100)
+    engine.submit(cancelled, 0)
+    resting = _order(3, 0, 100, 100)
+    engine.submit(resting, 0)
+    engine.cancel(get_order_id(cancelled.encode()))
+
+    assert not engine.submit(resting, 20)
+    calls = engine.submit(_order(4, 1, 50, 50), 20)
+    assert [call.seller.nonce for call in calls] == [3]
+    calls = engine.submit(_order(5, 1, 50, 50), 20)
+    assert [call.seller.nonce for call in calls] == [3]
+    assert calls[0].seller_in_book
+
+
+def test_sellers_too_small_after_rounding_are_skipped():
+    """A seller the buyer can not pay for after rounding is skipped, the next ones are still matched"""
+
+    engine = MatchingEngine(verify=True)
+    engine.submit(_order(1, 0, 9, 12), 0)
+    engine.submit(_order(2, 0, 7, 9), 0)
+    engine.submit(_order(3, 0, 6, 5), 0)
+
+    # After the first fill the buyer has 6 left, 4 of the second seller would cost ceil(36 / 7) = 6 over the buyer's price
+    calls = engine.submit(_order(4, 1, 11, 8), 0)
+    assert [(call.seller.nonce, call.amounts.seller_to_send, call.amounts.buyer_to_send) for call in calls] == [(3, 6, 5), (1, 3, 4)]
+
+    # The skipped seller stays at the top of the book
+    assert engine.best(0, 1, 0).nonce == 2
+
+
+def _side(order, remaining):
+    """The order side of a fill, with the remaining amounts tracked by the test"""
+    return OrderSide((), order.sell_instrument, order.sell_amount, order.buy_instrument, order.buy_amount, *remaining)
+
+
+def test_random_fills_pass_validate_fill():
+    """Every fill passes the settle checks, whatever the fees and the funding policy ask"""
+
+    rng = random.Random(1)
+    for fees, funding in (((0, 1), None), ((1, 30), _GreedyFunding()), ((1, 100), _GreedyFunding())):
+        # The fills are checked against the remaining amounts tracked here, not by the engine
+        engine = MatchingEngine(buyer_fee=fees, seller_fee=fees, funding=funding)
+        remaining = {}
+        fills = 0
+        for nonce in range(5000):
+            timestamp = nonce // 20
+            sell_amount = rng.randrange(1, 10 ** rng.randrange(1, 10))
+            buy_amount = max(1, int(sell_amount * rng.uniform(0.5, 2)))
+            sell_instrument = rng.randrange(2)
+            order = Order(
+                SETTLE_OPERATION, bytes(32), nonce, 100 + rng.randrange(1000),
+                sell_instrument, sell_amount, rng.randrange(sell_amount + 1),
+                1 - sell_instrument, buy_amount, rng.randrange(buy_amount + 1),
+            )
+            remaining.setdefault(get_order_id(order.encode()), [order.sell_amount, order.max_borrow_amount, order.max_repay_amount])
+            for call in engine.submit(order, timestamp):
+                assert call.buyer.expiration_time > timestamp and call.seller.expiration_time > timestamp
+                amounts = call.amounts
+                buyer, seller = remaining[call.buyer_id], remaining[call.seller_id]
+                validate_fill(_side(call.buyer, buyer), _side(call.seller, seller), amounts)
+
+                buyer[0] -= amounts.buyer_to_send
+                buyer[1] -= amounts.buyer_to_borrow
+                buyer[2] -= amounts.buyer_to_repay
+                seller[0] -= amounts.seller_to_send
+                seller[1] -= amounts.seller_to_borrow
+                seller[2] -= amounts.seller_to_repay
+                fills += 1
+        assert fills > 0
+        assert all(engine.remaining(order_id) == tuple(amounts) for order_id, amounts in remaining.items())
@@ -0,0 +1,59 @@
+"""Tests the order IDs against the ABI encoding of OrderData, and the pool hashing against the serial one"""
+
+import hashlib
+import random
+
+from algosdk import abi
+
+from contracts_unified.library.c3types_user import OrderData
+from contracts_unified.offchain.orders import (
+    _MIN_PARALLEL,
+    ORDER_PREFIX,
+    SETTLE_OPERATION,
+    Order,
+    OrderIdHasher,
+    encode_orders,
+    get_order_id,
+    hash_orders,
+)
+
+# The ABI type of OrderData, as the contract encodes it before hashing
+ORDER_TYPE = abi.ABIType.from_string(str(OrderData().type_spec()))
+
+
+def _order(rng):
+    """A random order, amounts cover the whole uint64 range"""
+
+    return Order(
+        SETTLE_OPERATION, rng.randbytes(32), rng.getrandbits(64), rng.getrandbits(64),
+        rng.getrandbits(8), rng.getrandbits(64), rng.getrandbits(64),
+        rng.getrandbits(8), rng.getrandbits(64), rng.getrandbits(64),
+    )
+
+
+def test_order_id_is_the_hash_of_the_abi_encoding():
+    """Orders encode like OrderData and their IDs are "order" followed by the SHA-512/256 of the encoding"""
+
+    rng = random.Random(5)
+    for order in [_order(rng) for _ in range(50)] + [Order(0, bytes(32), 0, 0, 0, 0, 0, 0, 0, 0)]:
+        encoded = ORDER_TYPE.encode([order.operation, order.account, *order[2:]])
+        assert order.encode() == encoded
+        assert Order.decode(encoded) == order
+        assert get_order_id(encoded) == ORDER_PREFIX + hashlib.new("sha512_256", encoded).digest()
+
+
+def test_pool_hashing_matches_serial_hashing():
+    """The pool returns the serial IDs in order, on both sides of the parallel threshold"""
+
+    rng = random.Random(6)
+    orders = [_order(rng) for _ in range(_MIN_PARALLEL)]
+
+    with OrderIdHasher(workers=3, chunk_size=3_000) as hasher:
+        for count, parallel in ((_MIN_PARALLEL - 1, False), (_MIN_PARALLEL, True)):
+            encoded = encode_orders(orders[:count])
+            assert hasher.hash_encoded(encoded) == OrderIdHasher(workers=1).hash_encoded(encoded) == hash_orders(encoded)
+            # The pool is only started from the threshold on
+            assert (hasher._executor is not None) == parallel  # pylint: disable=protected-access
+
+    ids = OrderIdHasher(workers=1).order_ids(orders[:10])
+    assert ids == [get_order_id(order.encode()) for order in orders[:10]]
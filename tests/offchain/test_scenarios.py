@@ -0,0 +1,84 @@
+"""Tests the scenario runner against the health mirror on a small book"""
+
+from fractions import Fraction
+
+from contracts_unified.library.constants import RATE_ONE
+from contracts_unified.offchain.avm import AvmError
+from contracts_unified.offchain.health import health_check
+from contracts_unified.offchain.scenarios import (
+    Scenario,
+    price_grid,
+    run_scenarios,
+    shock_prices,
+)
+from contracts_unified.offchain.state import Instrument, Position
+
+# Haircuts of 10% and 5%, margins of 15% and 7.5%
+INSTRUMENT = Instrument(0, 100, 150, 50, 75, 0, RATE_ONE, RATE_ONE, 800, 0, 0, 0, 0, 0)
+PRICES = [10**9, 2 * 10**9]
+
+ACCOUNTS = [
+    # Healthy at the current prices, liquidatable once the collateral halves or the borrow margin grows
+    [Position(1000, 0, 0), Position(0, -300, RATE_ONE)],
+    # Only holds cash
+    [Position(500, 0, 0)],
+    # Holds and lends the second instrument, borrows the first
+    [Position(0, -700, RATE_ONE), Position(500, 600, RATE_ONE)],
+    # The health check overflows
+    [Position(2**62, 0, 0), Position(2**62, 0, 0)],
+]
+
+
+def _health(positions, instruments, prices, use_maint):
+    """Health as computed by the mirror, None where the contract fails"""
+
+    try:
+        return health_check(positions, instruments, prices, use_maint)
+    except AvmError:
+        return None
+
+
+def test_shocks_round_down():
+    """Shocked prices are truncated, a grid moves all the given instruments together"""
+
+    assert shock_prices([10, 7], {1: Fraction(1, 2)}) == {1: 3}
+    grid = price_grid([10, 7], [0, 1], [Fraction(1, 2), Fraction(3, 2)])
+    assert grid == [Scenario("prices x0.5", {0: 5, 1: 3}), Scenario("prices x1.5", {0: 15, 1: 10})]
+
+
+def test_scenarios_match_the_health_mirror():
+    """Every scenario result aggregates the healths the mirror computes under the scenario"""
+
+    boxes = [b"".join(position.encode() for position in positions) for positions in ACCOUNTS]
+    instruments_box = INSTRUMENT.encode() * 2
+    scenarios = [
+        Scenario("current"),
+        Scenario("collateral halves", {0: PRICES[0] // 2}),
+        Scenario("tighter margin", instruments={1: {"maintenance_margin": 1000}}),
+    ]
+
+    results = run_scenarios(boxes, instruments_box, 2, PRICES, scenarios, workers=1, keep_health=True)
+    assert [result.name for result in results] == [scenario.name for scenario in scenarios]
+    assert [result.liquidatable for result in results] == [0, 1, 1]
+    assert [result.shortfall for result in results] == [0, 172, 254]
+
+    for scenario, result in zip(scenarios, results):
+        instruments = [INSTRUMENT] * 2
+        for instrument_id, fields in scenario.instruments.items():
+            instruments[instrument_id] = instruments[instrument_id]._replace(**fields)
+        prices = [scenario.prices.get(instrument_id, price) for instrument_id, price in enumerate(PRICES)]
+
+        initial = [_health(positions, instruments, prices, False) for positions in ACCOUNTS]
+        maintenance = [_health(positions, instruments, prices, True) for positions in ACCOUNTS]
+        assert result.health is not None
+        assert [None if failed else int(value) for value, failed in zip(result.health.initial, result.health.initial_failed)] == initial
+        assert [None if failed else int(value) for value, failed in zip(result.health.maintenance, result.health.maintenance_failed)] == maintenance
+
+        assert result.failed == 1
+        assert result.liquidatable == sum(1 for value in maintenance if value is not None and value < 0)
+        assert result.shortfall == -sum(value for value in maintenance if value is not None and value < 0)
+        assert result.unhealthy == sum(1 for value in initial if value is not None and value < 0)
+        assert result.initial_shortfall == -sum(value for value in initial if value is not None and value < 0)
+
+    # The healths are only kept when requested
+    assert run_scenarios(boxes, instruments_box, 2, PRICES, scenarios[:1], workers=1)[0].health is None
@@ -0,0 +1,136 @@
+"""Tests the settle amounts calculator against the settle mirror"""
+
+import random
+import struct
+
+from contracts_unified.core.state_handler import order_handler
+from contracts_unified.library.constants import RATE_ONE
+from contracts_unified.offchain.orders import SETTLE_OPERATION, Order
+from contracts_unified.offchain.settle_data import FillRequest, SettleDataCalculator
+from contracts_unified.offchain.state import (
+    ORDER_EXPIRATION_SIZE,
+    Instrument,
+    OnChainOrder,
+    Position,
+    decode_order_box,
+)
+
+INSTRUMENT_COUNT = 8
+FEES = ((1, 1000), (1, 2000))
+
+
+def _snapshot(rng):
+    """Random instruments, prices and accounts holding positions on some of the instruments"""
+
+    instruments = [
+        Instrument(0, 100, 150, 50, 75, 0, RATE_ONE + rng.randint(0, 10**9), RATE_ONE + rng.randint(0, 10**8), 800, 10**9, 2 * 10**9, 10**10, 10**13, 10**16)
+        for _ in range(INSTRUMENT_COUNT)
+    ]
+    prices = [rng.randint(10**8, 10**10) for _ in range(INSTRUMENT_COUNT)]
+    accounts = {}
+    for _ in range(100):
+        positions = [Position()] * INSTRUMENT_COUNT
+        for instrument_id in rng.sample(range(INSTRUMENT_COUNT), 4):
+            positions[instrument_id] = Position(rng.randint(0, 10**10), rng.randint(-(10**10), 10**10), RATE_ONE)
+        accounts[rng.randbytes(32)] = positions
+    return instruments, prices, accounts
+
+
+def _fills(rng, prices, accounts, count):
+    """Random fills between accounts, the seller asks 1% less than the buyer offers"""
+
+    keys = list(accounts)
+    fills = []
+    for nonce in range(count):
+        sold, bought = rng.sample(range(INSTRUMENT_COUNT), 2)
+        sell_amount = rng.randint(10**8, 10**10)
+        buy_amount = sell_amount * prices[sold] // prices[bought]
+        buyer = Order(SETTLE_OPERATION, rng.choice(keys), nonce, 2000, sold, sell_amount, 10**10, bought, buy_amount, 10**10)
+        seller = Order(SETTLE_OPERATION, rng.choice(keys), nonce, 2000, bought, buy_amount, 10**10, sold, sell_amount * 99 // 100, 10**10)
+        fills.append(FillRequest(buyer, seller, rng.randint(1, sell_amount // 30)))
+    return fills
+
+
+def test_accepted_fills_pass_the_settle_mirror():
+    """Every fill the calculator accepts is accepted by the settle mirror with the same amounts"""
+
+    rng = random.Random(3)
+    instruments, prices, accounts = _snapshot(rng)
+    fills = _fills(rng, prices, accounts, 1000)
+    calculator = SettleDataCalculator(instruments, prices, accounts, 1000, 1000, *FEES)
+
+    results = calculator.calculate(fills)
+    accepted = [(fill, result.amounts) for fill, result in zip(fills, results) if result.amounts is not None]
+    assert accepted
+    for fill, amounts in accepted:
+        calculator.check(fill, amounts)
+
+    errors = {result.error for result in results}
+    assert {"buyer unhealthy", "seller unhealthy"} <= errors
+
+
+def test_health_shortcut_matches_the_settle_mirror(monkeypatch):
+    """Reusing the snapshot health accepts and rejects exactly the fills the full settle mirror does"""
+
+    rng = random.Random(4)
+    instruments, prices, accounts = _snapshot(rng)
+    fills = _fills(rng, prices, accounts, 1000)
+
+    fast = SettleDataCalculator(instruments, prices, accounts, 1000, 1000, *FEES).calculate(fills)
+    mirror = SettleDataCalculator(instruments, prices, accounts, 1000, 1000, *FEES)
+    monkeypatch.setattr(mirror, "_check_fill", lambda fill, amounts, _accrued: mirror.check(fill, amounts))
+    assert mirror.calculate(fills) == fast
+
+
+def test_rejections_follow_the_contract_checks():
+    """Fills failing the order checks are rejected before any health is computed"""
+
+    rng = random.Random(5)
+    instruments, prices, accounts = _snapshot(rng)
+    keys = list(accounts)
+    buyer = Order(SETTLE_OPERATION, keys[0], 0, 2000, 0, 1000, 0, 1, 1000, 0)
+    seller = Order(SETTLE_OPERATION, keys[1], 0, 2000, 1, 1000, 0, 0, 1000, 0)
+    calculator = SettleDataCalculator(instruments, prices, accounts, 1000, 1000)
+
+    results = calculator.calculate([
+        FillRequest(buyer, buyer._replace(sell_instrument=1, buy_instrument=0), 10),
+        FillRequest(buyer, seller._replace(expiration_time=1000), 10),
+        FillRequest(buyer, seller._replace(buy_amount=2000), 10),
+        FillRequest(buyer, seller, 2000),
+        FillRequest(buyer, seller, 0),
+    ])
+    assert [result.error for result in results] == [
+        "self trades are not mirrored",
+        "order expired",
+        "orders do not match",
+        "sell remaining",
+        "empty fill",
+    ]
+
+
+def test_order_boxes_of_both_layouts():
+    """Boxes of the previous layout settle like the current ones once add_order gave them the order expiration"""
+
+    rng = random.Random(6)
+    instruments, prices, accounts = _snapshot(rng)
+    calculator = SettleDataCalculator(instruments, prices, accounts, 1000, 1000, *FEES)
+    fills = _fills(rng, prices, accounts, 100)
+    fill = next(fill for fill, result in zip(fills, calculator.calculate(fills)) if result.amounts is not None)
+    seller = fill.seller
+    remaining = (seller.sell_amount, seller.max_borrow_amount, seller.max_repay_amount)
+
+    legacy = struct.pack(">QQQ", *remaining)
+    current = OnChainOrder(seller.expiration_time, *remaining).encode()
+    closed = current[:ORDER_EXPIRATION_SIZE]
+    assert (len(legacy), len(current)) == (order_handler.LEGACY_ORDER_SIZE.value, order_handler.ORDER_DATA_SIZE.value)
+    assert decode_order_box(legacy, seller.expiration_time) == decode_order_box(current, 0) == OnChainOrder(seller.expiration_time, *remaining)
+    assert decode_order_box(closed, 0) == OnChainOrder(seller.expiration_time, 0, 0, 0)
+
+    results = calculator.calculate([
+        fill,
+        fill._replace(seller_box=decode_order_box(legacy, seller.expiration_time)),
+        fill._replace(seller_box=decode_order_box(current, seller.expiration_time)),
+        fill._replace(seller_box=decode_order_box(closed, seller.expiration_time)),
+    ])
+    assert results[0].amounts is not None and results[0] == results[1] == results[2]
+    assert results[3].error == "sell remaining"
@@ -0,0 +1,147 @@
+"""Tests the withdraw mirror against the contract checks, and the withdraw limits against the mirror"""
+
+import random
+
+import pytest
+
+from contracts_unified.library.constants import RATE_ONE
+from contracts_unified.offchain.avm import AvmError
+from contracts_unified.offchain.state import Instrument, Position
+from contracts_unified.offchain.withdraw import (
+    WithdrawCalculator,
+    max_withdrawals,
+    simulate_withdraw,
+)
+
+# Haircuts of 10% and 5%, margins of 15% and 7.5%, a pool with 1000 borrowed out of 10000, updated at time 0
+INSTRUMENT = Instrument(0, 100, 150, 50, 75, 0, RATE_ONE, RATE_ONE, 800, 0, 0, 0, 1000, 10000)
+# A price of 1, in pricecaster units
+PRICE = 10**9
+
+
+def _withdraw(positions, amount, max_borrow, locked_cash=0, withdraw_fee=0):
+    """Withdraws from the first of two instruments at the time of the last pool update"""
+    return simulate_withdraw(positions, [INSTRUMENT] * 2, [PRICE] * 2, 0, amount, max_borrow, 0, locked_cash, withdraw_fee)
+
+
+def test_cash_withdraw():
+    """The cash above the locked cash is withdrawn without touching the pool"""
+
+    outcome = _withdraw([Position(1000, 0, 0)], 400, 0, locked_cash=500, withdraw_fee=10)
+    assert outcome.positions[0] == Position(600, 0, 0)
+    assert outcome.instruments[0] == INSTRUMENT
+    assert outcome.health == 600 * 900 // 1000
+
+    # The locked cash can only be withdrawn by borrowing
+    with pytest.raises(AvmError):
+        _withdraw([Position(1000, 0, 0)], 501, 0, locked_cash=500)
+
+
+def test_borrow_withdraw():
+    """What exceeds the balance is borrowed from the pool with a pool move, up to max_borrow"""
+
+    positions = [Position(100, 0, 0), Position(1000, 0, 0)]
+    outcome = _withdraw(positions, 150, 50)
+    assert outcome.positions[0] == Position(0, -50, RATE_ONE)
+    assert outcome.instruments[0] == INSTRUMENT._replace(borrowed=1050)
+    # The accrued borrow rounds up by one unit
+    assert outcome.health == 1000 * 900 // 1000 - 51 * 1150 // 1000
+
+    with pytest.raises(AvmError, match="max borrow"):
+        _withdraw(positions, 150, 49)
+
+    # A lend position is redeemed before borrowing
+    outcome = _withdraw([Position(100, 200, RATE_ONE)], 250, 150)
+    assert outcome.positions[0] == Position(0, 50, RATE_ONE)
+    assert outcome.instruments[0] == INSTRUMENT._replace(liquidity=9850)
+
+
+def test_withdraw_failures():
+    """The fee is taken out of the amount and the account must stay healthy"""
+
+    # pay_withdraw subtracts the fee from the amount, which panics if the fee is larger
+    _withdraw([Position(1000, 0, 0)], 10, 0, withdraw_fee=10)
+    with pytest.raises(AvmError):
+        _withdraw([Position(1000, 0, 0)], 10, 0, withdraw_fee=11)
+
+    # Borrowing without collateral fails the health check
+    with pytest.raises(AvmError, match="user unhealthy"):
+        _withdraw([Position(0, 0, 0)], 10, 10)
+
+    # The pool can not lend more than its free liquidity
+    with pytest.raises(AvmError):
+        _withdraw([Position(0, 0, 0), Position(10**9, 0, 0)], 9001, 9001)
+
+
+def _account(rng, count):
+    """Random instruments, prices, and an account holding a few of them"""
+
+    instruments = [
+        Instrument(
+            0, rng.randint(0, 300), rng.randint(0, 300), 50, 75, 0, RATE_ONE + rng.randint(0, 10**10), RATE_ONE + rng.randint(0, 10**9),
+            rng.randint(0, 1000), 10**9, 2 * 10**9, 10**10, rng.randint(0, 10**11), rng.randint(10**11, 10**12),
+        )
+        for _ in range(count)
+    ]
+    prices = [rng.randint(10**8, 10**10) for _ in range(count)]
+    positions = [Position()] * count
+    for instrument_id in rng.sample(range(count), 4):
+        positions[instrument_id] = Position(rng.randint(0, 10**10), rng.randint(-(10**9), 10**9), RATE_ONE)
+    return instruments, prices, positions
+
+
+def test_limits_are_the_largest_withdrawals():
+    """The limits pass the mirror and the amounts just above them do not"""
+
+    rng = random.Random(3)
+
+    def passes(instrument_id, amount, max_borrow):
+        try:
+            simulate_withdraw(positions, instruments, prices, instrument_id, amount, max_borrow, 1000, locked[instrument_id], fees[instrument_id])
+        except AvmError:
+            return False
+        return True
+
+    borrowed = 0
+    for _ in range(40):
+        instruments, prices, positions = _account(rng, 8)
+        locked = [rng.choice([0, rng.randint(0, 10**9)]) for _ in range(8)]
+        fees = [rng.choice([0, rng.randint(0, 10**6)]) for _ in range(8)]
+
+        for instrument_id, limits in enumerate(max_withdrawals(positions, instruments, prices, 1000, locked, fees)):
+            balance = positions[instrument_id].cash - locked[instrument_id]
+            if limits.amount:
+                assert passes(instrument_id, limits.amount, 0)
+            for amount in range(limits.amount + 1, min(limits.amount + 8, balance) + 1):
+                assert not passes(instrument_id, amount, 0)
+
+            if limits.amount_with_borrow > limits.amount:
+                borrowed += 1
+                assert passes(instrument_id, limits.amount_with_borrow, limits.max_borrow)
+                assert not passes(instrument_id, limits.amount_with_borrow, limits.max_borrow - 1)
+            for amount in range(limits.amount_with_borrow + 1, limits.amount_with_borrow + 8):
+                assert not passes(instrument_id, amount, 2**63)
+
+    assert borrowed > 20
+
+
+def test_calculator_matches_max_withdrawals():
+    """Cached limits are invalidated by the price, instrument and timestamp updates they depend on"""
+
+    rng = random.Random(4)
+    instruments, prices, positions = _account(rng, 8)
+    calculator = WithdrawCalculator(instruments, prices, 1000)
+    calculator.update_account("account", positions)
+
+    for step in range(6):
+        assert calculator.all_limits("account") == max_withdrawals(positions, instruments, prices, calculator.timestamp)
+
+        instrument_id = rng.randrange(8)
+        if step % 3 == 0:
+            prices[instrument_id] = rng.randint(10**8, 10**10)
+            calculator.update_prices({instrument_id: prices[instrument_id]})
+        elif step % 3 == 1:
+            instruments[instrument_id] = instruments[instrument_id]._replace(borrowed=rng.randint(0, 10**11))
+            calculator.update_instrument(instrument_id, instruments[instrument_id])
+        else:
+            calculator.update_timestamp(calculator.timestamp + 3600)
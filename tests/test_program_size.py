@@ -0,0 +1,41 @@
+"""Tests the assembled size of the core contract programs"""
+
+import pytest
+
+from contracts_unified.core.main import CORE_TEAL_APPROVAL, CORE_TEAL_CLEAR
+from contracts_unified.library.program_size import MAX_PROGRAM_SIZE, program_size
+
+
+def test_program_size_counts_immediates():
+    """Sizes of a small program with every kind of immediate"""
+
+    teal = "\n".join([
+        "#pragma version 9",
+        "intcblock 0 1 300",
+        "bytecblock 0x0102 \"ab\"",
+        "main_l1:",
+        "pushint 1 // comment",
+        "pushbytes 0x00ff",
+        "txna Accounts 1",
+        "gtxna 0 ApplicationArgs 2",
+        "bz main_l1",
+        "switch main_l1 main_l1",
+        "+",
+    ])
+
+    # version, intcblock, bytecblock, pushint, pushbytes, txna, gtxna, bz, switch, +
+    assert program_size(teal) == 1 + 6 + 8 + 2 + 4 + 3 + 4 + 3 + 6 + 1
+
+
+def test_program_size_rejects_pseudo_opcodes():
+    """Constants must be assembled for the size to be known"""
+
+    with pytest.raises(ValueError):
+        program_size("#pragma version 9\nint 1")
+
+
+@pytest.mark.parametrize("teal", [CORE_TEAL_APPROVAL, CORE_TEAL_CLEAR])
+def test_core_programs_fit(teal):
+    """The core programs must fit in an application with all the extra pages"""
+
+    assert program_size(teal) <= MAX_PROGRAM_SIZE